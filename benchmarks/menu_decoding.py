@@ -0,0 +1,118 @@
+"""
+Сравнение разбора меню RKeeper: json + полная валидация pydantic против orjson + src.clients.decoders.
+
+    python -m benchmarks.menu_decoding --products 5000 --repeat 5
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable
+
+import orjson
+
+from src.clients.decoders import decode, loads
+from src.schemas.rkeeper import RKeeperMenu
+
+
+def make_menu_payload(products: int, seed: int = 0) -> dict[str, Any]:
+    rnd = random.Random(seed)
+    categories_count = max(products // 50, 1)
+    groups_count = max(products // 20, 1)
+    modifiers_count = groups_count * 5
+    schemes_count = max(products // 10, 1)
+
+    return {
+        "categories": [{"id": f"category-{i}", "name": f"Категория {i}"} for i in range(categories_count)],
+        "products": [
+            {
+                "id": f"product-{i}",
+                "name": f"Блюдо {i}",
+                "description": "Описание блюда " * 5,
+                "externalId": f"external-{i}",
+                "price": rnd.randint(100, 2000),
+                "schemeId": f"scheme-{rnd.randrange(schemes_count)}",
+                "categoryId": f"category-{rnd.randrange(categories_count)}",
+                "proteins": rnd.randint(0, 50),
+                "fats": rnd.randint(0, 50),
+                "carbohydrates": rnd.randint(0, 50),
+                "calories": rnd.randint(100, 900),
+                "imageUrls": [f"https://cdn.example.com/{i}.jpg"],
+                "modifierGroups": None,
+                "isContainInStopList": [f"shop-{rnd.randrange(10)}"] if rnd.random() < 0.1 else [],
+                "quantity": None,
+            }
+            # дубли pos_id встречаются в реальных меню и схлопываются валидатором get_unique
+            for i in list(range(products)) + list(range(products // 100))
+        ],
+        "ingredients": [
+            {
+                "id": f"modifier-{i}",
+                "externalId": f"modifier-external-{i}",
+                "name": f"Добавка {i}",
+                "price": rnd.randint(0, 300),
+                "imageUrls": [],
+                "maxCountForDish": rnd.randint(1, 5),
+            }
+            for i in range(modifiers_count)
+        ],
+        "ingredientsGroups": [
+            {
+                "id": f"group-{i}",
+                "name": f"Группа {i}",
+                "ingredients": [f"modifier-{i * 5 + j}" for j in range(5)],
+                "maxAmount": 5,
+                "minAmount": 0,
+            }
+            for i in range(groups_count)
+        ],
+        "ingredientsSchemes": [
+            {
+                "id": f"scheme-{i}",
+                "ingredientsGroups": [
+                    {"id": f"group-{rnd.randrange(groups_count)}", "minCount": 0, "maxCount": 3} for _ in range(3)
+                ],
+            }
+            for i in range(schemes_count)
+        ],
+        "isPossibleDelete": False,
+        "haveChanges": True,
+    }
+
+
+def parse_strict(content: bytes) -> RKeeperMenu:
+    return RKeeperMenu(**json.loads(content)["result"])
+
+
+def parse_fast(content: bytes) -> RKeeperMenu:
+    return decode(RKeeperMenu, loads(content)["result"])
+
+
+def measure(parse: Callable[[bytes], RKeeperMenu], content: bytes, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        parse(content)
+        timings.append(time.perf_counter() - started_at)
+
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    content = orjson.dumps({"result": make_menu_payload(args.products)})
+    assert parse_strict(content) == parse_fast(content)
+
+    strict = measure(parse_strict, content, args.repeat)
+    fast = measure(parse_fast, content, args.repeat)
+    print(f"payload: {len(content) / 1024:.0f} KiB, products: {args.products}")
+    print(f"json + pydantic:    {strict * 1000:.1f} ms")
+    print(f"orjson + decoders:  {fast * 1000:.1f} ms ({strict / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
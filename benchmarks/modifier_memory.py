@@ -0,0 +1,38 @@
+"""
+Память, которую занимают внутренние записи модификаторов и групп после разбора меню.
+
+    python -m benchmarks.modifier_memory --products 5000
+"""
+import argparse
+import gc
+import tracemalloc
+
+from benchmarks.menu_decoding import make_menu_payload
+from src.clients.decoders import decode
+from src.schemas.rkeeper import RKeeperMenu
+from src.tasks.planner import parse_modifiers_and_modifier_groups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    args = parser.parse_args()
+
+    menu = decode(RKeeperMenu, make_menu_payload(args.products))
+
+    gc.collect()
+    tracemalloc.start()
+    modifiers, modifier_groups = parse_modifiers_and_modifier_groups(
+        menu, is_use_global_modifier_complex=False, get_modifier_max_amount=True
+    )
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    items = len(modifiers) + len(modifier_groups)
+    print(f"modifiers: {len(modifiers)}, modifier groups: {len(modifier_groups)}")
+    print(f"retained: {size / 1024:.0f} KiB, peak: {peak / 1024:.0f} KiB, {size / items:.0f} bytes per item")
+
+
+if __name__ == "__main__":
+    main()
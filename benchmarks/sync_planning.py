@@ -0,0 +1,49 @@
+"""
+Время планирования синхронизации меню (src.tasks.planner) без БД и gateway.
+
+    python -m benchmarks.sync_planning --products 5000 --repeat 5
+"""
+import argparse
+import time
+
+from benchmarks.menu_decoding import make_menu_payload
+from src.clients.decoders import decode
+from src.schemas.rkeeper import RKeeperMenu
+from src.tasks.planner import MenuSnapshot, plan
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    menu = decode(RKeeperMenu, make_menu_payload(args.products))
+    # половина меню уже выгружена в gateway
+    snapshot = MenuSnapshot(
+        category_pos_ids=frozenset(category.pos_id for category in menu.categories[::2]),
+        modifier_specific_external_ids=frozenset(),
+        modifier_offer_pos_ids=frozenset(modifier.pos_id for modifier in menu.modifiers[::2]),
+        modifier_group_hashed_ids=frozenset(),
+        meal_pos_ids=tuple(meal.pos_id for meal in menu.meals[::2]),
+        meal_offer_pos_ids=frozenset(meal.pos_id for meal in menu.meals[::2]),
+        # из выгруженных предложений половина не изменилась
+        meal_offer_states={
+            meal.pos_id: (meal.price, meal.get_offer_quantity("shop"), meal.is_in_stop_list("shop"))
+            for meal in menu.meals[::4]
+        },
+    )
+
+    timings = []
+    for _ in range(args.repeat):
+        started_at = time.perf_counter()
+        sync_plan = plan(menu, snapshot, "shop", get_modifier_max_amount=True)
+        timings.append(time.perf_counter() - started_at)
+
+    print(f"products: {args.products}, fingerprint: {sync_plan.fingerprint[:12]}")
+    print(f"meal offer updates: {len(sync_plan.meal_offers.updates)}")
+    print(f"plan: {min(timings) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
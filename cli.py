@@ -1,14 +1,25 @@
+import secrets
+import shutil
+
 import click
+import httpx
 from redis import Redis
 
 from src.config import settings
 from src.core.repositories.client import ClientRepository
+from src.core.repositories.snapshot import SnapshotRepository
 from src.db import SessionLocal
 from src.repositories import DiscountRepository
 from src.models import Client, Project, Order, Discount, Category, Modifier, ModifierGroup, Meal, Shop, MealOffer
+from src.schemas.rkeeper import RkeeperOrderStatusEnum, RkeeperPaymentStatusEnum, RkeeperPaymentTypeEnum
+from src.services.order_retention import OrderRetention
+from src.services.rkeeper_snapshots import open_snapshot
 from src.services.redis_client import Storage
 from src.clients.pos_client import PosGatewayClient
+from src.clients.rkeeper_replay import SnapshotRkeeperClient
+from src.tasks.sync import Sync
 from src.tasks.tasks import sync_menu, transfer_client_menu_to_project
+from src.utils.enums import SnapshotKind
 
 
 def abort_if_false(ctx, param, value):
@@ -179,6 +190,105 @@ def sync_client_menu(client_id: str) -> None:
     sync_menu.s(client_id)
 
 
+@cli.command()
+@click.option("--client-id", required=True)
+@click.option("--shop-id", "shop_pos_ids", multiple=True, help="pos_id магазина, по умолчанию все магазины клиента")
+@click.option("--shops", "with_shops", is_flag=True, default=False, help="Синхронизировать и список магазинов")
+def dry_run_sync(client_id: str, shop_pos_ids: tuple[str, ...], with_shops: bool) -> None:
+    """
+    Show what menu sync would create and update in the gateway, without writing anything
+    """
+    with SessionLocal() as session:
+        client = ClientRepository(session).get_client_by_client_id(client_id)
+        if not client:
+            click.echo(f"Client {client_id} not found")
+            return
+
+        sync = Sync(session, client, dry_run=True)
+        try:
+            if with_shops:
+                click.echo("shops")
+                click.echo(sync.shops().format())
+
+            for pos_shop_id in shop_pos_ids or [shop.pos_id for shop in client.shops]:
+                click.echo(f"\nmenu of shop {pos_shop_id}")
+                click.echo(sync.menu(pos_shop_id).format())
+        finally:
+            session.rollback()
+
+
+@cli.command()
+@click.option("--client-id", required=True)
+@click.option("--shop-id", "shop_pos_id")
+@click.option("--kind", type=click.Choice([kind.value for kind in SnapshotKind]))
+@click.option("--limit", type=int, default=20)
+def list_snapshots(client_id: str, shop_pos_id: str | None, kind: str | None, limit: int) -> None:
+    """
+    List stored RKeeper responses of a client, newest first
+    """
+    with SessionLocal() as session:
+        client = ClientRepository(session).get_client_by_client_id(client_id)
+        if not client:
+            click.echo(f"Client {client_id} not found")
+            return
+
+        for snapshot in SnapshotRepository(session).get_list(
+            client.id, SnapshotKind(kind) if kind else None, shop_pos_id, limit
+        ):
+            click.echo(
+                f"{snapshot.id:>8}  {snapshot.created_at:%Y-%m-%d %H:%M:%S}  {snapshot.kind:<14}"
+                f"  {snapshot.shop_pos_id or '-':<38}  {snapshot.size:>10} bytes  {len(snapshot.content):>9} zstd"
+                f"  {snapshot.fingerprint[:12]}"
+            )
+
+
+@cli.command()
+@click.argument("snapshot-id", type=int)
+@click.option("--output", type=click.File("wb"), default="-", help="Файл для ответа RKeeper, по умолчанию stdout")
+def export_snapshot(snapshot_id: int, output) -> None:
+    """
+    Write a stored RKeeper response as is, e.g. for offline benchmarks
+    """
+    with SessionLocal() as session:
+        snapshot = SnapshotRepository(session).get(snapshot_id)
+        if not snapshot:
+            click.echo(f"Snapshot {snapshot_id} not found", err=True)
+            return
+
+        with open_snapshot(snapshot) as file:
+            shutil.copyfileobj(file, output)
+
+
+@cli.command()
+@click.argument("snapshot-id", type=int)
+def replay_snapshot(snapshot_id: int) -> None:
+    """
+    Replay a stored RKeeper menu through the menu sync against a stub gateway, without writing anything.
+    The limited list is the latest one stored before the menu, the adapter state is the current one
+    """
+    with SessionLocal() as session:
+        snapshot_repo = SnapshotRepository(session)
+        snapshot = snapshot_repo.get(snapshot_id)
+        if not snapshot or snapshot.kind != SnapshotKind.MENU:
+            click.echo(f"Menu snapshot {snapshot_id} not found")
+            return
+
+        client = session.get(Client, snapshot.client_id)
+        limited_list = snapshot_repo.get_latest(
+            client.id, SnapshotKind.LIMITED_LIST, created_before=snapshot.created_at
+        )
+        click.echo(
+            f"menu {snapshot.id} of shop {snapshot.shop_pos_id} at {snapshot.created_at:%Y-%m-%d %H:%M:%S}, "
+            f"limited list {limited_list.id if limited_list else '-'}"
+        )
+        rkeeper = SnapshotRkeeperClient(client, {snapshot.shop_pos_id: snapshot}, limited_list)
+        sync = Sync(session, client, dry_run=True, rkeeper=rkeeper)
+        try:
+            click.echo(sync.menu(snapshot.shop_pos_id).format())
+        finally:
+            session.rollback()
+
+
 @cli.command()
 def show_currency_codes():
     clients = Storage().get_active_clients()
@@ -417,6 +527,61 @@ def migrate_from_redis_to_postgres() -> None:
         print("Finish migrate")
 
 
+@cli.command()
+@click.option("--client-id")
+@click.option("--rotate", is_flag=True, default=False)
+def webhook_secret(client_id: str, rotate: bool) -> None:
+    """
+    Show (or rotate) the key RKeeper uses for the order status webhook
+    """
+    with SessionLocal() as session:
+        client = ClientRepository(session).get_client_by_client_id(client_id)
+        if rotate:
+            client.webhook_secret = secrets.token_urlsafe(32)
+            session.commit()
+        click.echo(client.webhook_secret)
+
+
+@cli.command()
+@click.option("--webhook-secret")
+@click.option("--order-id")
+@click.option("--status", type=click.IntRange(1, 13), default=RkeeperOrderStatusEnum.KITCHEN.value)
+@click.option("--payment-type", default=RkeeperPaymentTypeEnum.ONLINE.value)
+@click.option("--payment-status", default=RkeeperPaymentStatusEnum.NOT_PAID.value)
+@click.option("--url", default=f"http://localhost:{settings.SERVER_PORT}/api/order/status")
+def emit_order_status(
+    webhook_secret: str, order_id: str, status: int, payment_type: str, payment_status: str, url: str
+) -> None:
+    """
+    Send an order status event like RKeeper does (for local testing)
+    """
+    response = httpx.post(
+        url,
+        json={
+            "orderId": order_id,
+            "orderStatusId": status,
+            "paymentTypeId": payment_type,
+            "paymentStatus": payment_status,
+            "fullAmount": 0,
+            "amount": 0,
+        },
+        headers={"Authorization": webhook_secret},
+    )
+    click.echo(f"{response.status_code} {response.text}")
+
+
+@cli.command()
+@click.option("--batch-size", type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE)
+def archive_orders(batch_size: int) -> None:
+    """
+    Expire stale not done orders and move old done orders to order_archive
+    """
+    with SessionLocal() as session:
+        retention = OrderRetention(session)
+        click.echo(f"Expired: {retention.expire(batch_size=batch_size)}")
+        click.echo(f"Archived: {retention.archive(batch_size=batch_size)}")
+
+
 @cli.command(name="transfer")
 def transfer_menu_to_project() -> None:
     print("Start transfer")
@@ -2,19 +2,26 @@ from fastapi import (
     APIRouter,
     Depends,
 )
+from fastapi.responses import Response
 from opentelemetry import trace
 from opentelemetry.propagators.jaeger import JaegerPropagator  # type: ignore
 from opentelemetry.trace import SpanKind
+from starlette import status
 
 from src import deps
 from src.api.schemas import OrderWithCtx, OrderCreatedApi
+from src.config import settings
 from sqlalchemy.orm import Session
 
 from src.core.repositories.order import OrderRepository
 from src.logger import get_logger
 from src.models import Client
+from src.schemas.rkeeper import RKeeperOrderStatus
 from src.services.order import OrderService
 from src.services.redis_client import Storage
+from src.tasks.sync import Sync
+from src.utils.deadline import Deadline
+from src.utils.serialization import Payload
 
 order_router = APIRouter(tags=["order"])
 logger = get_logger("api")
@@ -36,12 +43,14 @@ def create_order(
         client_id=client.client_id,
     )
     log.info("Received order from gateway")
+    # срок отсчитывается от получения заказа: gateway ждет ответа не дольше ORDER_DEADLINE
+    deadline = Deadline.after(settings.ORDER_DEADLINE)
     ctx = JaegerPropagator().extract(starter_order.ctx)
 
     with tracer.start_as_current_span("order receive", kind=SpanKind.SERVER, context=ctx) as span:
         span.set_attribute("order.id", starter_order.starter_id)
         span.set_attribute("order.global_id", starter_order.global_id)
-        span.set_attribute("order.data", starter_order.json(by_alias=True))
+        span.set_attribute("order.data", Payload(starter_order).text)
         cached = storage.get_order_cached(starter_order.global_id)
         span.set_attribute("cached", cached)
         log.info("Cached order", cached=cached)
@@ -56,6 +65,21 @@ def create_order(
             log.info("Return Order", order_to_return=order_to_return.json(by_alias=True))
             return order_to_return
 
-        rkeeper_order_id = OrderService(db, client, log).create_order(starter_order)
+        rkeeper_order_id = OrderService(db, client, log).create_order(starter_order, deadline)
         db.commit()
         return OrderCreatedApi(order_id=rkeeper_order_id)
+
+
+@order_router.post("/order/status", status_code=status.HTTP_204_NO_CONTENT)
+def update_order_status(
+    order_status: RKeeperOrderStatus,
+    client: Client = Depends(deps.get_client_by_webhook_secret),
+    db: Session = Depends(deps.get_db),
+) -> Response:
+    log = logger.bind(order_pos_id=order_status.order_id, client_id=client.client_id)
+    log.info("Received order status from rkeeper", status=order_status.order_status_id)
+
+    Sync(db, client, log).order_status(order_status)
+    db.commit()
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
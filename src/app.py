@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from src.api import router
 from src.config import settings
@@ -19,6 +20,7 @@ def create_app() -> FastAPI:
         version=settings.VERSION,
         root_path=path_prefix,
         openapi_prefix=path_prefix,
+        default_response_class=ORJSONResponse,
     )
     app.include_router(router)
     app.add_exception_handler(NotFoundError, not_found_handler)
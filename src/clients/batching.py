@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Collection, Sequence, TypeVar
+
+from src.config import settings
+from src.logger import get_logger
+from src.utils.serialization import Payload, dumps
+
+logger = get_logger("batching")
+
+ResultT = TypeVar("ResultT")
+
+
+class BatchTooLargeError(Exception):
+    """Gateway не принял батч из-за размера или не успел его обработать: батч нужно разделить"""
+
+
+class BatchUnavailableError(Exception):
+    """Gateway временно недоступен: батч повторяется с паузой, после последней попытки ошибка пробрасывается"""
+
+
+class BatchRejectedError(Exception):
+    """Gateway отклонил содержимое батча: батч делится пополам, пока не останутся отдельные плохие объекты"""
+
+    # ошибку сервера сначала повторяем, делим батч, только если она не проходит
+    retryable = False
+
+
+# объект, который gateway не принял, и ошибка
+OnReject = Callable[[Any, str, Exception], None]
+
+
+def item_digest(encoded: bytes) -> str:
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+class AdaptiveBatcher:
+    """
+    Делит запись в gateway на батчи по количеству объектов и по размеру тела запроса.
+
+    Размер батча подстраивается под gateway: растет, пока запросы укладываются в целевое время, и уменьшается вдвое,
+    если запрос был медленным или gateway не принял батч (BatchTooLargeError). Такой батч сразу делится пополам и
+    отправляется заново. Независимые батчи отправляются параллельно.
+
+    Временные ошибки повторяются с экспоненциальной паузой. Батч, который gateway отклоняет (BatchRejectedError),
+    делится пополам, пока плохие объекты не останутся по одному: они передаются в on_reject, остальные объекты
+    выгружаются как обычно.
+    """
+
+    def __init__(
+        self,
+        batch_size: int | None = None,
+        min_items: int | None = None,
+        max_items: int | None = None,
+        max_bytes: int | None = None,
+        target_latency: float | None = None,
+        concurrency: int | None = None,
+        retry_attempts: int | None = None,
+        retry_delay: float | None = None,
+    ) -> None:
+        self.batch_size = batch_size or settings.POS_GATEWAY_BATCH_SIZE
+        self.min_items = min_items or settings.POS_GATEWAY_BATCH_MIN_ITEMS
+        self.max_items = max_items or settings.POS_GATEWAY_BATCH_MAX_ITEMS
+        self.max_bytes = max_bytes or settings.POS_GATEWAY_BATCH_MAX_BYTES
+        self.target_latency = target_latency or settings.POS_GATEWAY_BATCH_TARGET_LATENCY
+        self.concurrency = concurrency or settings.POS_GATEWAY_CONCURRENCY
+        self.retry_attempts = retry_attempts or settings.POS_GATEWAY_RETRY_ATTEMPTS
+        self.retry_delay = settings.POS_GATEWAY_RETRY_DELAY if retry_delay is None else retry_delay
+        self._lock = threading.Lock()
+
+    def send(
+        self,
+        items: Sequence[Any],
+        send: Callable[[Payload], ResultT],
+        on_reject: OnReject | None = None,
+        skip: Collection[str] = (),
+    ) -> list[ResultT]:
+        """
+        Результаты в порядке батчей. Объекты сериализуются один раз, тело батча собирается из готовых байтов.
+
+        skip - item_digest объектов, которые не нужно отправлять. Без on_reject отклоненный объект пробрасывает ошибку.
+        """
+        encoded = [dumps(item) for item in items]
+        if skip:
+            kept = [index for index, item in enumerate(encoded) if item_digest(item) not in skip]
+            if len(kept) < len(items):
+                logger.info("Skip items rejected by gateway earlier", items=len(items) - len(kept))
+                items = [items[index] for index in kept]
+                encoded = [encoded[index] for index in kept]
+
+        if not items:
+            return []
+
+        if len(items) <= self.batch_size and _payload_size(encoded) <= self.max_bytes:
+            return self._send(items, encoded, send, on_reject)
+
+        results: dict[int, list[ResultT]] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending: dict[Future, int] = {}
+            start = batch_index = 0
+            while start < len(items) or pending:
+                # следующий батч режется по текущему размеру, который уже учел ответы на предыдущие
+                while start < len(items) and len(pending) < self.concurrency:
+                    end = self._next_batch_end(encoded, start)
+                    future = executor.submit(self._send, items[start:end], encoded[start:end], send, on_reject)
+                    pending[future] = batch_index
+                    batch_index += 1
+                    start = end
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+
+        return [result for index in sorted(results) for result in results[index]]
+
+    def _next_batch_end(self, encoded: list[bytes], start: int) -> int:
+        limit = min(len(encoded), start + self.batch_size)
+        size = 2
+        end = start
+        while end < limit:
+            # запятая между объектами; объект больше max_bytes уходит отдельным батчем
+            item_size = len(encoded[end]) + 1
+            if end > start and size + item_size > self.max_bytes:
+                break
+            size += item_size
+            end += 1
+        return end
+
+    def _send(
+        self,
+        items: Sequence[Any],
+        encoded: list[bytes],
+        send: Callable[[Payload], ResultT],
+        on_reject: OnReject | None,
+    ) -> list[ResultT]:
+        payload = Payload.from_encoded(list(items), b"[" + b",".join(encoded) + b"]")
+        attempt = 0
+        while True:
+            started_at = time.perf_counter()
+            try:
+                result = send(payload)
+                break
+            except BatchTooLargeError as e:
+                self._shrink(len(items))
+                return self._split(items, encoded, send, on_reject, e)
+            except (BatchUnavailableError, BatchRejectedError) as e:
+                attempt += 1
+                retryable = isinstance(e, BatchUnavailableError) or e.retryable
+                if retryable and attempt < self.retry_attempts:
+                    logger.warn("Gateway batch failed, retrying", items=len(items), attempt=attempt, error=repr(e))
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                    continue
+                if isinstance(e, BatchUnavailableError):
+                    raise
+                return self._split(items, encoded, send, on_reject, e)
+
+        latency = time.perf_counter() - started_at
+        if latency > self.target_latency:
+            self._shrink(len(items))
+        elif len(items) >= self.batch_size:
+            self._grow()
+        return [result]
+
+    def _split(
+        self,
+        items: Sequence[Any],
+        encoded: list[bytes],
+        send: Callable[[Payload], ResultT],
+        on_reject: OnReject | None,
+        error: Exception,
+    ) -> list[ResultT]:
+        if len(items) == 1:
+            if on_reject is None:
+                raise error
+            on_reject(items[0], item_digest(encoded[0]), error)
+            return []
+
+        logger.warn("Gateway batch rejected, splitting", items=len(items), error=repr(error))
+        middle = len(items) // 2
+        return self._send(items[:middle], encoded[:middle], send, on_reject) + self._send(
+            items[middle:], encoded[middle:], send, on_reject
+        )
+
+    def _shrink(self, sent_items: int) -> None:
+        with self._lock:
+            self.batch_size = max(self.min_items, min(self.batch_size, sent_items) // 2)
+
+    def _grow(self) -> None:
+        with self._lock:
+            self.batch_size = min(self.max_items, self.batch_size + max(1, self.batch_size // 4))
+
+
+def _payload_size(encoded: list[bytes]) -> int:
+    return sum(len(item) for item in encoded) + len(encoded) + 1
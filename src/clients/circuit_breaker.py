@@ -0,0 +1,171 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from urllib.parse import urlsplit
+
+import httpx
+from opentelemetry import metrics, trace
+from redis.exceptions import RedisError
+
+from src.config import settings
+from src.logger import get_logger
+from src.services.redis_client import Storage
+
+logger = get_logger("circuit_breaker")
+meter = metrics.get_meter("rkeeper")
+
+rejected_requests = meter.create_counter(
+    "circuit_breaker.rejected_requests", description="Запросы, не отправленные из-за открытого circuit breaker"
+)
+state_changes = meter.create_counter(
+    "circuit_breaker.state_changes", description="Переходы circuit breaker между состояниями open/half_open/closed"
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_storage = Storage()
+
+
+class CircuitOpenError(Exception):
+    """Upstream недоступен по данным circuit breaker, запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для внешнего сервиса, общий для всех воркеров: состояние хранится в redis.
+
+    Ошибки соединения, таймауты и ответы 5xx считаются отдельно для хоста и для пары хост + учетные данные клиента.
+    После CIRCUIT_BREAKER_*FAILURE_THRESHOLD ошибок подряд breaker открывается на CIRCUIT_BREAKER_OPEN_SECONDS,
+    запросы в это время сразу падают с CircuitOpenError. Потом пропускается один пробный запрос (half-open): успех закрывает breaker, ошибка открывает
+    его заново. Если redis недоступен, запросы отправляются как без breaker.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        tenant: str,
+        error: type[CircuitOpenError] = CircuitOpenError,
+        storage: Storage | None = None,
+    ) -> None:
+        self.host = urlsplit(url).netloc
+        self.error = error
+        self.storage = storage or _storage
+        # ключ хоста открывается, когда ошибаются запросы всех клиентов, ключ клиента - только его запросы
+        self._scopes = {f"breaker:{self.host}": "host", f"breaker:{self.host}:{tenant}": "tenant"}
+        self._thresholds = {
+            f"breaker:{self.host}": settings.CIRCUIT_BREAKER_HOST_FAILURE_THRESHOLD,
+            f"breaker:{self.host}:{tenant}": settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        }
+
+    def send(self, request: Callable[[], httpx.Response]) -> httpx.Response:
+        with self.guard() as call:
+            response = request()
+            call.record(response)
+        return response
+
+    @contextmanager
+    def guard(self) -> Iterator["_Call"]:
+        """Для запросов, которые нельзя передать в send, например потоковых"""
+        call = self.allow()
+        try:
+            yield call
+        except httpx.RequestError:
+            call.failed = True
+            raise
+        finally:
+            if call.failed:
+                self._record_failure()
+            elif call.responded and call.failing_keys:
+                self._record_success(call)
+
+    def allow(self) -> "_Call":
+        """Бросает CircuitOpenError, если запрос отправлять нельзя"""
+        call = _Call()
+        try:
+            pipeline = self.storage.redis.pipeline(transaction=False)
+            for key in self._thresholds:
+                pipeline.hgetall(key)
+            states = pipeline.execute()
+        except RedisError as e:
+            logger.warn("Circuit breaker state is unavailable", host=self.host, error=repr(e))
+            return call
+
+        now = time.time()
+        for key, state in zip(self._thresholds, states):
+            if not state:
+                continue
+            call.failing_keys.append(key)
+            opened_until = float(state.get(b"opened_until", 0))
+            if not opened_until:
+                continue
+            # после open_seconds пропускаем один пробный запрос, остальные ждут его результата
+            if now < opened_until or not self._acquire_probe(key):
+                rejected_requests.add(1, {"host": self.host, "scope": self._scopes[key]})
+                raise self.error(f"{self.host} is unavailable, circuit breaker is open")
+
+            call.probe_keys.append(key)
+            self._change_state(key, HALF_OPEN)
+
+        return call
+
+    def _acquire_probe(self, key: str) -> bool:
+        try:
+            return bool(self.storage.redis.set(f"{key}:probe", 1, nx=True, ex=settings.DEFAULT_TIMEOUT))
+        except RedisError:
+            return True
+
+    def _record_failure(self) -> None:
+        try:
+            pipeline = self.storage.redis.pipeline(transaction=False)
+            for key in self._thresholds:
+                pipeline.hincrby(key, "failures", 1)
+                pipeline.hget(key, "opened_until")
+                pipeline.expire(key, settings.CIRCUIT_BREAKER_FAILURE_WINDOW)
+            results = pipeline.execute()
+
+            for index, (key, threshold) in enumerate(self._thresholds.items()):
+                failures, opened_until = results[index * 3], results[index * 3 + 1]
+                # ошибка пробного запроса в half-open открывает breaker сразу
+                if failures >= threshold or opened_until:
+                    self._open(key)
+        except RedisError as e:
+            logger.warn("Circuit breaker state is unavailable", host=self.host, error=repr(e))
+
+    def _record_success(self, call: "_Call") -> None:
+        try:
+            self.storage.redis.delete(*call.failing_keys, *(f"{key}:probe" for key in call.probe_keys))
+        except RedisError as e:
+            logger.warn("Circuit breaker state is unavailable", host=self.host, error=repr(e))
+            return
+
+        for key in call.probe_keys:
+            self._change_state(key, CLOSED)
+
+    def _open(self, key: str) -> None:
+        pipeline = self.storage.redis.pipeline(transaction=False)
+        pipeline.hset(key, "opened_until", time.time() + settings.CIRCUIT_BREAKER_OPEN_SECONDS)
+        pipeline.expire(key, settings.CIRCUIT_BREAKER_OPEN_SECONDS + settings.CIRCUIT_BREAKER_FAILURE_WINDOW)
+        pipeline.delete(f"{key}:probe")
+        pipeline.execute()
+        self._change_state(key, OPEN)
+
+    def _change_state(self, key: str, state: str) -> None:
+        logger.warn("Circuit breaker state changed", breaker=key, state=state)
+        state_changes.add(1, {"host": self.host, "scope": self._scopes[key], "state": state})
+        trace.get_current_span().set_attribute("circuit_breaker.state", state)
+
+
+class _Call:
+    def __init__(self) -> None:
+        # ключи breaker, по которым были ошибки: успешный ответ их сбрасывает
+        self.failing_keys: list[str] = []
+        # ключи, для которых этот запрос пробный (half-open)
+        self.probe_keys: list[str] = []
+        self.responded = False
+        self.failed = False
+
+    def record(self, response: httpx.Response) -> None:
+        self.responded = True
+        self.failed = response.is_server_error
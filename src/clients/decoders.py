@@ -0,0 +1,218 @@
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Optional, Type, TypeVar
+
+import orjson
+from pydantic import BaseModel, Extra
+from pydantic.class_validators import make_generic_validator
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
+from pydantic.typing import get_origin, is_union
+from pydantic.utils import lenient_issubclass
+
+from src.config import settings
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+Converter = Callable[[Any], Any]
+
+_MISSING = object()
+
+
+class DecodeError(Exception):
+    pass
+
+
+def loads(content: bytes | str) -> Any:
+    return orjson.loads(content)
+
+
+def decode(model: Type[ModelT], data: dict) -> ModelT:
+    """
+    Собирает pydantic-модель из ответа RKeeper.
+
+    Быстрый путь не запускает полную валидацию pydantic: поля раскладываются по заранее построенному плану
+    (алиас -> поле -> приведение типа), а модель создается через construct. Если объект не укладывается в план
+    (нет обязательного поля, значение не приводится к типу), он разбирается обычной валидацией, поэтому ошибки
+    в данных по-прежнему приходят как ValidationError.
+    """
+    if settings.RKEEPER_STRICT_VALIDATION:
+        return model.parse_obj(data)
+
+    return _decode(model, data)
+
+
+def decode_list(model: Type[ModelT], items: Iterable[dict]) -> list[ModelT]:
+    if settings.RKEEPER_STRICT_VALIDATION:
+        return [model.parse_obj(item) for item in items]
+
+    return [_decode(model, item) for item in items]
+
+
+class _FieldPlan:
+    __slots__ = ("name", "alias", "required", "allow_none", "field", "convert")
+
+    def __init__(self, field: ModelField, convert: Optional[Converter]) -> None:
+        self.name = field.name
+        self.alias = field.alias
+        self.required = field.required
+        self.allow_none = field.allow_none
+        self.field = field
+        self.convert = convert
+
+
+class _ModelPlan:
+    __slots__ = ("fields", "validators", "trusted")
+
+    def __init__(self, fields: list[_FieldPlan], validators: list[tuple[_FieldPlan, Callable]], trusted: bool) -> None:
+        self.fields = fields
+        self.validators = validators
+        # модели с root/pre/each_item валидаторами быстрым путем не собираем
+        self.trusted = trusted
+
+
+def _decode(model: Type[ModelT], data: dict) -> ModelT:
+    plan = _get_plan(model)
+    if not plan.trusted or not isinstance(data, dict):
+        return model.parse_obj(data)
+
+    try:
+        return _construct(model, plan, data)
+    except (TypeError, ValueError, KeyError, DecodeError):
+        # ValidationError вложенной модели тоже ValueError: отдаем pydantic весь объект, чтобы ошибка была полной
+        return model.parse_obj(data)
+
+
+def _construct(model: Type[ModelT], plan: _ModelPlan, data: dict) -> ModelT:
+    values = {}
+    fields_set = set()
+    for field_plan in plan.fields:
+        value = data.get(field_plan.alias, _MISSING)
+        if value is _MISSING and field_plan.alias != field_plan.name:
+            value = data.get(field_plan.name, _MISSING)
+
+        if value is _MISSING:
+            if field_plan.required:
+                raise DecodeError(field_plan.name)
+            values[field_plan.name] = field_plan.field.get_default()
+            continue
+
+        fields_set.add(field_plan.name)
+        if value is None:
+            if not field_plan.allow_none:
+                raise DecodeError(field_plan.name)
+            values[field_plan.name] = None
+        elif field_plan.convert is None:
+            values[field_plan.name] = value
+        else:
+            values[field_plan.name] = field_plan.convert(value)
+
+    for field_plan, validator in plan.validators:
+        # как и pydantic, валидаторы не запускаются для None и незаполненных полей
+        value = values[field_plan.name]
+        if field_plan.name in fields_set and value is not None:
+            values[field_plan.name] = validator(model, value, values, field_plan.field, model.__config__)
+
+    # то же, что делает BaseModel.construct, без повторного обхода полей
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__fields_set__", fields_set)
+    instance._init_private_attributes()
+    return instance
+
+
+@lru_cache(maxsize=None)
+def _get_plan(model: Type[BaseModel]) -> _ModelPlan:
+    trusted = (
+        not model.__pre_root_validators__
+        and not model.__post_root_validators__
+        and model.__config__.extra != Extra.allow
+    )
+    fields = []
+    validators = []
+    for field in model.__fields__.values():
+        try:
+            field_plan = _FieldPlan(field, _get_converter(field))
+        except DecodeError:
+            # тип поля, который быстрый путь не умеет приводить (datetime и т.п.)
+            return _ModelPlan([], [], trusted=False)
+
+        fields.append(field_plan)
+        for class_validator in (field.class_validators or {}).values():
+            if class_validator.pre or class_validator.each_item or class_validator.always:
+                trusted = False
+            validators.append((field_plan, make_generic_validator(class_validator.func)))
+
+    return _ModelPlan(fields, validators, trusted)
+
+
+def _get_converter(field: ModelField) -> Optional[Converter]:
+    """None - значение из json берется как есть"""
+    item_converter = _get_item_converter(field)
+    if field.shape == SHAPE_SINGLETON or item_converter is None:
+        return item_converter
+    if field.shape == SHAPE_LIST:
+        return lambda value: [item_converter(item) for item in value]
+
+    raise DecodeError(field.name)
+
+
+def _get_item_converter(field: ModelField) -> Optional[Converter]:
+    type_ = field.type_
+    if type_ is Any or type_ in (list, dict):
+        return None
+    if is_union(get_origin(type_)) and field.sub_fields:
+        return _get_union_converter([_get_converter(sub_field) for sub_field in field.sub_fields])
+    if lenient_issubclass(type_, BaseModel):
+        return lambda value: _decode(type_, value)
+    if lenient_issubclass(type_, Enum):
+        return type_
+    if type_ in _SCALAR_CONVERTERS:
+        return _SCALAR_CONVERTERS[type_]
+
+    raise DecodeError(field.name)
+
+
+def _get_union_converter(converters: list[Optional[Converter]]) -> Converter:
+    # как pydantic без smart_union: первый тип, к которому приводится значение
+    def convert(value: Any) -> Any:
+        for converter in converters:
+            if converter is None:
+                return value
+            try:
+                return converter(value)
+            except (TypeError, ValueError, DecodeError):
+                continue
+        raise DecodeError(value)
+
+    return convert
+
+
+# приведения повторяют str/int/float/bool валидаторы pydantic для значений, которые встречаются в json
+
+
+def _to_str(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise DecodeError(value)
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, int) and value is not True and value is not False:
+        return value
+    return int(value)
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, float):
+        return value
+    return float(value)
+
+
+def _to_bool(value: Any) -> bool:
+    if value is True or value is False:
+        return value
+    raise DecodeError(value)
+
+
+_SCALAR_CONVERTERS: dict[Any, Converter] = {str: _to_str, int: _to_int, float: _to_float, bool: _to_bool}
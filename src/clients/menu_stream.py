@@ -0,0 +1,70 @@
+from typing import IO, Any, Type
+
+import ijson
+
+from src.clients.decoders import decode
+from src.schemas.base import Base
+from src.schemas.rkeeper import (
+    RKeeperCategory,
+    RKeeperMeal,
+    RKeeperMenu,
+    RKeeperModifierGroups,
+    RKeeperModifiers,
+    RKeeperModifiersSchemes,
+)
+
+MENU_SECTIONS: dict[str, Type[Base]] = {
+    "categories": RKeeperCategory,
+    "products": RKeeperMeal,
+    "ingredients": RKeeperModifiers,
+    "ingredientsGroups": RKeeperModifierGroups,
+    "ingredientsSchemes": RKeeperModifiersSchemes,
+}
+
+
+def read_menu(file: IO[bytes]) -> RKeeperMenu:
+    """
+    Собирает RKeeperMenu из ответа menu/view, не загружая документ целиком.
+
+    Каждая секция читается отдельным проходом по файлу, в памяти одновременно держится только один элемент
+    исходного json. Дубли по pos_id схлопываются сразу, как это делает RKeeperMenu.get_unique.
+    Верхний уровень ответа проверяется RKeeperMenu целиком, поэтому меню без секции падает с ValidationError,
+    как при обычном разборе, а не собирается без нее.
+    """
+    shape = RKeeperMenu(**_read_shape(file))
+    sections = {}
+    for alias, model in MENU_SECTIONS.items():
+        file.seek(0)
+        unique_items: dict[str, Any] = {}
+        for item in ijson.items(file, f"result.{alias}.item", use_float=True):
+            decoded_item = decode(model, item)
+            unique_items[decoded_item.pos_id] = decoded_item
+        sections[alias] = list(unique_items.values())
+
+    return RKeeperMenu.construct(
+        categories=sections["categories"],
+        meals=sections["products"],
+        modifiers=sections["ingredients"],
+        modifier_groups=sections["ingredientsGroups"],
+        modifier_schemas=sections["ingredientsSchemes"],
+        is_possible_delete=shape.is_possible_delete,
+        have_changes=shape.have_changes,
+    )
+
+
+def _read_shape(file: IO[bytes]) -> dict[str, Any]:
+    """Ключи result со скалярами как есть, вместо секций пустые списки"""
+    file.seek(0)
+    shape: dict[str, Any] = {}
+    for prefix, event, value in ijson.parse(file, use_float=True):
+        key = prefix.removeprefix("result.")
+        if key == prefix or "." in key:
+            continue
+        if event == "start_array":
+            shape[key] = []
+        elif event == "start_map":
+            shape[key] = {}
+        elif event not in ("end_array", "end_map", "map_key"):
+            shape[key] = value
+
+    return shape
@@ -1,17 +1,24 @@
-import json
-from typing import List
+import hashlib
+import itertools
+from dataclasses import dataclass
+from typing import Any, Callable
 from urllib.parse import urljoin
 
 import httpx
+import orjson
 from httpx import HTTPStatusError
 from opentelemetry import trace
 from starlette import status
 from starter_dto import pos
 from starter_dto.pos.menu import UpdateModifierOffer, CreateModifierOffer
 
+from src.clients.batching import AdaptiveBatcher, BatchRejectedError, BatchTooLargeError, BatchUnavailableError
+from src.clients.circuit_breaker import CircuitBreaker, CircuitOpenError
 from src.config import settings
 from src.logger import get_logger
 from src.schemas.order import OrderStatusUpdater
+from src.services.redis_client import Storage
+from src.utils.serialization import Payload, dumps
 
 from opentelemetry.trace import SpanKind
 
@@ -20,6 +27,9 @@ logger = get_logger("pos_client")
 
 tracer = trace.get_tracer("rkeeper")
 
+# клиент создается на каждую синхронизацию, поэтому подобранный размер батча хранится по адресу на уровне процесса
+_batch_sizes: dict[str, int] = {}
+
 
 class PosGatewayClientError(Exception):
     pass
@@ -33,147 +43,242 @@ class PosGatewayClientForbiddenError(PosGatewayClientError):
     pass
 
 
+class PosGatewayClientPayloadTooLargeError(PosGatewayClientError, BatchTooLargeError):
+    pass
+
+
+class PosGatewayClientTimeoutError(PosGatewayClientError, BatchTooLargeError):
+    pass
+
+
+class PosGatewayClientUnavailableError(PosGatewayClientError, BatchUnavailableError):
+    pass
+
+
+class PosGatewayClientRejectedError(PosGatewayClientError, BatchRejectedError):
+    pass
+
+
+class PosGatewayClientServerError(PosGatewayClientError, BatchRejectedError):
+    retryable = True
+
+
+class PosGatewayClientCircuitOpenError(PosGatewayClientError, CircuitOpenError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class GatewayRequest:
+    method: str
+    url: str
+    items: int
+    size: int
+
+
 class PosGatewayClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, storage: Storage | None = None):
         self.base_url = settings.POS_GATEWAY_URL
         self.api_key = api_key
+        # размер батча подбирается отдельно для каждого адреса
+        self._batchers: dict[str, AdaptiveBatcher] = {}
+        # в storage запоминаются объекты, которые gateway отклонил, следующая синхронизация их не отправляет
+        self.storage = storage
+        self._tenant = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        # адрес -> pos_id созданных объектов, батчи которых помнятся в storage до сохранения объектов в БД
+        self._pending_creates: dict[str, set[str]] = {}
+        self.breaker = CircuitBreaker(self.base_url, self._tenant, PosGatewayClientCircuitOpenError)
 
     def create_shops(self, shops: list[pos.CreateShop]) -> pos.ObjectOutList:
-        logger.debug(
-            "shops for create ",
-            shops=[shop.dict() for shop in shops],
-            api_key=self.api_key,
-        )
-        return self._post_request(shops, "shops")
+        return self._post_batches(shops, "shops", "shops for create")
 
     def update_shops(self, shops: list[pos.UpdateShop]) -> None:
-        logger.debug(
-            "shops for update",
-            shops=[shop.dict() for shop in shops],
-            api_key=self.api_key,
-        )
-        self._put_request(shops, "shops")
+        self._put_batches(shops, "shops", "shops for update")
 
     def create_categories(self, categories: list[pos.CreateCategory]) -> pos.ObjectOutList:
-        logger.debug(
-            "categories for create ",
-            categories=[i.dict() for i in categories],
-            api_key=self.api_key,
-        )
-        return self._post_request(categories, "categories")
+        return self._post_batches(categories, "categories", "categories for create")
 
     def update_categories(self, categories: list[pos.UpdateCategory]) -> None:
-        logger.debug(
-            "categories for update ",
-            categories=[i.dict() for i in categories],
-            api_key=self.api_key,
-        )
-        self._put_request(categories, "categories")
+        self._put_batches(categories, "categories", "categories for update")
 
     def create_meals(self, meals: list[pos.CreateMeal]) -> pos.ObjectOutList:
-        logger.debug(
-            "meals for create ",
-            meals=[meal.dict() for meal in meals],
-            api_key=self.api_key,
-        )
-        return self._post_request(meals, "meals")
+        return self._post_batches(meals, "meals", "meals for create")
 
     def update_meals(self, meals: list[pos.UpdateMeal]) -> None:
-        logger.debug(
-            "meals for update ",
-            meals=[meal.dict() for meal in meals],
-            api_key=self.api_key,
-        )
-        self._put_request(meals, "meals")
+        self._put_batches(meals, "meals", "meals for update")
 
     def create_meal_offers(
         self, meal_offers: list[pos.menu.CreateMealOffer], shop_starter_id: int
     ) -> pos.ObjectOutList:
-        logger.debug(
-            "meal offers for create ",
-            meal_offers=[meal_offer.dict() for meal_offer in meal_offers],
-            api_key=self.api_key,
-        )
         with tracer.start_as_current_span("update meal offers in gateway") as span:
             span.set_attribute("shop.starter.id", shop_starter_id)
             span.set_attribute("api.key", self.api_key)
-            span.set_attribute("meal.offers", json.dumps([offer.dict(by_alias=True) for offer in meal_offers]))
+            span.set_attribute("meal.offers.count", len(meal_offers))
 
-            created_gateway_offers = self._post_request(meal_offers, f"shop/{shop_starter_id}/meals")
+            created_gateway_offers = self._post_batches(
+                meal_offers, f"shop/{shop_starter_id}/meals", "meal offers for create"
+            )
             span.set_attribute(
                 "meal.offers",
-                json.dumps([created_offer.dict(by_alias=True) for created_offer in created_gateway_offers.data]),
+                dumps(created_gateway_offers.data).decode(),
             )
             return created_gateway_offers
 
     def update_meal_offers(self, meal_offers: list[pos.menu.UpdateMealOffer], shop_starter_id: int) -> None:
-        logger.debug(
-            "meal offers for update",
-            meal_offers=[meal_offer.dict() for meal_offer in meal_offers],
-            api_key=self.api_key,
-        )
         with tracer.start_as_current_span("update meal offers in gateway") as span:
             span.set_attribute("shop.starter.id", shop_starter_id)
             span.set_attribute("api.key", self.api_key)
-            span.set_attribute("meal.offers", json.dumps([offer.dict(by_alias=True) for offer in meal_offers]))
+            span.set_attribute("meal.offers.count", len(meal_offers))
 
-            self._put_request(meal_offers, f"shop/{shop_starter_id}/meals")
+            self._put_batches(meal_offers, f"shop/{shop_starter_id}/meals", "meal offers for update")
 
     def create_modifier_groups(self, modifier_groups: list[pos.CreateModifierGroup]) -> pos.ObjectOutList:
-        logger.debug(
-            "modifier groups for create ",
-            modifier_groups=[modifier_group.dict() for modifier_group in modifier_groups],
-            api_key=self.api_key,
-        )
-        return self._post_request(modifier_groups, "modifier_groups")
+        return self._post_batches(modifier_groups, "modifier_groups", "modifier groups for create")
 
     def update_modifier_groups(self, modifier_groups: list[pos.UpdateModifierGroup]) -> None:
-        logger.debug(
-            "modifier groups for update ",
-            modifier_groups=[modifier_group.dict() for modifier_group in modifier_groups],
-            api_key=self.api_key,
-        )
-        self._put_request(modifier_groups, "modifier_groups")
+        self._put_batches(modifier_groups, "modifier_groups", "modifier groups for update")
 
     def create_modifiers(self, modifiers: list[pos.CreateModifier]) -> pos.base.ObjectOutList:
-        logger.debug(
-            "modifiers for create ",
-            modifiers=[modifier.dict() for modifier in modifiers],
-            api_key=self.api_key,
-        )
-        return self._post_request(modifiers, "modifiers")
+        return self._post_batches(modifiers, "modifiers", "modifiers for create")
 
     def update_modifiers(self, modifiers: list[pos.UpdateModifier]) -> None:
-        logger.debug(
-            "modifiers for update",
-            modifiers=[modifier.dict() for modifier in modifiers],
-            api_key=self.api_key,
-        )
-        self._put_request(modifiers, "modifiers")
+        self._put_batches(modifiers, "modifiers", "modifiers for update")
 
     def update_modifier_offers(self, modifier_offers: list[UpdateModifierOffer]) -> None:
-        logger.debug(
-            "modifier offers for update",
-            modifiers=[modifier.dict() for modifier in modifier_offers],
-            api_key=self.api_key,
-        )
-        self._put_request(modifier_offers, "modifier_offer")
+        self._put_batches(modifier_offers, "modifier_offer", "modifier offers for update")
 
     def create_modifier_offers(self, modifier_offers: list[CreateModifierOffer]) -> pos.base.ObjectOutList:
-        logger.debug(
-            "modifier offers for create",
-            modifiers=[modifier.dict() for modifier in modifier_offers],
+        return self._post_batches(modifier_offers, "modifier_offer", "modifier offers for create")
+
+    def put_items(self, url: str, items: list) -> None:
+        """Для записей из gateway_outbox: items уже в формате gateway"""
+        self._put_batches(items, url, f"{url} for update")
+
+    def _post_batches(self, items: list, url: str, event: str) -> pos.ObjectOutList:
+        key = f"{self._tenant}:{url}"
+
+        def post(payload: Payload) -> pos.ObjectOutList:
+            logger.debug(event, items=payload.text, api_key=self.api_key)
+            # одинаковый батч получает одинаковый ключ: повтор запроса не создает объекты второй раз
+            idempotency_key = hashlib.sha256(key.encode() + payload.content).hexdigest()
+            if self.storage and settings.POS_GATEWAY_IDEMPOTENT_CREATES:
+                self.storage.add_pending_create(
+                    key,
+                    idempotency_key,
+                    (item.pos_id for item in payload.data),
+                    payload.content,
+                    settings.POS_GATEWAY_PENDING_CREATE_TTL,
+                )
+            try:
+                created = self._post_request(payload, url, idempotency_key)
+            except PosGatewayClientTimeoutError:
+                # батч мог быть создан: повторяем его целиком с тем же ключом, а не делим на новые батчи
+                self._warn_unreconciled_creates(url, payload)
+                raise PosGatewayClientUnavailableError("timeout")
+            except PosGatewayClientServerError as e:
+                # то же для 5xx: половины батча получили бы новые ключи и создали уже созданные объекты еще раз
+                self._warn_unreconciled_creates(url, payload)
+                raise PosGatewayClientUnavailableError(repr(e))
+            if len(created.data) < len(payload.data):
+                self._warn_unreconciled_creates(url, payload)
+            return created
+
+        reconciled = self._reconcile_pending_creates(items, url)
+        pos_ids = {item.pos_id for item in reconciled}
+        created = self._send_batches([item for item in items if item.pos_id not in pos_ids], url, post)
+        data = reconciled + [item for batch in created for item in batch.data]
+        # батчи упавшей отправки остаются в storage для повтора, полученные объекты забываем после коммита
+        if self.storage and settings.POS_GATEWAY_IDEMPOTENT_CREATES:
+            self._pending_creates.setdefault(key, set()).update(item.pos_id for item in data)
+        return pos.ObjectOutList(data=data, count=0)
+
+    def clear_pending_creates(self) -> None:
+        """Вызывается после коммита: созданные объекты сохранены в БД, повторять их батчи больше не нужно"""
+        pending_creates, self._pending_creates = self._pending_creates, {}
+        if not self.storage:
+            return
+
+        for key, pos_ids in pending_creates.items():
+            self.storage.clear_pending_creates(key, pos_ids)
+
+    def _reconcile_pending_creates(self, items: list, url: str) -> list[pos.ObjectOut]:
+        """
+        Объекты, которые уже создавались, но ответ gateway до нас не дошел (таймаут, ошибка, падение воркера до
+        сохранения в БД). Тот же батч отправляется повторно с тем же ключом идемпотентности: gateway возвращает
+        уже созданные объекты, а не создает их заново. Работает только с POS_GATEWAY_IDEMPOTENT_CREATES.
+        """
+        if not self.storage or not settings.POS_GATEWAY_IDEMPOTENT_CREATES or not items:
+            return []
+
+        pos_ids = {item.pos_id for item in items}
+        reconciled = []
+        for idempotency_key, content in self.storage.get_pending_creates(f"{self._tenant}:{url}", pos_ids).items():
+            try:
+                replayed = self._post_request(
+                    Payload.from_encoded(orjson.loads(content), content), url, idempotency_key
+                )
+            except PosGatewayClientRejectedError as e:
+                logger.warn("Gateway rejected pending create", url=url, error=repr(e))
+                continue
+            # в батче могли быть объекты, которые уже сохранены в БД или больше не нужны
+            reconciled.extend(item for item in replayed.data if item.pos_id in pos_ids)
+
+        if reconciled:
+            logger.info("Reconciled pending creates", url=url, items=len(reconciled), api_key=self.api_key)
+        return reconciled
+
+    def _warn_unreconciled_creates(self, url: str, payload: Payload) -> None:
+        # без POS_GATEWAY_IDEMPOTENT_CREATES потерянный ответ не восстановить: gateway не умеет искать объекты по
+        # pos_id, следующая синхронизация создаст их еще раз
+        if settings.POS_GATEWAY_IDEMPOTENT_CREATES:
+            return
+        logger.warn(
+            "Gateway create response lost, objects may be created again",
+            url=url,
+            pos_ids=[item.pos_id for item in payload.data],
             api_key=self.api_key,
         )
-        return self._post_request(modifier_offers, "modifier_offer")
+
+    def _put_batches(self, items: list, url: str, event: str) -> None:
+        def put(payload: Payload) -> None:
+            logger.debug(event, items=payload.text, api_key=self.api_key)
+            self._put_request(payload, url)
+
+        self._send_batches(items, url, put)
+
+    def _send_batches(self, items: list, url: str, send: Callable[[Payload], Any]) -> list:
+        # api_key в ключах redis не храним
+        key = f"{self._tenant}:{url}"
+        rejected: list[str] = []
+
+        def on_reject(item: Any, digest: str, error: Exception) -> None:
+            logger.error("Gateway rejected item", url=url, item=dumps(item).decode(), error=repr(error))
+            rejected.append(digest)
+
+        skip = self.storage.get_rejected_items(key) if self.storage else set()
+        batcher = self._get_batcher(url)
+        try:
+            return batcher.send(items, send, on_reject, skip)
+        finally:
+            _batch_sizes[url] = batcher.batch_size
+            if rejected and self.storage:
+                self.storage.add_rejected_items(key, rejected, settings.POS_GATEWAY_REJECTED_TTL)
+
+    def _get_batcher(self, url: str) -> AdaptiveBatcher:
+        if url not in self._batchers:
+            self._batchers[url] = AdaptiveBatcher(batch_size=_batch_sizes.get(url))
+        return self._batchers[url]
 
     def register_webhook(self) -> None:
         url = urljoin(self.base_url, "set_webhook")
         try:
-            response = httpx.post(
-                url,
-                json={"callbackUrl": f"https://{settings.EXTERNAL_HOST}/api/order"},
-                headers={"Authorization": self.api_key},
+            response = self.breaker.send(
+                lambda: httpx.post(
+                    url,
+                    json={"callbackUrl": f"https://{settings.EXTERNAL_HOST}/api/order"},
+                    headers={"Authorization": self.api_key},
+                    # вызывается под блокировкой проекта, она не должна пережить LOCK_TIMEOUT
+                    timeout=settings.POS_GATEWAY_WEBHOOK_TIMEOUT,
+                )
             )
             logger.info(
                 "register webhook",
@@ -200,10 +305,12 @@ class PosGatewayClient:
 
     def register_webhook_for_settings(self) -> None:
         url = urljoin(self.base_url, "adapter/webhook")
-        response = httpx.post(
-            url,
-            json={"callbackUrl": f"https://{settings.EXTERNAL_HOST}/api/project"},
-            headers={"Authorization": self.api_key},
+        response = self.breaker.send(
+            lambda: httpx.post(
+                url,
+                json={"callbackUrl": f"https://{settings.EXTERNAL_HOST}/api/project"},
+                headers={"Authorization": self.api_key},
+            )
         )
         logger.info(
             "register webhook for settings",
@@ -222,18 +329,23 @@ class PosGatewayClient:
                     span.set_attribute("order.pos_number", status_order.pos_number)
                     span.set_attribute("status", status_order.status)
                     url = f"order/{status_order.id}/status"
-                    client.patch(url=url, json=status_order.dict(by_alias=True, exclude={"id"}))
-
-    def _post_request(self, create_data: list, url: str) -> pos.ObjectOutList:
+                    content = dumps(status_order.dict(by_alias=True, exclude={"id"}))
+                    self.breaker.send(
+                        lambda: client.patch(url=url, content=content, headers={"Content-Type": "application/json"})
+                    )
+
+    def _post_request(self, payload: Payload, url: str, idempotency_key: str | None = None) -> pos.ObjectOutList:
+        headers = {"Authorization": self.api_key, "Content-Type": "application/json"}
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
         try:
-            response = httpx.post(
-                urljoin(self.base_url, url),
-                json=[i.dict(by_alias=True) for i in create_data],
-                headers={"Authorization": self.api_key},
+            response = self.breaker.send(
+                lambda: httpx.post(urljoin(self.base_url, url), content=payload.content, headers=headers)
             )
 
             if response.status_code == 403:
                 raise PosGatewayClientInvalidError
+            self._check_batch_response(response)
 
             json = response.json()
             if "data" in json:
@@ -249,21 +361,69 @@ class PosGatewayClient:
             )
 
             return pos.ObjectOutList(data=[], count=0)
-        except httpx.RequestError:
-            raise PosGatewayClientError
+        except httpx.TimeoutException:
+            raise PosGatewayClientTimeoutError
+        except httpx.RequestError as e:
+            raise PosGatewayClientUnavailableError(repr(e))
 
-    def _put_request(self, update_objects: List, url: str) -> None:
+    def _put_request(self, payload: Payload, url: str) -> None:
         try:
-            response = httpx.put(
-                url=urljoin(self.base_url, url),
-                json=[i.dict(by_alias=True) for i in update_objects],
-                headers={"Authorization": self.api_key},
+            response = self.breaker.send(
+                lambda: httpx.put(
+                    url=urljoin(self.base_url, url),
+                    content=payload.content,
+                    headers={"Authorization": self.api_key, "Content-Type": "application/json"},
+                )
             )
 
             if response.status_code == 403:
                 logger.info("wrong api_key", content=response.content, api_key=self.api_key)
                 raise PosGatewayClientInvalidError
-            elif response.status_code == 404:
-                pass
-        except httpx.RequestError:
-            raise PosGatewayClientError
+            # 404 - в gateway нет обновляемого объекта, такой объект отклоняется как и остальные ошибки 4xx
+            self._check_batch_response(response)
+        except httpx.TimeoutException:
+            raise PosGatewayClientTimeoutError
+        except httpx.RequestError as e:
+            raise PosGatewayClientUnavailableError(repr(e))
+
+    @staticmethod
+    def _check_batch_response(response: httpx.Response) -> None:
+        if response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE:
+            raise PosGatewayClientPayloadTooLargeError
+        if response.status_code in (
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            status.HTTP_502_BAD_GATEWAY,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            status.HTTP_504_GATEWAY_TIMEOUT,
+        ):
+            raise PosGatewayClientUnavailableError(response.status_code)
+        if response.is_server_error:
+            raise PosGatewayClientServerError(response.status_code, response.text)
+        if response.is_client_error:
+            raise PosGatewayClientRejectedError(response.status_code, response.text)
+
+
+class DryRunPosGatewayClient(PosGatewayClient):
+    """
+    Для dry-run синхронизации: в gateway ничего не отправляется, запросы только записываются.
+    Созданным объектам выдаются временные отрицательные id, чтобы следующие этапы синхронизации могли на них сослаться.
+    """
+
+    def __init__(self, api_key: str):
+        super().__init__(api_key)
+        self.requests: list[GatewayRequest] = []
+        self._ids = itertools.count(-1, -1)
+
+    def pop_requests(self) -> list[GatewayRequest]:
+        requests, self.requests = self.requests, []
+        return requests
+
+    def _post_request(self, payload: Payload, url: str, idempotency_key: str | None = None) -> pos.ObjectOutList:
+        self.requests.append(GatewayRequest("POST", url, len(payload.data), len(payload)))
+        return pos.ObjectOutList(
+            data=[pos.base.ObjectOut(**{"posId": item.pos_id, "id": next(self._ids)}) for item in payload.data],
+            count=0,
+        )
+
+    def _put_request(self, payload: Payload, url: str) -> None:
+        self.requests.append(GatewayRequest("PUT", url, len(payload.data), len(payload)))
@@ -0,0 +1,126 @@
+import enum
+import math
+import time
+
+from opentelemetry import metrics
+from redis.exceptions import RedisError
+
+from src.config import settings
+from src.logger import get_logger
+from src.services.redis_client import Storage
+from src.utils.deadline import Deadline
+
+logger = get_logger("rate_limiter")
+meter = metrics.get_meter("rkeeper")
+
+acquired_requests = meter.create_counter("rate_limiter.acquired", description="Запросы, получившие токен")
+shed_requests = meter.create_counter("rate_limiter.shed", description="Запросы, отброшенные без токена")
+wait_time = meter.create_histogram("rate_limiter.wait", unit="s", description="Ожидание токена")
+
+# Токены пополняются со скоростью ARGV[1] в секунду до ARGV[2]. Запрос забирает токен, только если после этого
+# останется не меньше ARGV[3] (резерв для приоритетных запросов). Возвращает {1, 0} или {0, сколько ждать (сек)}.
+# Время берется из redis, чтобы у всех воркеров оно было одинаковым.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (reserve + 1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+DRAIN_SCRIPT = """
+local time = redis.call('TIME')
+redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', tonumber(time[1]) + tonumber(time[2]) / 1000000)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+_storage = Storage()
+
+
+class Priority(enum.Enum):
+    # заказы из API: могут забрать резерв и ждут недолго
+    ORDER = "order"
+    # фоновая синхронизация: резерв не трогают, ждут дольше
+    SYNC = "sync"
+
+
+class RateLimitExceededError(Exception):
+    """Токен не освободился за допустимое время ожидания, запрос не отправлялся"""
+
+
+class RateLimiter:
+    """
+    Token bucket в redis, общий для всех воркеров, которые ходят в API от имени одного клиента.
+
+    Запрос ждет токен не дольше RKEEPER_RATE_LIMIT_*_MAX_WAIT для своего приоритета, иначе отбрасывается с
+    RateLimitExceededError. Фоновые запросы оставляют в bucket RKEEPER_RATE_LIMIT_ORDER_RESERVE токенов для заказов.
+    Если redis недоступен, запросы отправляются без ограничения.
+    """
+
+    def __init__(
+        self, tenant: str, error: type[RateLimitExceededError] = RateLimitExceededError, storage: Storage | None = None
+    ) -> None:
+        self.key = f"rate_limit:{tenant}"
+        self.error = error
+        self.storage = storage or _storage
+        self.rate = settings.RKEEPER_RATE_LIMIT
+        self.capacity = settings.RKEEPER_RATE_LIMIT_BURST
+        self._reserve = {Priority.ORDER: 0, Priority.SYNC: settings.RKEEPER_RATE_LIMIT_ORDER_RESERVE}
+        self._max_wait = {
+            Priority.ORDER: settings.RKEEPER_RATE_LIMIT_ORDER_MAX_WAIT,
+            Priority.SYNC: settings.RKEEPER_RATE_LIMIT_SYNC_MAX_WAIT,
+        }
+
+    def acquire(self, priority: Priority = Priority.SYNC, request_deadline: Deadline | None = None) -> None:
+        started_at = time.monotonic()
+        deadline = started_at + self._max_wait[priority]
+        if request_deadline:
+            # после ожидания на сам запрос должно остаться время
+            deadline = min(deadline, request_deadline.expires_at - settings.DEADLINE_MIN_TIMEOUT)
+        attributes = {"priority": priority.value}
+        while True:
+            try:
+                allowed, wait = self.storage.redis.eval(
+                    TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, self._reserve[priority]
+                )
+            except RedisError as e:
+                logger.warn("Rate limiter state is unavailable", key=self.key, error=repr(e))
+                return
+
+            if allowed:
+                acquired_requests.add(1, attributes)
+                wait_time.record(time.monotonic() - started_at, attributes)
+                return
+
+            wait = float(wait)
+            if time.monotonic() + wait > deadline:
+                shed_requests.add(1, attributes)
+                logger.warn("Request is shed by rate limiter", key=self.key, priority=priority.value, wait=wait)
+                raise self.error(f"Rate limit of {self.key} is exceeded")
+
+            time.sleep(wait)
+
+    def drain(self) -> None:
+        """Сервис ответил 429: забираем все токены, запросы подождут, пока bucket наполнится заново"""
+        try:
+            self.storage.redis.eval(DRAIN_SCRIPT, 1, self.key, math.ceil(self.capacity / self.rate) + 1)
+        except RedisError as e:
+            logger.warn("Rate limiter state is unavailable", key=self.key, error=repr(e))
@@ -1,6 +1,7 @@
-import json
+import hashlib
 from datetime import datetime, timedelta
-from typing import Optional
+from tempfile import SpooledTemporaryFile
+from typing import IO, Callable, Optional
 from urllib.parse import urljoin
 
 import httpx
@@ -8,6 +9,10 @@ from httpx import Response
 from opentelemetry import trace
 from opentelemetry.trace import SpanKind
 
+from src.clients.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.clients.decoders import decode, decode_list, loads
+from src.clients.menu_stream import read_menu
+from src.clients.rate_limiter import Priority, RateLimiter, RateLimitExceededError
 from src.config import settings
 from src.logger import get_logger
 from src.models import Client
@@ -19,6 +24,11 @@ from src.schemas.rkeeper import (
     RKeeperShop,
     RKeeperLimitedListItem,
 )
+from src.services.rkeeper_snapshots import RkeeperSnapshots
+from src.utils.cache import LruCache
+from src.utils.deadline import Deadline, get_timeout
+from src.utils.enums import SnapshotKind
+from src.utils.serialization import Payload, dumps
 
 logger = get_logger("rkeeper_client")
 tracer = trace.get_tracer("rkeeper")
@@ -33,6 +43,14 @@ class RkeeperClientInvalidError(RkeeperClientError):
     pass
 
 
+class RkeeperClientCircuitOpenError(RkeeperClientError, CircuitOpenError):
+    pass
+
+
+class RkeeperClientRateLimitedError(RkeeperClientError, RateLimitExceededError):
+    pass
+
+
 class ShopMenuParseError(Exception):
     pass
 
@@ -42,37 +60,100 @@ class RkeeperClient:
     https://docs.rkeeper.ru/delivery/dejstviya-s-zakazami-10819423.html
     """
 
-    def __init__(self, client: Client) -> None:
+    def __init__(self, client: Client, snapshots: RkeeperSnapshots | None = None) -> None:
         self.client = client
         self.base_url = "https://delivery.ucs.ru/orders/api/v1/"
+        self.auth_url = "https://auth-delivery.ucs.ru/connect/token"
         self._token: str = ""
         self._token_expired_at: datetime = datetime.now()
+        self.breaker = CircuitBreaker(self.base_url, client.client_id, RkeeperClientCircuitOpenError)
+        self.auth_breaker = CircuitBreaker(self.auth_url, client.client_id, RkeeperClientCircuitOpenError)
+        # лимит API общий для всех запросов клиента: синхронизации, оплат и заказов
+        self.limiter = RateLimiter(client.client_id, RkeeperClientRateLimitedError)
+        # sha256 ответа -> меню. У магазинов сети меню часто одинаковые, такое разбираем один раз
+        self._menus: LruCache[str, RKeeperMenu] = LruCache(settings.RKEEPER_MENU_CACHE_SIZE)
+        if snapshots is None and settings.RKEEPER_SNAPSHOTS_ENABLED:
+            snapshots = RkeeperSnapshots(client.id)
+        self.snapshots = snapshots
 
     @property
     def token(self) -> str:
+        return self._get_token()
+
+    def _get_token(self, deadline: Deadline | None = None) -> str:
         if self._token_expired_at < datetime.now():
-            self._set_token()
+            self._set_token(deadline)
 
         return self._token
 
     def get_menu(self, shop_id: str) -> RKeeperMenu:
         url = urljoin(self.base_url, "menu/view")
         params = {"restaurantId": shop_id}
-        response = self._fetch(url, params)
+        if settings.RKEEPER_MENU_STREAMING:
+            return self._stream_menu(url, params, shop_id)
+
+        response = self._fetch(url, params, "menu")
         response.raise_for_status()
 
-        data = response.json()["result"]
+        digest = hashlib.sha256(response.content).hexdigest()
+        self._record_snapshot(SnapshotKind.MENU, shop_id, response.content, digest)
+        if menu := self._menus.get(digest):
+            return menu
+
+        data = loads(response.content)["result"]
         try:
             with tracer.start_as_current_span("rkeeper_menu receive") as span:
                 span.set_attribute("client.id", self.client.client_id)
                 span.set_attribute("shop.id", shop_id)
-                span.set_attribute("rkeeper.menu", json.dumps(data))
+                span.set_attribute("rkeeper.menu.size", len(response.content))
 
-            return RKeeperMenu(**data)
+            menu = self._menus[digest] = decode(RKeeperMenu, data)
+            return menu
         except Exception as e:
             logger.exception("could not parse menu", client_id=self.client.client_id, json=data)
             raise e
 
+    def _stream_menu(self, url: str, params: dict, shop_id: str) -> RKeeperMenu:
+        with tracer.start_as_current_span("rkeeper_menu receive") as span:
+            span.set_attribute("client.id", self.client.client_id)
+            span.set_attribute("shop.id", shop_id)
+            # ответ держим в памяти до RKEEPER_MENU_SPOOL_MAX_SIZE, дальше он уходит во временный файл
+            headers = {"Authorization": f"Bearer {self.token}"}
+            with SpooledTemporaryFile(max_size=settings.RKEEPER_MENU_SPOOL_MAX_SIZE) as spool:
+                content_hash = hashlib.sha256()
+                with self.breaker.guard() as call:
+                    self.limiter.acquire(Priority.SYNC)
+                    with httpx.stream(
+                        "GET", url, headers=headers, params=params, timeout=self._timeout("menu")
+                    ) as response:
+                        call.record(response)
+                        self._check_rate_limit(response)
+                        response.raise_for_status()
+                        for chunk in response.iter_bytes():
+                            content_hash.update(chunk)
+                            spool.write(chunk)
+
+                menu_size = spool.tell()
+                span.set_attribute("rkeeper.menu.size", menu_size)
+                digest = content_hash.hexdigest()
+                self._record_snapshot(SnapshotKind.MENU, shop_id, spool, digest)
+                if menu := self._menus.get(digest):
+                    span.set_attribute("rkeeper.menu.reused", True)
+                    return menu
+
+                try:
+                    menu = self._menus[digest] = read_menu(spool)
+                    return menu
+                except Exception as e:
+                    logger.exception(
+                        "could not parse menu", client_id=self.client.client_id, shop_id=shop_id, size=menu_size
+                    )
+                    raise e
+
+    def get_menu_digest(self, menu: RKeeperMenu) -> str | None:
+        """sha256 ответа, из которого разобрано меню, пока меню в кеше"""
+        return next((digest for digest, cached_menu in self._menus.items() if cached_menu is menu), None)
+
     def get_shops(self) -> list[RKeeperShop]:
         url = urljoin(self.base_url, f"orderSources/{self.client.client_id}/restaurants")
 
@@ -96,20 +177,22 @@ class RkeeperClient:
     def get_status_of_orders(self) -> list[RKeeperOrderStatus]:
         url = urljoin(self.base_url, "orders")
         response = self._fetch(url)
-        orders = response.json()["result"]
+        self._record_snapshot(SnapshotKind.ORDER_STATUSES, None, response.content)
+        orders = loads(response.content)["result"]
 
-        return [RKeeperOrderStatus(**order) for order in orders]
+        return decode_list(RKeeperOrderStatus, orders)
 
-    def preliminary_calculation(self, order: RKeeperOrder) -> OrderDraft:
+    def preliminary_calculation(self, order: RKeeperOrder, deadline: Deadline | None = None) -> OrderDraft:
         url = "orders/delivery"
-        response = self._pos_request(url, order).json()
+        payload = Payload(order)
+        response = self._pos_request(url, payload, deadline).json()
         logger.info(
             "Created order draft",
             json=response,
             url=url,
             token=self.token,
             client_id=self.client.client_id,
-            order=order.dict(by_alias=True),
+            order=payload.text,
         )
         if "result" in response:
             return OrderDraft(**response["result"]["amount"])
@@ -122,9 +205,12 @@ class RkeeperClient:
         )
         raise RkeeperClientInvalidError(f'errors={response["errors"]} msg={response["msg"]}')
 
-    def create_order(self, order: RKeeperOrder) -> str:
+    def create_order(
+        self, order: RKeeperOrder, payload: Payload | None = None, deadline: Deadline | None = None
+    ) -> str:
         url = "orders"
-        response = self._pos_request(url, order).json()
+        # payload передается, если заказ уже сериализован для логов и спанов
+        response = self._pos_request(url, payload or Payload(order), deadline).json()
         logger.info(
             "Created order",
             json=response,
@@ -137,20 +223,30 @@ class RkeeperClient:
 
         raise RkeeperClientInvalidError(f'errors={response["errors"]} msg={response["msg"]}')
 
-    def get_limit_list(self) -> list[RKeeperLimitedListItem]:
+    def get_limit_list(self, raise_on_error: bool = False) -> list[RKeeperLimitedListItem]:
+        """
+        raise_on_error - ошибка запроса или разбора пробрасывается как RkeeperClientError вместо пустого списка:
+        пустой список снимает ограничения со всех блюд
+        """
         with tracer.start_as_current_span("get limit list", kind=SpanKind.CLIENT) as span:
             span.set_attribute("client.id", self.client.client_id)
             url = urljoin(self.base_url, "menu/dishes/limitedlist")
             response = None
             try:
-                response = self._fetch(url).json()
-                span.set_attribute("response", json.dumps(response))
+                content = self._fetch(url).content
+                # сам ответ сохраняется снимком, в спан идет только размер
+                span.set_attribute("rkeeper.limited_list.size", len(content))
+                self._record_snapshot(SnapshotKind.LIMITED_LIST, None, content)
+                response = loads(content)
                 limited_list = response.get("result")
                 if limited_list is None:
                     raise Exception("No limited list")
 
-                return [RKeeperLimitedListItem(**item) for item in limited_list]
+                return decode_list(RKeeperLimitedListItem, limited_list)
 
+            except (CircuitOpenError, RateLimitExceededError):
+                # пустой стоп-лист снял бы ограничения со всех блюд, синхронизацию меню нужно пропустить
+                raise
             except httpx.RequestError as err:
                 logger.exception(
                     "could not fetch limited list",
@@ -158,6 +254,8 @@ class RkeeperClient:
                     content=response if response else None,
                     err=str(err),
                 )
+                if raise_on_error:
+                    raise RkeeperClientError("could not fetch limited list") from err
                 return []
 
             except Exception as e:
@@ -166,6 +264,8 @@ class RkeeperClient:
                     client_id=self.client.client_id,
                     err=str(e),
                 )
+                if raise_on_error:
+                    raise RkeeperClientError("could not parse limited list") from e
                 return []
 
     def order_payment(self, order_id: str) -> dict:
@@ -204,40 +304,49 @@ class RkeeperClient:
             )
             return response_json
 
-    def _pos_request(self, url: str, data: RKeeperOrder) -> Response:
-        with httpx.Client(base_url=self.base_url, timeout=settings.DEFAULT_TIMEOUT) as client:
-            response = client.post(
-                url,
-                data=data.json(by_alias=True),  # type: ignore
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.token}",
-                },
+    def _record_snapshot(
+        self, kind: SnapshotKind, shop_id: str | None, content: bytes | IO[bytes], digest: str | None = None
+    ) -> None:
+        if self.snapshots:
+            self.snapshots.record(kind, shop_id, content, digest)
+
+    def _pos_request(self, url: str, payload: Payload, deadline: Deadline | None = None) -> Response:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self._get_token(deadline)}",
+        }
+        with httpx.Client(base_url=self.base_url) as client:
+            # таймаут считается после ожидания токена лимита, от оставшегося времени
+            response = self._send(
+                lambda: client.post(
+                    url, content=payload.content, headers=headers, timeout=self._timeout("order", deadline)
+                ),
+                Priority.ORDER,
+                deadline,
             )
         return response
 
     def _put_request(self, url: str, data: list) -> Response:
-        return httpx.put(
-            url,
-            json=data,
-            timeout=settings.DEFAULT_TIMEOUT,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.token}",
-            },
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.token}",
+        }
+        return self._send(
+            lambda: httpx.put(url, content=dumps(data), timeout=self._timeout("payment"), headers=headers)
         )
 
-    def _set_token(self) -> None:
-        url = "https://auth-delivery.ucs.ru/connect/token"
-        resp = httpx.post(
-            url,
-            timeout=settings.DEFAULT_TIMEOUT,
-            data={
-                "client_id": self.client.client_id,
-                "client_secret": self.client.client_secret,
-                "grant_type": "client_credentials",
-                "scopes": "orders",
-            },
+    def _set_token(self, deadline: Deadline | None = None) -> None:
+        resp = self.auth_breaker.send(
+            lambda: httpx.post(
+                self.auth_url,
+                timeout=self._timeout("token", deadline),
+                data={
+                    "client_id": self.client.client_id,
+                    "client_secret": self.client.client_secret,
+                    "grant_type": "client_credentials",
+                    "scopes": "orders",
+                },
+            )
         )
         if resp.status_code == 400:
             logger.warn("cannot set token", content=resp.content, client_id=self.client.client_id)
@@ -247,7 +356,26 @@ class RkeeperClient:
         self._token = data["access_token"]
         self._token_expired_at = datetime.now() + timedelta(seconds=data["expires_in"])
 
-    def _fetch(self, url: str, params: Optional[dict] = None) -> httpx.Response:
-        return httpx.get(
-            url, headers={"Authorization": f"Bearer {self.token}"}, params=params, timeout=settings.DEFAULT_TIMEOUT
-        )
+    def _fetch(self, url: str, params: Optional[dict] = None, operation: str = "fetch") -> httpx.Response:
+        headers = {"Authorization": f"Bearer {self.token}"}
+        return self._send(lambda: httpx.get(url, headers=headers, params=params, timeout=self._timeout(operation)))
+
+    def _send(
+        self, request: Callable[[], Response], priority: Priority = Priority.SYNC, deadline: Deadline | None = None
+    ) -> Response:
+        def limited_request() -> Response:
+            self.limiter.acquire(priority, deadline)
+            response = request()
+            self._check_rate_limit(response)
+            return response
+
+        return self.breaker.send(limited_request)
+
+    @staticmethod
+    def _timeout(operation: str, deadline: Deadline | None = None) -> float:
+        return get_timeout(settings.RKEEPER_TIMEOUTS[operation], deadline)
+
+    def _check_rate_limit(self, response: Response) -> None:
+        if response.status_code == 429:
+            logger.warn("RKeeper rate limit is exceeded", client_id=self.client.client_id)
+            self.limiter.drain()
@@ -0,0 +1,49 @@
+from typing import Mapping
+
+from src.clients.decoders import decode_list, loads
+from src.clients.menu_stream import read_menu
+from src.clients.rkeeper_client import RkeeperClient, RkeeperClientError
+from src.models import Client, RkeeperSnapshot
+from src.schemas.rkeeper import RKeeperLimitedListItem, RKeeperMenu, RKeeperOrderStatus
+from src.services.rkeeper_snapshots import open_snapshot
+
+
+class SnapshotRkeeperClient(RkeeperClient):
+    """
+    Отдает сохраненные ответы RKeeper вместо запросов к нему: синхронизация на них повторяется так же,
+    как на живых данных. Снимки не записываются заново.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        menus: Mapping[str, RkeeperSnapshot],
+        limited_list: RkeeperSnapshot | None = None,
+        order_statuses: RkeeperSnapshot | None = None,
+    ) -> None:
+        super().__init__(client)
+        self.snapshots = None
+        self.menu_snapshots = menus
+        self.limited_list_snapshot = limited_list
+        self.order_statuses_snapshot = order_statuses
+
+    def get_menu(self, shop_id: str) -> RKeeperMenu:
+        if shop_id not in self.menu_snapshots:
+            raise RkeeperClientError(f"no menu snapshot for shop {shop_id}")
+
+        with open_snapshot(self.menu_snapshots[shop_id]) as file:
+            return read_menu(file)
+
+    def get_limit_list(self, raise_on_error: bool = False) -> list[RKeeperLimitedListItem]:
+        if not self.limited_list_snapshot:
+            return []
+
+        with open_snapshot(self.limited_list_snapshot) as file:
+            return decode_list(RKeeperLimitedListItem, loads(file.read())["result"])
+
+    def get_status_of_orders(self) -> list[RKeeperOrderStatus]:
+        if not self.order_statuses_snapshot:
+            return []
+
+        with open_snapshot(self.order_statuses_snapshot) as file:
+            return decode_list(RKeeperOrderStatus, loads(file.read())["result"])
@@ -8,6 +8,7 @@ from httpx import Response
 from opentelemetry import trace
 from opentelemetry.trace import SpanKind
 
+from src.clients.circuit_breaker import CircuitBreaker, CircuitOpenError
 from src.config import settings
 from src.logger import get_logger
 from src.models import Client
@@ -33,6 +34,10 @@ class RkeeperClientInvalidError(RkeeperClientError):
     pass
 
 
+class SBISClientCircuitOpenError(RkeeperClientError, CircuitOpenError):
+    pass
+
+
 class ShopMenuParseError(Exception):
     pass
 
@@ -45,7 +50,10 @@ class SBISClient:
     def __init__(self, client: Client) -> None:
         self.client = client
         self.base_url = "https://api.sbis.ru/retail/"
+        self.auth_url = "https://online.sbis.ru/oauth/service/"
         self._token: str = ""
+        self.breaker = CircuitBreaker(self.base_url, client.client_id, SBISClientCircuitOpenError)
+        self.auth_breaker = CircuitBreaker(self.auth_url, client.client_id, SBISClientCircuitOpenError)
 
     @property
     def token(self) -> str:
@@ -208,38 +216,34 @@ class SBISClient:
             return response_json
 
     def _pos_request(self, url: str, data: RKeeperOrder) -> Response:
+        headers = {
+            "Content-Type": "application/json",
+            "X-SBISAccessToken": f"{self.token}",
+        }
         with httpx.Client(base_url=self.base_url, timeout=settings.DEFAULT_TIMEOUT) as client:
-            response = client.post(
-                url,
-                data=data.json(by_alias=True),  # type: ignore
-                headers={
-                    "Content-Type": "application/json",
-                    "X-SBISAccessToken": f"{self.token}",
-                },
+            response = self.breaker.send(
+                lambda: client.post(url, data=data.json(by_alias=True), headers=headers)  # type: ignore
             )
         return response
 
     def _put_request(self, url: str, data: list) -> Response:
-        return httpx.put(
-            url,
-            json=data,
-            timeout=settings.DEFAULT_TIMEOUT,
-            headers={
-                "Content-Type": "application/json",
-                "X-SBISAccessToken": f"{self.token}",
-            },
-        )
+        headers = {
+            "Content-Type": "application/json",
+            "X-SBISAccessToken": f"{self.token}",
+        }
+        return self.breaker.send(lambda: httpx.put(url, json=data, timeout=settings.DEFAULT_TIMEOUT, headers=headers))
 
     def _set_token(self) -> None:
-        url = "https://online.sbis.ru/oauth/service/"
-        resp = httpx.post(
-            url,
-            timeout=settings.DEFAULT_TIMEOUT,
-            data={
-                "app_client_id": self.client.client_id,
-                "app_secret": self.client.client_secret,
-                "secret_key": self.client.secret_key
-            },
+        resp = self.auth_breaker.send(
+            lambda: httpx.post(
+                self.auth_url,
+                timeout=settings.DEFAULT_TIMEOUT,
+                data={
+                    "app_client_id": self.client.client_id,
+                    "app_secret": self.client.client_secret,
+                    "secret_key": self.client.secret_key,
+                },
+            )
         )
         if resp.status_code == 400:
             logger.warn("cannot set token", content=resp.content, client_id=self.client.client_id)
@@ -249,6 +253,7 @@ class SBISClient:
         self._token = data["token"]
 
     def _fetch(self, url: str, params: Optional[dict] = None) -> httpx.Response:
-        return httpx.get(
-            url, headers={"X-SBISAccessToken": f"{self.token}"}, params=params, timeout=settings.DEFAULT_TIMEOUT
+        headers = {"X-SBISAccessToken": f"{self.token}"}
+        return self.breaker.send(
+            lambda: httpx.get(url, headers=headers, params=params, timeout=settings.DEFAULT_TIMEOUT)
         )
@@ -8,14 +8,59 @@ class Settings(BaseSettings):
     VERSION: str = "0.0.1"
 
     TIME_SYNC_SHOPS: str = "1"
-    TIME_SYNC_MENU: str = "*"
+    # полная синхронизация меню; остатки и стоп-лист между ними выгружает sync_stock
+    TIME_SYNC_MENU: str = "*/15"
     TIME_SYNC_STATUS: str = "*"
+    # интервал (сек) синхронизации остатков и стоп-листа
+    SYNC_STOCK_INTERVAL: float = 30.0
+    SYNC_STOCK_LOCK_TIMEOUT: int = 5 * 60
+    # сколько (сек) хранить завершенные этапы синхронизации меню, чтобы повтор после ошибки продолжил с упавшего
+    SYNC_CHECKPOINT_TTL: int = 60 * 60
+    # возраст самого свежего незавершенного заказа (сек) -> интервал опроса статусов (сек)
+    ORDER_STATUS_POLL_INTERVALS: dict[int, int] = {600: 60, 1800: 180}
+    ORDER_STATUS_POLL_MAX_INTERVAL: int = 600
+    # опрос запускается раз в минуту и стартует с разной задержкой: без запаса (сек) интервал в 60 сек
+    # совпадал бы с тиком и срабатывал через раз
+    ORDER_STATUS_POLL_TICK_TOLERANCE: int = 15
+
+    ORDER_EXPIRE_AFTER_HOURS: int = 24
+    ORDER_EXPIRE_BATCH_SIZE: int = 5000
+    ORDER_ARCHIVE_AFTER_DAYS: int = 30
+    ORDER_ARCHIVE_BATCH_SIZE: int = 5000
+
+    ORDER_PAYMENT_BATCH_SIZE: int = 100
+    ORDER_PAYMENT_CONCURRENCY: int = 8
+    ORDER_PAYMENT_MAX_ATTEMPTS: int = 5
+    # задержка перед повтором оплаты (сек), удваивается с каждой попыткой
+    ORDER_PAYMENT_RETRY_DELAY: int = 30
+    # оплата без ответа RKeeper дольше этого времени (сек) сверяется со статусом заказа, см. OrderPaymentSettlement.recover
+    ORDER_PAYMENT_SENT_TIMEOUT: int = 900
 
     SERVER_HOST: str = "0.0.0.0"
     SERVER_PORT: int = 8080
 
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
+    LOCK_TIMEOUT: int = 60
+    LOCK_BLOCKING_TIMEOUT: int = 30
+    # обработчик API не ждет чужую блокировку: занятый воркер хуже, чем 409 и повтор вебхука шлюзом
+    API_LOCK_BLOCKING_TIMEOUT: float = 0.3
+
+    # circuit breaker внешних сервисов, см. src/clients/circuit_breaker.py
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_HOST_FAILURE_THRESHOLD: int = 20
+    # ошибки старше этого времени (сек) без новых ошибок забываются
+    CIRCUIT_BREAKER_FAILURE_WINDOW: int = 60
+    CIRCUIT_BREAKER_OPEN_SECONDS: int = 30
+
+    # лимит запросов в API RKeeper на клиента (запросов в секунду), см. src/clients/rate_limiter.py
+    RKEEPER_RATE_LIMIT: float = 5.0
+    RKEEPER_RATE_LIMIT_BURST: int = 20
+    # столько токенов фоновая синхронизация оставляет заказам
+    RKEEPER_RATE_LIMIT_ORDER_RESERVE: int = 5
+    # сколько (сек) запрос ждет токен, прежде чем будет отброшен
+    RKEEPER_RATE_LIMIT_ORDER_MAX_WAIT: float = 5.0
+    RKEEPER_RATE_LIMIT_SYNC_MAX_WAIT: float = 30.0
 
     POSTGRES_HOST: str = "db"
     POSTGRES_PORT: str = "5432"
@@ -29,13 +74,60 @@ class Settings(BaseSettings):
     BONUS_CURRENCY_CODE: str = "1FAD32AC-6E2D-48B8-9DE2-154D34EDA26B"
     DISCOUNT_CURRENCY_CODE: str = "D2993C26-9894-4D46-918B-24AC1"
     DEFAULT_TIMEOUT: int = 20
+    # таймауты запросов в RKeeper по операциям (сек)
+    RKEEPER_TIMEOUTS: dict[str, float] = {"token": 5, "fetch": 20, "menu": 60, "order": 15, "payment": 10}
+    # сколько (сек) есть на создание заказа: gateway дольше ответа не ждет
+    ORDER_DEADLINE: float = 25.0
+    # с меньшим запасом времени запрос не отправляем
+    DEADLINE_MIN_TIMEOUT: float = 1.0
 
     OPENTELEMETRY_AGENT_NAME: str = ""
     OPENTELEMETRY_COLLECTOR_ENDPOINT: str = ""
     OPENTELEMETRY_USERNAME: str = ""
     OPENTELEMETRY_PASSWORD: str = ""
 
+    # полная валидация pydantic ответов RKeeper вместо быстрого разбора, см. src/clients/decoders.py
+    RKEEPER_STRICT_VALIDATION: bool = False
+    # меню читается потоком по секциям, без загрузки всего ответа в память
+    RKEEPER_MENU_STREAMING: bool = True
+    RKEEPER_MENU_SPOOL_MAX_SIZE: int = 8 * 1024 * 1024
+    # сколько разных разобранных меню держать в памяти, у магазинов сети меню обычно одно на всех
+    RKEEPER_MENU_CACHE_SIZE: int = 4
+    # ответы RKeeper (меню, лимитный список, статусы заказов), сжатые zstd, см. src/services/rkeeper_snapshots.py
+    RKEEPER_SNAPSHOTS_ENABLED: bool = True
+    RKEEPER_SNAPSHOT_COMPRESSION_LEVEL: int = 3
+    RKEEPER_SNAPSHOT_RETENTION_DAYS: int = 7
+    RKEEPER_SNAPSHOT_DELETE_BATCH_SIZE: int = 1000
+
     POS_GATEWAY_URL: str = "https://pos-gateway.starterapp.ru/api/"
+    # запись в gateway делится на батчи, см. src/clients/batching.py
+    POS_GATEWAY_BATCH_SIZE: int = 300
+    POS_GATEWAY_BATCH_MIN_ITEMS: int = 10
+    POS_GATEWAY_BATCH_MAX_ITEMS: int = 1000
+    POS_GATEWAY_BATCH_MAX_BYTES: int = 1024 * 1024
+    # запрос дольше этого времени (сек) уменьшает батч вдвое
+    POS_GATEWAY_BATCH_TARGET_LATENCY: float = 3.0
+    POS_GATEWAY_CONCURRENCY: int = 4
+    # повтор батча при временной ошибке gateway, пауза (сек) удваивается с каждой попыткой
+    POS_GATEWAY_RETRY_ATTEMPTS: int = 3
+    POS_GATEWAY_RETRY_DELAY: float = 1.0
+    # сколько (сек) не отправлять объект, который gateway отклонил, если он не поменялся
+    POS_GATEWAY_REJECTED_TTL: int = 6 * 60 * 60
+    POS_GATEWAY_WEBHOOK_TIMEOUT: float = 5.0
+    # повтор потерянных батчей создания с тем же Idempotency-Key. Включать, только когда gateway подтвердил
+    # поддержку ключа: иначе повтор создаст объекты второй раз. Пока флаг выключен, объекты, ответ на создание
+    # которых потерян, создаются повторно: поиска по pos_id в gateway нет, такие батчи только пишутся в лог
+    POS_GATEWAY_IDEMPOTENT_CREATES: bool = False
+    # сколько (сек) помнить отправленные батчи создания, чтобы повторить их с тем же ключом идемпотентности
+    POS_GATEWAY_PENDING_CREATE_TTL: int = 24 * 60 * 60
+    # обновления из синхронизации отправляются через gateway_outbox, см. src/services/gateway_outbox.py
+    GATEWAY_OUTBOX_BATCH_SIZE: int = 100
+    # сколько адресов gateway outbox отправляет параллельно
+    GATEWAY_OUTBOX_CONCURRENCY: int = 4
+    GATEWAY_OUTBOX_MAX_ATTEMPTS: int = 10
+    # задержка перед повтором записи (сек), удваивается с каждой попыткой
+    GATEWAY_OUTBOX_RETRY_DELAY: int = 30
+    GATEWAY_OUTBOX_LOCK_TIMEOUT: int = 10 * 60
 
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def check_db_connection(cls, v: str | None, values: dict[str, Any]) -> Any:
@@ -1,13 +1,15 @@
+from datetime import datetime
 from typing import TypeAlias, Sequence
 
-from sqlalchemy import update, select
+from sqlalchemy import update, select, or_, and_
 from starter_dto.pos.base import ObjectOut
 
 from src.core.repositories.schemas.client import ClientUpdate, ClientCreate
 from sqlalchemy.orm import Session
+from src.db import get_insert
 from src.exceptions import ObjectDoesNotExist
-from src.models import Client, Shop, Category, Project
-from src.utils.enums import Entity
+from src.models import Client, Shop, Category, Project, Order, GatewayOutbox
+from src.utils.enums import Entity, OutboxState, PaymentState
 
 
 PosId: TypeAlias = str
@@ -22,6 +24,50 @@ class ClientRepository:
     def get_active_clients(self) -> Sequence[Client]:
         return self.session.scalars(select(Client).where(Client.is_active.is_(True))).all()
 
+    def get_clients_for_status_poll(self, now: datetime) -> Sequence[Client]:
+        return self.session.scalars(
+            select(Client).where(
+                Client.is_active.is_(True),
+                or_(Client.next_status_poll_at.is_(None), Client.next_status_poll_at <= now),
+                select(Order.id).where(Order.client_id == Client.id, Order.done.is_(False)).exists(),
+            )
+        ).all()
+
+    def get_clients_with_due_payments(self, now: datetime, sent_before: datetime) -> Sequence[Client]:
+        return self.session.scalars(
+            select(Client).where(
+                Client.is_active.is_(True),
+                select(Order.id)
+                .where(
+                    Order.client_id == Client.id,
+                    or_(
+                        and_(Order.payment_state == PaymentState.PENDING, Order.payment_next_attempt_at <= now),
+                        and_(Order.payment_state == PaymentState.SENT, Order.payment_sent_at < sent_before),
+                    ),
+                )
+                .exists(),
+            )
+        ).all()
+
+    def get_clients_with_due_outbox(self, now: datetime) -> Sequence[Client]:
+        return self.session.scalars(
+            select(Client).where(
+                Client.is_active.is_(True),
+                select(GatewayOutbox.id)
+                .where(
+                    GatewayOutbox.client_id == Client.id,
+                    GatewayOutbox.state == OutboxState.PENDING,
+                    GatewayOutbox.next_attempt_at <= now,
+                )
+                .exists(),
+            )
+        ).all()
+
+    def set_next_status_poll_at(self, client_id: int, next_status_poll_at: datetime | None) -> None:
+        self.session.execute(
+            update(Client).where(Client.id == client_id).values(next_status_poll_at=next_status_poll_at)
+        )
+
     def update_client(self, client_id: int, client_update_data: ClientUpdate) -> None:
         client_data = client_update_data.dict(exclude_unset=True)
         if client_data:
@@ -47,6 +93,9 @@ class ClientRepository:
     def get_client_by_api_key(self, client_api_key: str) -> Client | None:
         return self.session.query(Client).where(Client.api_key == client_api_key).first()
 
+    def get_client_by_webhook_secret(self, webhook_secret: str) -> Client | None:
+        return self.session.query(Client).where(Client.webhook_secret == webhook_secret).first()
+
     def create_shops(self, client_id: int, shops_data: list[ObjectOut]) -> None:
         shops = [
             Shop(pos_id=shop_data.pos_id, starter_id=shop_data.id, client_id=client_id) for shop_data in shops_data
@@ -62,31 +111,32 @@ class ClientRepository:
         return client
 
     def get_or_create_client(self, client_data: ClientCreate, project_name: str) -> tuple[Client, bool]:
-        is_created = False
-
         try:
-            client = self.get_client_by_client_id(client_data.client_id)
+            return self.get_client_by_client_id(client_data.client_id), False
         except ObjectDoesNotExist:
-            is_created = True
-            project, _ = self.get_or_create_project(project_name)
-            client_data.project_id = project.id
-            client = Client(**client_data.dict(exclude_none=True))
-            self.session.add(client)
-            self.session.flush()
+            pass
 
-        return client, is_created
+        # параллельный вебхук мог создать клиента между select и insert
+        project, _ = self.get_or_create_project(project_name)
+        client_data.project_id = project.id
 
-    def get_or_create_project(self, project_name: str) -> tuple[Project, bool]:
-        is_created = False
-        project = self.session.query(Project).where(Project.title == project_name).first()
+        result = self.session.execute(
+            get_insert(self.session, Client)
+            .values(**client_data.dict(exclude_none=True))
+            .on_conflict_do_nothing(index_elements=[Client.client_id])
+        )
 
-        if not project:
-            is_created = True
-            project = Project(title=project_name)
-            self.session.add(project)
-            self.session.flush()
+        return self.get_client_by_client_id(client_data.client_id), bool(result.rowcount)
 
-        return project, is_created
+    def get_or_create_project(self, project_name: str) -> tuple[Project, bool]:
+        result = self.session.execute(
+            get_insert(self.session, Project)
+            .values(title=project_name)
+            .on_conflict_do_nothing(index_elements=[Project.title])
+        )
+        project = self.session.scalars(select(Project).where(Project.title == project_name)).one()
+
+        return project, bool(result.rowcount)
 
     def get_category_by_client_id_and_pos_ids(
         self, client_id: int, rkeeper_category_pos_ids: set[str]
@@ -47,10 +47,27 @@ class MenuRepository:
 
     def create_meal_offers(self, meals: list[MealOfferStarterCreated], shop_id: int) -> None:
         meal_offers = [
-            MealOffer(meal_id=meal.meal_id, pos_id=meal.pos_id, starter_id=meal.id, shop_id=shop_id) for meal in meals
+            MealOffer(
+                meal_id=meal.meal_id,
+                pos_id=meal.pos_id,
+                starter_id=meal.id,
+                shop_id=shop_id,
+                price=meal.price,
+                quantity=meal.quantity,
+                in_stop_list=meal.in_stop_list,
+            )
+            for meal in meals
         ]
         self.session.add_all(meal_offers)
 
+    def get_meal_offers_in_menu_by_shop_id(self, shop_id: int) -> Sequence[MealOffer]:
+        return self.session.scalars(
+            select(MealOffer)
+            .where(MealOffer.shop_id == shop_id, MealOffer.price.is_not(None))
+            .options(joinedload(MealOffer.meal))
+            .order_by(MealOffer.id)
+        ).all()
+
     def get_project_modifier_by_starter_ids(
         self, project_id: int, modifier_starter_ids: set[int]
     ) -> Sequence[Modifier]:
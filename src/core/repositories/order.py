@@ -1,11 +1,12 @@
+from datetime import datetime
 from typing import Sequence
 
-from sqlalchemy import update, select
+from sqlalchemy import update, select, func, insert, delete, literal
 from sqlalchemy.orm import Session
 
 from src.exceptions import ObjectDoesNotExist
-from src.models import Order
-from src.utils.enums import Entity
+from src.models import Order, OrderArchive
+from src.utils.enums import Entity, PaymentState
 
 
 class OrderRepository:
@@ -42,6 +43,11 @@ class OrderRepository:
     def get_not_done_orders(self, client_id: int) -> Sequence[Order]:
         return self.session.scalars(select(Order).where(Order.client_id == client_id, Order.done.is_(False))).all()
 
+    def get_latest_not_done_order_created_at(self, client_id: int) -> datetime | None:
+        return self.session.scalar(
+            select(func.max(Order.created_at)).where(Order.client_id == client_id, Order.done.is_(False))
+        )
+
     def set_order_to_done(self, client_id: int, order_pos_id: str) -> None:
         self.session.execute(
             update(Order).where(Order.client_id == client_id, Order.pos_id == order_pos_id).values(done=True)
@@ -59,3 +65,88 @@ class OrderRepository:
 
     def get_order_by_client_and_starter_id(self, client_id: int, starter_id: str) -> Order | None:
         return self.session.scalar(select(Order).where(Order.client_id == client_id, Order.starter_id == starter_id))
+
+    def get_order_by_client_and_pos_id(self, client_id: int, pos_id: str) -> Order | None:
+        return self.session.scalar(select(Order).where(Order.client_id == client_id, Order.pos_id == pos_id))
+
+    def expire_not_done_orders(self, created_before: datetime, limit: int) -> int:
+        order_ids = self.session.scalars(
+            select(Order.id)
+            .where(Order.done.is_(False), Order.created_at < created_before)
+            .order_by(Order.id)
+            .limit(limit)
+        ).all()
+        if not order_ids:
+            return 0
+
+        self.session.execute(update(Order).where(Order.id.in_(order_ids)).values(done=True, is_expired=True))
+        return len(order_ids)
+
+    def archive_done_orders(self, created_before: datetime, limit: int) -> int:
+        order_ids = self.session.scalars(
+            select(Order.id)
+            .where(Order.done.is_(True), Order.created_at < created_before)
+            .order_by(Order.id)
+            .limit(limit)
+        ).all()
+        if not order_ids:
+            return 0
+
+        archived_columns = [column.name for column in OrderArchive.__table__.columns if column.name != "archived_at"]
+        self.session.execute(
+            insert(OrderArchive).from_select(
+                [*archived_columns, "archived_at"],
+                select(
+                    *[Order.__table__.c[column] for column in archived_columns],
+                    literal(datetime.utcnow()),
+                ).where(Order.id.in_(order_ids)),
+            )
+        )
+        self.session.execute(delete(Order).where(Order.id.in_(order_ids)))
+
+        return len(order_ids)
+
+    def mark_order_payment_pending(self, order_id: int, now: datetime) -> None:
+        # оплату ставим в очередь один раз, повторные статусы из RKeeper ее не трогают
+        self.session.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.payment_state.is_(None))
+            .values(payment_state=PaymentState.PENDING, payment_next_attempt_at=now)
+        )
+
+    def confirm_order_payment(self, order_id: int) -> None:
+        self.session.execute(
+            update(Order)
+            .where(
+                Order.id == order_id,
+                Order.payment_state.in_([PaymentState.PENDING, PaymentState.SENT, PaymentState.ACCEPTED]),
+            )
+            .values(payment_state=PaymentState.CONFIRMED, payment_next_attempt_at=None)
+        )
+
+    def get_orders_with_stale_sent_payments(self, client_id: int, sent_before: datetime, limit: int) -> Sequence[Order]:
+        return self.session.scalars(
+            select(Order)
+            .where(
+                Order.client_id == client_id,
+                Order.payment_state == PaymentState.SENT,
+                Order.payment_sent_at < sent_before,
+            )
+            .order_by(Order.payment_sent_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+    def get_orders_with_due_payments(self, client_id: int, now: datetime, limit: int) -> Sequence[Order]:
+        return self.session.scalars(
+            select(Order)
+            .where(
+                Order.client_id == client_id,
+                Order.payment_state == PaymentState.PENDING,
+                Order.payment_next_attempt_at <= now,
+            )
+            .order_by(Order.payment_next_attempt_at)
+            .limit(limit)
+            # параллельный воркер пропустит заказы, которые уже забрали на оплату
+            .with_for_update(skip_locked=True)
+        ).all()
@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from src.models import GatewayOutbox
+from src.utils.enums import OutboxState
+
+
+class OutboxRepository:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def add(self, client_id: int, url: str, payload: bytes, items: int) -> None:
+        self.session.add(
+            GatewayOutbox(
+                client_id=client_id,
+                url=url,
+                payload=payload,
+                items=items,
+                state=OutboxState.PENDING,
+                next_attempt_at=datetime.utcnow(),
+            )
+        )
+
+    def get_pending(self, client_id: int, limit: int) -> Sequence[GatewayOutbox]:
+        # в порядке записи: обновления одного адреса должны уйти в gateway в том же порядке
+        return self.session.scalars(
+            select(GatewayOutbox)
+            .where(GatewayOutbox.client_id == client_id, GatewayOutbox.state == OutboxState.PENDING)
+            .order_by(GatewayOutbox.id)
+            .limit(limit)
+        ).all()
+
+    def delete(self, ids: Sequence[int]) -> None:
+        if ids:
+            self.session.execute(delete(GatewayOutbox).where(GatewayOutbox.id.in_(ids)))
@@ -24,6 +24,9 @@ class ClientCreate(ClientUpdate):
 
 class MealOfferStarterCreated(ObjectOut):
     meal_id: int
+    price: float | None = None
+    quantity: float | None = None
+    in_stop_list: bool = False
 
 
 class MealStarterCreated(ObjectOut):
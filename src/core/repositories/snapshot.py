@@ -0,0 +1,91 @@
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from src.models import RkeeperSnapshot
+from src.utils.enums import SnapshotKind
+
+
+class SnapshotRepository:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def add(
+        self,
+        client_id: int,
+        kind: SnapshotKind,
+        shop_pos_id: str | None,
+        fingerprint: str,
+        content: bytes,
+        size: int,
+    ) -> None:
+        self.session.add(
+            RkeeperSnapshot(
+                client_id=client_id,
+                kind=kind,
+                shop_pos_id=shop_pos_id,
+                fingerprint=fingerprint,
+                content=content,
+                size=size,
+            )
+        )
+
+    def get(self, snapshot_id: int) -> RkeeperSnapshot | None:
+        return self.session.get(RkeeperSnapshot, snapshot_id)
+
+    def get_latest(
+        self,
+        client_id: int,
+        kind: SnapshotKind,
+        shop_pos_id: str | None = None,
+        created_before: datetime | None = None,
+    ) -> RkeeperSnapshot | None:
+        query = select(RkeeperSnapshot).where(
+            RkeeperSnapshot.client_id == client_id,
+            RkeeperSnapshot.kind == kind,
+            RkeeperSnapshot.shop_pos_id == shop_pos_id
+            if shop_pos_id is not None
+            else RkeeperSnapshot.shop_pos_id.is_(None),
+        )
+        if created_before:
+            query = query.where(RkeeperSnapshot.created_at <= created_before)
+        return self.session.scalars(query.order_by(RkeeperSnapshot.id.desc()).limit(1)).first()
+
+    def get_latest_fingerprint(self, client_id: int, kind: SnapshotKind, shop_pos_id: str | None) -> str | None:
+        # без content: сжатое меню может весить мегабайты
+        return self.session.scalars(
+            select(RkeeperSnapshot.fingerprint)
+            .where(
+                RkeeperSnapshot.client_id == client_id,
+                RkeeperSnapshot.kind == kind,
+                RkeeperSnapshot.shop_pos_id == shop_pos_id
+                if shop_pos_id is not None
+                else RkeeperSnapshot.shop_pos_id.is_(None),
+            )
+            .order_by(RkeeperSnapshot.id.desc())
+            .limit(1)
+        ).first()
+
+    def get_list(
+        self, client_id: int, kind: SnapshotKind | None = None, shop_pos_id: str | None = None, limit: int = 20
+    ) -> Sequence[RkeeperSnapshot]:
+        query = select(RkeeperSnapshot).where(RkeeperSnapshot.client_id == client_id)
+        if kind:
+            query = query.where(RkeeperSnapshot.kind == kind)
+        if shop_pos_id:
+            query = query.where(RkeeperSnapshot.shop_pos_id == shop_pos_id)
+        return self.session.scalars(query.order_by(RkeeperSnapshot.id.desc()).limit(limit)).all()
+
+    def delete_created_before(self, created_before: datetime, limit: int) -> int:
+        snapshot_ids = self.session.scalars(
+            select(RkeeperSnapshot.id)
+            .where(RkeeperSnapshot.created_at < created_before)
+            .order_by(RkeeperSnapshot.id)
+            .limit(limit)
+        ).all()
+        if snapshot_ids:
+            self.session.execute(delete(RkeeperSnapshot).where(RkeeperSnapshot.id.in_(snapshot_ids)))
+
+        return len(snapshot_ids)
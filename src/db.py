@@ -1,5 +1,9 @@
+from typing import Any
+
 from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
 
 from src.config import settings
@@ -20,3 +24,11 @@ meta = MetaData(
     }
 )
 Base = declarative_base(metadata=meta)
+
+
+def get_insert(session: Session, model: Any) -> Any:
+    # on_conflict_do_nothing есть только у диалектных insert, в тестах используется sqlite
+    if session.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model)
+
+    return postgresql_insert(model)
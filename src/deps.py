@@ -39,3 +39,21 @@ def get_client_by_api_key(
         return client
 
     raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Not valid credentials")
+
+
+def get_client_by_webhook_secret(
+    authorization: str = Security(
+        APIKeyHeader(
+            name="Authorization",
+            description="Ключ вебхука клиента (client.webhook_secret), выдается при подключении RKeeper. "
+            "Передается в заголовках запросов в виде `{'Authorization': $WEBHOOK_SECRET}`",
+            auto_error=True,
+        )
+    ),
+    db: Session = Depends(get_db),
+) -> Client:
+    client = ClientRepository(db).get_client_by_webhook_secret(authorization)
+    if client:
+        return client
+
+    raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Not valid credentials")
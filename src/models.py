@@ -1,6 +1,8 @@
 import hashlib
+import secrets
+from datetime import datetime
 
-from sqlalchemy import String, Boolean, ForeignKey, Float, Integer
+from sqlalchemy import String, Boolean, ForeignKey, Float, Integer, DateTime, Index, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.db import Base
@@ -26,6 +28,10 @@ class Client(Base):
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, server_default="true")
 
     api_key: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    # ключ вебхука статусов заказов от RKeeper. api_key знает только gateway, RKeeper его не получает
+    webhook_secret: Mapped[str] = mapped_column(
+        String, nullable=False, unique=True, default=lambda: secrets.token_urlsafe(32)
+    )
 
     currency_code: Mapped[str] = mapped_column(String, nullable=True)
     discount_id: Mapped[int] = mapped_column(Integer, nullable=True)
@@ -40,6 +46,8 @@ class Client(Base):
     is_skip_update_order_payment_status: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
     is_use_minus_for_discount_amount: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
 
+    next_status_poll_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
     shops: Mapped[list["Shop"]] = relationship("Shop", back_populates="client")
     categories: Mapped[list["Category"]] = relationship("Category", back_populates="client")
     modifiers: Mapped[list["Modifier"]] = relationship("Modifier", back_populates="client")
@@ -109,6 +117,11 @@ class MealOffer(Base):
     shop_id: Mapped[int] = mapped_column(ForeignKey("shop.id"), nullable=False)
     shop: Mapped[Shop] = relationship("Shop", cascade="all, delete", back_populates="meal_offers")
 
+    # последнее, что выгружено в gateway. price пустой, пока предложение не в меню: остатки такому не отправляем
+    price: Mapped[float] = mapped_column(Float, nullable=True)
+    quantity: Mapped[float] = mapped_column(Float, nullable=True)
+    in_stop_list: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
+
     def __repr__(self) -> str:
         return f"MealOffer(id={self.id}, meal_id={self.meal_id}, starter_id={self.starter_id}, pos_id={self.pos_id})"
 
@@ -208,6 +221,10 @@ class ModifierGroup(Base):
 
 class Order(Base):
     __tablename__ = "order"
+    __table_args__ = (
+        Index("ix_order_client_id_done", "client_id", "done"),
+        Index("ix_order_payment_state_payment_next_attempt_at", "payment_state", "payment_next_attempt_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -216,7 +233,15 @@ class Order(Base):
     bonuses: Mapped[float] = mapped_column(Float, nullable=False)
     is_paid: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
     done: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
+    is_expired: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
     discount_price: Mapped[float] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    # PaymentState, пустой у заказов без онлайн-оплаты
+    payment_state: Mapped[str | None] = mapped_column(String, nullable=True)
+    payment_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    payment_next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # когда оплату последний раз отправили в RKeeper, по нему находятся зависшие в PaymentState.SENT заказы
+    payment_sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     client_id: Mapped[int] = mapped_column(ForeignKey("client.id"))
     client: Mapped[Client] = relationship("Client", cascade="all, delete", back_populates="orders")
@@ -225,6 +250,82 @@ class Order(Base):
         return f"Order(id={self.id}, client_id={self.client_id}, pos_id={self.pos_id}, starter_id={self.starter_id}, done={self.done})"
 
 
+class OrderArchive(Base):
+    __tablename__ = "order_archive"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+
+    pos_id: Mapped[str] = mapped_column(String, nullable=False)
+    starter_id: Mapped[str] = mapped_column(String, nullable=False)
+    bonuses: Mapped[float] = mapped_column(Float, nullable=False)
+    is_paid: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    done: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    is_expired: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    discount_price: Mapped[float] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    payment_state: Mapped[str | None] = mapped_column(String, nullable=True)
+    payment_attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), index=True)
+
+    def __repr__(self) -> str:
+        return f"OrderArchive(id={self.id}, client_id={self.client_id}, pos_id={self.pos_id}, starter_id={self.starter_id})"
+
+
+class RkeeperSnapshot(Base):
+    """Ответ RKeeper как есть, сжатый zstd, см. src/services/rkeeper_snapshots.py"""
+
+    __tablename__ = "rkeeper_snapshot"
+    __table_args__ = (
+        Index("ix_rkeeper_snapshot_client_id_kind_shop_pos_id", "client_id", "kind", "shop_pos_id"),
+        Index("ix_rkeeper_snapshot_created_at", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # SnapshotKind
+    kind: Mapped[str] = mapped_column(String, nullable=False)
+    # пустой у ответов, общих для всех магазинов клиента
+    shop_pos_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    # sha256 несжатого ответа
+    fingerprint: Mapped[str] = mapped_column(String, nullable=False)
+    content: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"RkeeperSnapshot(id={self.id}, client_id={self.client_id}, kind={self.kind}, shop={self.shop_pos_id})"
+
+
+class GatewayOutbox(Base):
+    """Запись в gateway, сохраненная в одной транзакции с синхронизацией, см. src/services/gateway_outbox.py"""
+
+    __tablename__ = "gateway_outbox"
+    __table_args__ = (Index("ix_gateway_outbox_client_id_state", "client_id", "state"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # адрес относительно POS_GATEWAY_URL, например shop/1/meals
+    url: Mapped[str] = mapped_column(String, nullable=False)
+    # json-массив объектов в формате gateway
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    items: Mapped[int] = mapped_column(Integer, nullable=False)
+    # OutboxState, отправленные записи удаляются
+    state: Mapped[str] = mapped_column(String, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"GatewayOutbox(id={self.id}, client_id={self.client_id}, url={self.url}, state={self.state})"
+
+
 class Discount(Base):
     __tablename__ = "discount"
 
@@ -163,6 +163,12 @@ class RKeeperMeal(Base):
             **self.dict(exclude={"external_id", "pos_id"}),
         )
 
+    def is_in_stop_list(self, pos_shop_id: str) -> bool:
+        return bool(self.is_contain_in_stop_list and pos_shop_id in self.is_contain_in_stop_list)
+
+    def get_offer_quantity(self, pos_shop_id: str) -> float | None:
+        return 0 if self.is_in_stop_list(pos_shop_id) else self.quantity
+
     def convert_to_pos_updater(self, starter_id: int, category_starter_id: int) -> pos.UpdateMeal:
         return pos.UpdateMeal(
             id=starter_id,
@@ -174,9 +180,8 @@ class RKeeperMeal(Base):
     def convert_to_meal_offer_creator(
         self, pos_id: str, meal_starter_id: int, pos_shop_id: str
     ) -> pos.menu.CreateMealOffer:
-        is_in_stop_list = self.is_contain_in_stop_list and pos_shop_id in self.is_contain_in_stop_list
         return pos.menu.CreateMealOffer(
-            quantity=0 if is_in_stop_list else self.quantity,
+            quantity=self.get_offer_quantity(pos_shop_id),
             price=self.price,
             meal_id=meal_starter_id,
             pos_id=pos_id,
@@ -185,9 +190,8 @@ class RKeeperMeal(Base):
     def convert_to_meal_offer_updater(
         self, starter_id: int, meal_starter_id: int, pos_shop_id: str
     ) -> pos.menu.UpdateMealOffer:
-        is_in_stop_list = self.is_contain_in_stop_list and pos_shop_id in self.is_contain_in_stop_list
         return pos.menu.UpdateMealOffer(
-            quantity=0 if is_in_stop_list else self.quantity,
+            quantity=self.get_offer_quantity(pos_shop_id),
             price=self.price,
             meal_id=meal_starter_id,
             id=starter_id,
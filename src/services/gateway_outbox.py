@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
+
+import orjson
+from redis.exceptions import LockError
+from sqlalchemy.orm import Session
+
+from src.clients.pos_client import PosGatewayClient, PosGatewayClientError
+from src.config import settings
+from src.core.repositories.outbox import OutboxRepository
+from src.logger import get_logger
+from src.models import Client, GatewayOutbox
+from src.services.redis_client import Storage
+from src.utils.enums import OutboxState
+from src.utils.serialization import dumps
+
+logger = get_logger("gateway_outbox")
+
+
+class OutboxPosGatewayClient(PosGatewayClient):
+    """
+    Для синхронизации: обновления не отправляются в gateway сразу, а записываются в gateway_outbox в той же
+    транзакции, что и изменения в БД, и уходят в gateway после коммита (GatewayOutboxDispatcher).
+    Создание объектов по-прежнему отправляется сразу: следующим этапам синхронизации нужны id, которые выдает gateway.
+    """
+
+    def __init__(self, api_key: str, session: Session, client_id: int, storage: Storage | None = None):
+        super().__init__(api_key, storage)
+        self.client_id = client_id
+        self.outbox_repo = OutboxRepository(session)
+
+    def _put_batches(self, items: list, url: str, event: str) -> None:
+        if not items:
+            return
+
+        logger.debug(event, items=len(items), url=url)
+        self.outbox_repo.add(self.client_id, url, dumps(items), len(items))
+
+
+class GatewayOutboxDispatcher:
+    """
+    Отправляет в gateway записи из gateway_outbox. Записи одного адреса уходят по порядку, чтобы старое обновление
+    не затерло новое, разные адреса отправляются параллельно. Отправленные записи удаляются, неудачные повторяются
+    с экспоненциальной задержкой, после GATEWAY_OUTBOX_MAX_ATTEMPTS попыток помечаются OutboxState.FAILED.
+    Объекты, которые gateway отклонил, отбрасываются так же, как при прямой отправке (POS_GATEWAY_REJECTED_TTL).
+    """
+
+    def __init__(self, session: Session, client: Client, log: Any = None, storage: Storage | None = None):
+        self.session = session
+        self.client = client
+        self.storage = storage or Storage()
+        self.pos_gateway = PosGatewayClient(client.api_key, self.storage)
+        self.outbox_repo = OutboxRepository(session)
+        self.log = log or logger
+
+    def dispatch(self) -> int:
+        # один клиент отправляет один воркер, иначе записи одного адреса могут уйти не по порядку
+        lock = self.storage.lock(f"gateway_outbox:{self.client.client_id}", settings.GATEWAY_OUTBOX_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            self.log.info("Gateway outbox is dispatched by another worker")
+            return 0
+
+        try:
+            sent_count = 0
+            # записи, которые синхронизация добавила во время отправки, уходят в этом же запуске
+            while sent := self._dispatch_batch(datetime.utcnow()):
+                sent_count += sent
+            return sent_count
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                self.log.warn("Gateway outbox lock has expired")
+
+    def _dispatch_batch(self, now: datetime) -> int:
+        queues: dict[str, list[GatewayOutbox]] = {}
+        blocked_urls = set()
+        for entry in self.outbox_repo.get_pending(self.client.id, settings.GATEWAY_OUTBOX_BATCH_SIZE):
+            # запись ждет повтора: более новые записи того же адреса ждут вместе с ней
+            if entry.url in blocked_urls or entry.next_attempt_at > now:
+                blocked_urls.add(entry.url)
+                continue
+            queues.setdefault(entry.url, []).append(entry)
+        if not queues:
+            return 0
+
+        # в потоки передаем только данные, сессия остается в основном потоке
+        jobs = [(url, [entry.payload for entry in entries]) for url, entries in queues.items()]
+        with ThreadPoolExecutor(max_workers=settings.GATEWAY_OUTBOX_CONCURRENCY) as executor:
+            results = list(executor.map(lambda job: self._send(*job), jobs))
+
+        sent_count = 0
+        for entries, (sent, error) in zip(queues.values(), results):
+            self.outbox_repo.delete([entry.id for entry in entries[:sent]])
+            sent_count += sent
+            if error is not None:
+                self._schedule_retry(entries[sent], now, error)
+        self.session.commit()
+
+        self.log.info("Gateway outbox dispatched", sent=sent_count, urls=len(queues))
+        return sent_count
+
+    def _send(self, url: str, payloads: list[bytes]) -> tuple[int, str | None]:
+        """Сколько записей отправлено подряд и ошибка, на которой отправка остановилась"""
+        for sent, payload in enumerate(payloads):
+            try:
+                self.pos_gateway.put_items(url, orjson.loads(payload))
+            except PosGatewayClientError as e:
+                self.log.error("Gateway outbox error", url=url, error=repr(e))
+                return sent, repr(e)
+
+        return len(payloads), None
+
+    def _schedule_retry(self, entry: GatewayOutbox, now: datetime, error: str) -> None:
+        entry.attempts += 1
+        entry.error = error
+        if entry.attempts >= settings.GATEWAY_OUTBOX_MAX_ATTEMPTS:
+            entry.state = OutboxState.FAILED
+            self.log.error("Gateway outbox entry failed", url=entry.url, attempts=entry.attempts, error=error)
+            return
+
+        entry.next_attempt_at = now + timedelta(seconds=settings.GATEWAY_OUTBOX_RETRY_DELAY * 2 ** (entry.attempts - 1))
@@ -7,6 +7,7 @@ from starter_dto.enum import PaymentStatus, PaymentMethod
 
 from src.api.order import OrderWithCtx
 from src.clients.rkeeper_client import RkeeperClient
+from src.config import settings
 from src.core.repositories.client import ClientRepository
 from sqlalchemy.orm import Session
 
@@ -17,7 +18,9 @@ from src.logger import get_logger
 from src.models import Client
 from src.repositories import DiscountRepository
 from src.schemas.rkeeper import RKeeperGuest, RKeeperOrder, RKeeperOrderItems, DiscountInList, OrderDraftDiscounts
+from src.utils.deadline import Deadline
 from src.utils.enums import Entity
+from src.utils.serialization import Payload
 
 
 RkeeperOrderId: TypeAlias = str
@@ -36,7 +39,9 @@ class OrderService:
         self.order_repo = OrderRepository(self.db)
         self.rkeeper_client = RkeeperClient(self.client)
 
-    def create_order(self, starter_order: OrderWithCtx) -> RkeeperOrderId:
+    def create_order(self, starter_order: OrderWithCtx, deadline: Deadline | None = None) -> RkeeperOrderId:
+        # все запросы в RKeeper по заказу укладываются в один срок
+        deadline = deadline or Deadline.after(settings.ORDER_DEADLINE)
         restaurant_id = self.client_repo.get_shop_by_starter_id(self.client.id, starter_order.shop_id).pos_id
         self.log.info("Restaurant id", restaurant_id=restaurant_id)
 
@@ -60,7 +65,7 @@ class OrderService:
             rkeeper_order.comment = f"ОПЛАЧЕН {rkeeper_order.comment if rkeeper_order.comment else ''}"
 
         self.process_items(starter_order, rkeeper_order)
-        self.use_loyalty_and_split_order_items(starter_order, rkeeper_order)
+        self.use_loyalty_and_split_order_items(starter_order, rkeeper_order, deadline)
 
         if starter_order.is_preorder and starter_order.delivery_datetime:
             delivery_datetime = starter_order.delivery_datetime
@@ -73,14 +78,17 @@ class OrderService:
             rkeeper_order.delivery_datetime = None
             rkeeper_order.soonest = True
 
+        # заказ сериализуется один раз для спана, логов и тела запроса
+        payload = Payload(rkeeper_order)
         with tracer.start_as_current_span("order send") as send_span:
-            send_span.set_attribute("rkeeper.order", rkeeper_order.json(by_alias=True))
+            send_span.set_attribute("rkeeper.order", payload.text)
             self.log.info(
                 "Order for rkeeper",
-                rkeeper_order=rkeeper_order.json(by_alias=True),
+                rkeeper_order=payload.text,
                 client_id=self.client.client_id,
             )
-            rkeeper_order_id = self.rkeeper_client.create_order(rkeeper_order)
+            send_span.set_attribute("deadline.remaining", deadline.remaining())
+            rkeeper_order_id = self.rkeeper_client.create_order(rkeeper_order, payload=payload, deadline=deadline)
             send_span.set_attribute("rkeeper.order.id", rkeeper_order_id)
 
         self.order_repo.create_order(
@@ -91,11 +99,13 @@ class OrderService:
             is_paid,
             starter_order.discount_price,
         )
+        # новый заказ должен попасть в ближайший опрос статусов
+        self.client_repo.set_next_status_poll_at(self.client.id, None)
         self.log.info(
             "Order created in RKeeper",
             pos_id=rkeeper_order_id,
             global_id=starter_order.global_id,
-            rkeeper_order=rkeeper_order.json(by_alias=True),
+            rkeeper_order=payload.text,
         )
 
         return rkeeper_order_id
@@ -232,13 +242,15 @@ class OrderService:
 
                     ingredient.external_id = modifier_pos_id
 
-    def use_loyalty_and_split_order_items(self, starter_order: OrderWithCtx, rkeeper_order: RKeeperOrder) -> None:
+    def use_loyalty_and_split_order_items(
+        self, starter_order: OrderWithCtx, rkeeper_order: RKeeperOrder, deadline: Deadline | None = None
+    ) -> None:
         # метод предварительного расчета вызываем, чтоб получить discounts
         if self.client.is_use_loyalty:
             rkeeper_order.use_loyalty = True
             rkeeper_order.use_loyalty_bonus_payments = True if starter_order.bonuses else False
             rkeeper_order.phone = "+" + starter_order.user_phone
-            order_draft = self.rkeeper_client.preliminary_calculation(rkeeper_order)
+            order_draft = self.rkeeper_client.preliminary_calculation(rkeeper_order, deadline)
             rkeeper_order.loyalty_calculation = order_draft.loyalty_amount
 
         # beanhearts просит, чтобы несколько одинаковых блюл шли разными объектами с кол-вом 1,
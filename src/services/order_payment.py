@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
+
+from httpx import HTTPError
+from sqlalchemy.orm import Session
+
+from src.clients.circuit_breaker import CircuitOpenError
+from src.clients.rate_limiter import RateLimitExceededError
+from src.clients.rkeeper_client import RkeeperClient
+from src.config import settings
+from src.core.repositories.order import OrderRepository
+from src.logger import get_logger
+from src.models import Client, Order
+from src.schemas.rkeeper import RkeeperPaymentStatusEnum
+from src.utils.enums import PaymentState
+
+
+class OrderPaymentSettlement:
+    """
+    Проводит в RKeeper онлайн-оплату заказов, которые синхронизация статусов поставила в очередь (PaymentState.PENDING).
+    Оплата отправляется не больше одного раза за попытку, неудачные попытки повторяются с экспоненциальной задержкой.
+    Принятая RKeeper оплата (PaymentState.ACCEPTED) больше не отправляется. Заказ, оставшийся в PaymentState.SENT
+    без ответа RKeeper (воркер упал после commit), перед повтором сверяется со статусом заказа в RKeeper.
+    """
+
+    def __init__(self, session: Session, client: Client, log: Any = None):
+        self.session = session
+        self.client = client
+        self.rkeeper = RkeeperClient(client)
+        self.order_repo = OrderRepository(session)
+        self.log = log or get_logger("order_payment")
+
+    def settle(self, now: datetime | None = None) -> int:
+        now = now or datetime.utcnow()
+        # токен получаем до захвата заказов (FOR UPDATE держится до коммита) и в основном потоке,
+        # иначе его запросит каждый поток
+        self.rkeeper.token
+        orders = self.order_repo.get_orders_with_due_payments(self.client.id, now, settings.ORDER_PAYMENT_BATCH_SIZE)
+        if not orders:
+            return 0
+
+        # заказ помечается отправленным до запроса в RKeeper, чтобы упавший воркер не провел оплату второй раз
+        for order in orders:
+            order.payment_state = PaymentState.SENT
+            order.payment_attempts += 1
+            order.payment_next_attempt_at = None
+            order.payment_sent_at = now
+        pos_ids = [order.pos_id for order in orders]
+        self.session.commit()
+
+        with ThreadPoolExecutor(max_workers=settings.ORDER_PAYMENT_CONCURRENCY) as executor:
+            errors = list(executor.map(self._pay, pos_ids))
+
+        sent_count = 0
+        for order, error in zip(orders, errors):
+            if error is None:
+                order.payment_state = PaymentState.ACCEPTED
+                sent_count += 1
+            else:
+                self._schedule_retry(order, now, error)
+        self.session.commit()
+
+        self.log.info("Order payments sent", sent=sent_count, failed=len(orders) - sent_count)
+        return sent_count
+
+    def recover(self, now: datetime | None = None) -> int:
+        """
+        Заказы, которые остались в PaymentState.SENT дольше ORDER_PAYMENT_SENT_TIMEOUT: ответа RKeeper на оплату нет.
+        Оплаченные по статусу RKeeper подтверждаются, неоплаченные возвращаются в очередь. Заказ, которого нет
+        в ответе RKeeper, помечается PaymentState.FAILED: оплачен ли он, неизвестно, а повтор может списать дважды.
+        """
+        now = now or datetime.utcnow()
+        sent_before = now - timedelta(seconds=settings.ORDER_PAYMENT_SENT_TIMEOUT)
+        orders = self.order_repo.get_orders_with_stale_sent_payments(
+            self.client.id, sent_before, settings.ORDER_PAYMENT_BATCH_SIZE
+        )
+        if not orders:
+            return 0
+
+        status_of_orders = {status_order.order_id: status_order for status_order in self.rkeeper.get_status_of_orders()}
+        for order in orders:
+            status_order = status_of_orders.get(order.pos_id)
+            if status_order is None:
+                order.payment_state = PaymentState.FAILED
+                self.log.error("Payment state is unknown", order_id=order.pos_id, attempts=order.payment_attempts)
+            elif status_order.payment_status == RkeeperPaymentStatusEnum.PAID:
+                order.payment_state = PaymentState.CONFIRMED
+            else:
+                self._schedule_retry(order, now, "no payment response")
+        self.session.commit()
+
+        self.log.warn("Stale sent order payments recovered", count=len(orders))
+        return len(orders)
+
+    def _pay(self, pos_id: str) -> str | None:
+        try:
+            json = self.rkeeper.order_payment(pos_id)
+        except (HTTPError, CircuitOpenError, RateLimitExceededError) as e:
+            self.log.error("Payment error", order_id=pos_id, exc_info=str(e))
+            return str(e)
+
+        if "errors" in json:
+            self.log.warn("Payment error", order_id=pos_id, json=json)
+            return str(json)
+
+        return None
+
+    def _schedule_retry(self, order: Order, now: datetime, error: str) -> None:
+        if order.payment_attempts >= settings.ORDER_PAYMENT_MAX_ATTEMPTS:
+            order.payment_state = PaymentState.FAILED
+            self.log.error("Payment failed", order_id=order.pos_id, attempts=order.payment_attempts, error=error)
+            return
+
+        delay = settings.ORDER_PAYMENT_RETRY_DELAY * 2 ** (order.payment_attempts - 1)
+        order.payment_state = PaymentState.PENDING
+        order.payment_next_attempt_at = now + timedelta(seconds=delay)
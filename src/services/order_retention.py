@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.core.repositories.order import OrderRepository
+from src.logger import get_logger
+
+
+class OrderRetention:
+    """
+    Держит таблицу order маленькой: незавершенные заказы, по которым RKeeper так и не прислал финальный статус,
+    закрываются по таймауту, старые завершенные заказы переносятся в order_archive.
+    """
+
+    def __init__(self, session: Session, log: Any = None):
+        self.session = session
+        self.order_repo = OrderRepository(session)
+        self.log = log or get_logger("order_retention")
+
+    def expire(self, now: datetime | None = None, batch_size: int = settings.ORDER_EXPIRE_BATCH_SIZE) -> int:
+        created_before = (now or datetime.utcnow()) - timedelta(hours=settings.ORDER_EXPIRE_AFTER_HOURS)
+        expired_count = 0
+        while batch_count := self.order_repo.expire_not_done_orders(created_before, batch_size):
+            self.session.commit()
+            expired_count += batch_count
+            self.log.info("Not done orders expired", count=expired_count, created_before=created_before)
+
+        return expired_count
+
+    def archive(self, now: datetime | None = None, batch_size: int = settings.ORDER_ARCHIVE_BATCH_SIZE) -> int:
+        created_before = (now or datetime.utcnow()) - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        archived_count = 0
+        while batch_count := self.order_repo.archive_done_orders(created_before, batch_size):
+            self.session.commit()
+            archived_count += batch_count
+            self.log.info("Orders archived", count=archived_count, created_before=created_before)
+
+        return archived_count
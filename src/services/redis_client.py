@@ -1,4 +1,8 @@
+import time
+from typing import Iterable
+
 from redis import Redis
+from redis.lock import Lock
 
 from src.config import settings
 from src.logger import get_logger
@@ -18,3 +22,79 @@ class Storage:
 
     def set_order_cache(self, global_id: str, ex: int = 10) -> None:
         self.redis.set(global_id, 1, ex=ex)
+
+    def lock(
+        self, name: str, timeout: int = settings.LOCK_TIMEOUT, blocking_timeout: float = settings.LOCK_BLOCKING_TIMEOUT
+    ) -> Lock:
+        # timeout снимает блокировку, если взявший ее процесс умер
+        return self.redis.lock(f"lock:{name}", timeout=timeout, blocking_timeout=blocking_timeout)
+
+    def get_rejected_items(self, key: str) -> set[str]:
+        # score - время, до которого объект не отправляем
+        now = time.time()
+        self.redis.zremrangebyscore(f"rejected:{key}", "-inf", now)
+        return {item.decode() for item in self.redis.zrangebyscore(f"rejected:{key}", now, "+inf")}
+
+    def add_rejected_items(self, key: str, digests: Iterable[str], ex: int) -> None:
+        if mapping := {digest: time.time() + ex for digest in digests}:
+            self.redis.zadd(f"rejected:{key}", mapping)
+            self.redis.expire(f"rejected:{key}", ex)
+
+    def get_pending_creates(self, key: str, pos_ids: Iterable[str]) -> dict[str, bytes]:
+        """Батчи создания, ответ на которые мог потеряться, с этими pos_id: ключ идемпотентности -> тело запроса"""
+        idempotency_keys = self._get_pending_create_keys(key, pos_ids)
+        if not idempotency_keys:
+            return {}
+
+        contents = self.redis.mget(
+            [f"pending_create:{key}:batch:{idempotency_key}" for idempotency_key in idempotency_keys]
+        )
+        return {
+            idempotency_key: content
+            for idempotency_key, content in zip(idempotency_keys, contents)
+            if content is not None
+        }
+
+    def add_pending_create(
+        self, key: str, idempotency_key: str, pos_ids: Iterable[str], content: bytes, ex: int
+    ) -> None:
+        # у каждого pos_id своя запись со своим сроком: общий hash продлевался бы каждым батчем и рос без конца
+        pipeline = self.redis.pipeline(transaction=False)
+        for pos_id in pos_ids:
+            pipeline.set(f"pending_create:{key}:item:{pos_id}", idempotency_key, ex=ex)
+        pipeline.set(f"pending_create:{key}:batch:{idempotency_key}", content, ex=ex)
+        pipeline.execute()
+
+    def clear_pending_creates(self, key: str, pos_ids: Iterable[str]) -> None:
+        """Объекты сохранены в БД: их батчи больше не повторяем"""
+        pos_ids = list(pos_ids)
+        idempotency_keys = self._get_pending_create_keys(key, pos_ids)
+        names = [f"pending_create:{key}:item:{pos_id}" for pos_id in pos_ids]
+        names += [f"pending_create:{key}:batch:{idempotency_key}" for idempotency_key in idempotency_keys]
+        if names:
+            self.redis.delete(*names)
+
+    def _get_pending_create_keys(self, key: str, pos_ids: Iterable[str]) -> set[str]:
+        if not (pos_ids := list(pos_ids)):
+            return set()
+        return {
+            item.decode()
+            for item in self.redis.mget([f"pending_create:{key}:item:{pos_id}" for pos_id in pos_ids])
+            if item
+        }
+
+    def get_sync_checkpoint(self, key: str, fingerprint: str) -> set[str]:
+        """Этапы синхронизации, завершенные для этих же данных. Чекпоинт других данных не считается"""
+        checkpoint = self.redis.hgetall(f"sync_checkpoint:{key}")
+        if checkpoint.pop(b"fingerprint", b"").decode() != fingerprint:
+            return set()
+        return {stage.decode() for stage in checkpoint}
+
+    def add_sync_checkpoint(self, key: str, fingerprint: str, stage: str, ex: int) -> None:
+        if self.redis.hget(f"sync_checkpoint:{key}", "fingerprint") != fingerprint.encode():
+            self.redis.delete(f"sync_checkpoint:{key}")
+        self.redis.hset(f"sync_checkpoint:{key}", mapping={"fingerprint": fingerprint, stage: 1})
+        self.redis.expire(f"sync_checkpoint:{key}", ex)
+
+    def clear_sync_checkpoint(self, key: str) -> None:
+        self.redis.delete(f"sync_checkpoint:{key}")
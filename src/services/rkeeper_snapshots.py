@@ -0,0 +1,93 @@
+import hashlib
+from datetime import datetime, timedelta
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, Callable
+
+import zstandard
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.core.repositories.snapshot import SnapshotRepository
+from src.db import SessionLocal
+from src.logger import get_logger
+from src.models import RkeeperSnapshot
+from src.utils.enums import SnapshotKind
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class RkeeperSnapshots:
+    """
+    Ответы RKeeper как есть, сжатые zstd: по ним разбирают инциденты и повторяют синхронизацию без запросов
+    в RKeeper (cli.py replay-snapshot). Одинаковый с предыдущим ответ не сохраняется, снимок старше
+    RKEEPER_SNAPSHOT_RETENTION_DAYS удаляет expire_rkeeper_snapshots.
+    """
+
+    def __init__(self, client_id: int, session_factory: Callable[[], Session] = SessionLocal, log: Any = None):
+        self.client_id = client_id
+        self.session_factory = session_factory
+        self.log = log or get_logger("rkeeper_snapshots")
+
+    def record(
+        self, kind: SnapshotKind, shop_pos_id: str | None, content: bytes | IO[bytes], fingerprint: str | None = None
+    ) -> None:
+        # снимок пишется в своей транзакции: ответ, на котором синхронизация упала, нужнее всего.
+        # Ошибка записи синхронизацию не останавливает
+        file = BytesIO(content) if isinstance(content, bytes) else content
+        try:
+            fingerprint = fingerprint or get_fingerprint(file)
+            with self.session_factory() as session:
+                snapshot_repo = SnapshotRepository(session)
+                if snapshot_repo.get_latest_fingerprint(self.client_id, kind, shop_pos_id) == fingerprint:
+                    return
+
+                compressed, size = compress(file)
+                snapshot_repo.add(self.client_id, kind, shop_pos_id, fingerprint, compressed, size)
+                session.commit()
+        except Exception as e:
+            self.log.warn("Could not save rkeeper snapshot", kind=kind, shop=shop_pos_id, error=repr(e))
+        finally:
+            file.seek(0)
+
+
+def get_fingerprint(file: IO[bytes]) -> str:
+    file.seek(0)
+    content_hash = hashlib.sha256()
+    while chunk := file.read(CHUNK_SIZE):
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def compress(file: IO[bytes]) -> tuple[bytes, int]:
+    file.seek(0)
+    compressor = zstandard.ZstdCompressor(level=settings.RKEEPER_SNAPSHOT_COMPRESSION_LEVEL).compressobj()
+    chunks, size = [], 0
+    while chunk := file.read(CHUNK_SIZE):
+        size += len(chunk)
+        chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    return b"".join(chunks), size
+
+
+def open_snapshot(snapshot: RkeeperSnapshot) -> IO[bytes]:
+    # read_menu читает файл несколькими проходами, поэтому распаковываем в файл, а не в поток
+    file = SpooledTemporaryFile(max_size=settings.RKEEPER_MENU_SPOOL_MAX_SIZE)
+    zstandard.ZstdDecompressor().copy_stream(BytesIO(snapshot.content), file)
+    file.seek(0)
+    return file
+
+
+def expire_rkeeper_snapshots(
+    session: Session,
+    now: datetime | None = None,
+    batch_size: int = settings.RKEEPER_SNAPSHOT_DELETE_BATCH_SIZE,
+) -> int:
+    created_before = (now or datetime.utcnow()) - timedelta(days=settings.RKEEPER_SNAPSHOT_RETENTION_DAYS)
+    snapshot_repo = SnapshotRepository(session)
+    deleted_count = 0
+    while batch_count := snapshot_repo.delete_created_before(created_before, batch_size):
+        session.commit()
+        deleted_count += batch_count
+
+    return deleted_count
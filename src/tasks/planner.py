@@ -0,0 +1,388 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generic, Iterable, Mapping, Sequence, TypeVar
+
+import orjson
+from pydantic import BaseModel
+
+from src.schemas.rkeeper import (
+    RKeeperCategory,
+    RKeeperCountOfUses,
+    RKeeperLimitedListItem,
+    RKeeperLimitedListItemTypeOfDish,
+    RKeeperMeal,
+    RKeeperMenu,
+    RKeeperModifierGroups,
+    RKeeperModifiers,
+    RKeeperShop,
+)
+from src.tasks.schemas import DomainModifierGroupSchema, DomainModifierSchema
+
+# Планировщик синхронизации меню. Здесь только вычисления: по меню RKeeper и снимку того, что уже выгружено в
+# gateway, строится неизменяемый SyncPlan. Модуль не ходит ни в БД, ни в gateway, поэтому план можно
+# посчитать отдельно от выполнения (бенчмарки, dry-run) и переиспользовать по fingerprint.
+
+T = TypeVar("T")
+
+MealOfferState = tuple[float | None, float | None, bool]
+# так выгружается предложение блюда, которого больше нет в меню
+DEACTIVATED_MEAL_OFFER_STATE: MealOfferState = (None, 0, False)
+
+
+@dataclass(frozen=True, slots=True)
+class MenuSnapshot:
+    """Ключи объектов, которые уже выгружены в gateway, по данным БД адаптера"""
+
+    category_pos_ids: frozenset[str]
+    modifier_specific_external_ids: frozenset[str]
+    modifier_offer_pos_ids: frozenset[str]
+    modifier_group_hashed_ids: frozenset[str]
+    # в порядке выборки из БД, в этом же порядке уходят деактивации предложений
+    meal_pos_ids: tuple[str, ...]
+    # pos_id блюд, у которых есть предложение в синхронизируемом магазине
+    meal_offer_pos_ids: frozenset[str]
+    # pos_id блюда -> (цена, остаток, в стоп-листе), последнее выгруженное в gateway предложение
+    meal_offer_states: Mapping[str, MealOfferState] = field(default_factory=dict)
+
+    @classmethod
+    def from_rows(
+        cls,
+        categories: Iterable,
+        modifiers: Iterable,
+        modifier_offers: Iterable,
+        modifier_groups: Iterable,
+        meals: Sequence,
+        shop_id: int,
+    ) -> "MenuSnapshot":
+        return cls(
+            category_pos_ids=frozenset(category.pos_id for category in categories),
+            modifier_specific_external_ids=frozenset(modifier.specific_external_id for modifier in modifiers),
+            modifier_offer_pos_ids=frozenset(offer.pos_id for offer in modifier_offers),
+            modifier_group_hashed_ids=frozenset(modifier_group.hashed_id for modifier_group in modifier_groups),
+            meal_pos_ids=tuple(meal.pos_id for meal in meals),
+            meal_offer_pos_ids=frozenset(
+                offer.pos_id for meal in meals for offer in meal.offers if offer.shop_id == shop_id
+            ),
+            meal_offer_states={
+                offer.pos_id: (offer.price, offer.quantity, offer.in_stop_list)
+                for meal in meals
+                for offer in meal.offers
+                if offer.shop_id == shop_id
+            },
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class EntityPlan(Generic[T]):
+    creates: tuple[T, ...] = ()
+    updates: tuple[T, ...] = ()
+    # pos_id объектов, которых больше нет в меню RKeeper
+    deactivations: tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.creates or self.updates or self.deactivations)
+
+
+@dataclass(frozen=True, slots=True)
+class ParsedMenu:
+    """Часть плана, которая зависит только от меню и настроек клиента, а не от магазина"""
+
+    menu: RKeeperMenu
+    fingerprint: str
+    modifiers: Mapping[str, DomainModifierSchema]
+    modifier_groups: Mapping[str, DomainModifierGroupSchema]
+
+
+@dataclass(frozen=True, slots=True)
+class SyncPlan:
+    fingerprint: str
+    # только от данных RKeeper и настроек клиента, не меняется, пока синхронизация записывает их в БД
+    source_fingerprint: str
+    # только от меню и настроек клиента, одинаковый у магазинов с одинаковым меню
+    menu_fingerprint: str
+    categories: EntityPlan[RKeeperCategory]
+    modifiers: EntityPlan[DomainModifierSchema]
+    modifier_offers: EntityPlan[DomainModifierSchema]
+    modifier_groups: EntityPlan[DomainModifierGroupSchema]
+    meals: EntityPlan[RKeeperMeal]
+    # остатки из стоп-листа уже подставлены в quantity
+    meal_offers: EntityPlan[RKeeperMeal]
+    # specific_id группы модификаторов -> hashed_id, под которым она выгружается в gateway
+    modifier_group_hashed_ids: Mapping[str, str]
+
+
+def plan(
+    menu: RKeeperMenu,
+    snapshot: MenuSnapshot,
+    shop_pos_id: str,
+    limited_list: Sequence[RKeeperLimitedListItem] = (),
+    is_use_global_modifier_complex: bool = False,
+    get_modifier_max_amount: bool = False,
+) -> SyncPlan:
+    return plan_shop(
+        parse_menu(menu, is_use_global_modifier_complex, get_modifier_max_amount), snapshot, shop_pos_id, limited_list
+    )
+
+
+def parse_menu(
+    menu: RKeeperMenu, is_use_global_modifier_complex: bool = False, get_modifier_max_amount: bool = False
+) -> ParsedMenu:
+    modifiers, modifier_groups = parse_modifiers_and_modifier_groups(
+        menu, is_use_global_modifier_complex, get_modifier_max_amount
+    )
+    return ParsedMenu(
+        menu=menu,
+        fingerprint=menu_fingerprint(menu, is_use_global_modifier_complex, get_modifier_max_amount),
+        modifiers=modifiers,
+        modifier_groups=modifier_groups,
+    )
+
+
+def plan_shop(
+    parsed_menu: ParsedMenu,
+    snapshot: MenuSnapshot,
+    shop_pos_id: str,
+    limited_list: Sequence[RKeeperLimitedListItem] = (),
+) -> SyncPlan:
+    """План для магазина по уже разобранному меню: для каждого магазина считаются только его предложения"""
+    menu, modifiers, modifier_groups = parsed_menu.menu, parsed_menu.modifiers, parsed_menu.modifier_groups
+    meal_offers = split_by_key(
+        _apply_limited_list(menu.meals, limited_list, shop_pos_id),
+        snapshot.meal_offer_pos_ids,
+        lambda meal: meal.pos_id,
+    )
+    source = _source_fingerprint(parsed_menu.fingerprint, shop_pos_id, limited_list)
+    # в gateway уходят только предложения, которые отличаются от выгруженных. Предложения без сохраненного
+    # состояния (выгружены до его появления) обновляются всегда
+    meal_offer_states = snapshot.meal_offer_states
+    meal_offer_updates = tuple(
+        meal
+        for meal in meal_offers.updates
+        if meal_offer_states.get(meal.pos_id)
+        != (meal.price, meal.get_offer_quantity(shop_pos_id), meal.is_in_stop_list(shop_pos_id))
+    )
+    rkeeper_meal_pos_ids = {meal.pos_id for meal in menu.meals}
+    meal_offer_deactivations = tuple(
+        pos_id
+        for pos_id in snapshot.meal_pos_ids
+        if pos_id not in rkeeper_meal_pos_ids
+        and pos_id in snapshot.meal_offer_pos_ids
+        and meal_offer_states.get(pos_id) != DEACTIVATED_MEAL_OFFER_STATE
+    )
+
+    return SyncPlan(
+        fingerprint=_plan_fingerprint(source, snapshot),
+        source_fingerprint=source,
+        menu_fingerprint=parsed_menu.fingerprint,
+        categories=split_by_pos_id(menu.categories, snapshot.category_pos_ids),
+        modifiers=split_by_key(
+            modifiers.values(), snapshot.modifier_specific_external_ids, lambda modifier: modifier.specific_external_id
+        ),
+        modifier_offers=split_by_pos_id(modifiers.values(), snapshot.modifier_offer_pos_ids),
+        modifier_groups=split_by_key(
+            modifier_groups.values(),
+            snapshot.modifier_group_hashed_ids,
+            lambda modifier_group: modifier_group.hashed_id,
+        ),
+        meals=split_by_pos_id(menu.meals, frozenset(snapshot.meal_pos_ids)),
+        meal_offers=EntityPlan(meal_offers.creates, meal_offer_updates, meal_offer_deactivations),
+        modifier_group_hashed_ids={
+            modifier_group.specific_id: modifier_group.hashed_id for modifier_group in modifier_groups.values()
+        },
+    )
+
+
+def fingerprint(
+    menu: RKeeperMenu,
+    snapshot: MenuSnapshot,
+    shop_pos_id: str,
+    limited_list: Sequence[RKeeperLimitedListItem] = (),
+    is_use_global_modifier_complex: bool = False,
+    get_modifier_max_amount: bool = False,
+) -> str:
+    """Одинаковые входные данные дают одинаковый план"""
+    return _plan_fingerprint(
+        source_fingerprint(menu, shop_pos_id, limited_list, is_use_global_modifier_complex, get_modifier_max_amount),
+        snapshot,
+    )
+
+
+def source_fingerprint(
+    menu: RKeeperMenu,
+    shop_pos_id: str,
+    limited_list: Sequence[RKeeperLimitedListItem] = (),
+    is_use_global_modifier_complex: bool = False,
+    get_modifier_max_amount: bool = False,
+) -> str:
+    return _source_fingerprint(
+        menu_fingerprint(menu, is_use_global_modifier_complex, get_modifier_max_amount), shop_pos_id, limited_list
+    )
+
+
+def menu_fingerprint(
+    menu: RKeeperMenu, is_use_global_modifier_complex: bool = False, get_modifier_max_amount: bool = False
+) -> str:
+    data = orjson.dumps(
+        {
+            "menu": menu,
+            "is_use_global_modifier_complex": is_use_global_modifier_complex,
+            "get_modifier_max_amount": get_modifier_max_amount,
+        },
+        default=_fingerprint_default,
+    )
+    return hashlib.sha256(data).hexdigest()
+
+
+def _source_fingerprint(menu: str, shop_pos_id: str, limited_list: Sequence[RKeeperLimitedListItem]) -> str:
+    data = orjson.dumps(
+        {"menu": menu, "shop_pos_id": shop_pos_id, "limited_list": list(limited_list)},
+        default=_fingerprint_default,
+    )
+    return hashlib.sha256(data).hexdigest()
+
+
+def _plan_fingerprint(source: str, snapshot: MenuSnapshot) -> str:
+    data = orjson.dumps(
+        {
+            "source": source,
+            "snapshot": {
+                "category_pos_ids": sorted(snapshot.category_pos_ids),
+                "modifier_specific_external_ids": sorted(snapshot.modifier_specific_external_ids),
+                "modifier_offer_pos_ids": sorted(snapshot.modifier_offer_pos_ids),
+                "modifier_group_hashed_ids": sorted(snapshot.modifier_group_hashed_ids),
+                "meal_pos_ids": snapshot.meal_pos_ids,
+                "meal_offer_pos_ids": sorted(snapshot.meal_offer_pos_ids),
+                "meal_offer_states": sorted(snapshot.meal_offer_states.items()),
+            },
+        }
+    )
+    return hashlib.sha256(data).hexdigest()
+
+
+def _fingerprint_default(obj: Any) -> Any:
+    # для хеша хватает значений полей, .dict() с алиасами на большом меню в десятки раз медленнее
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def split_by_key(items: Iterable[T], existing_keys: frozenset[str], key: Callable[[T], str]) -> EntityPlan[T]:
+    creates, updates = [], []
+    for item in items:
+        updates.append(item) if key(item) in existing_keys else creates.append(item)
+
+    return EntityPlan(tuple(creates), tuple(updates))
+
+
+def split_by_pos_id(
+    items: Iterable[RKeeperShop | RKeeperCategory | RKeeperMeal | DomainModifierSchema],
+    existing_pos_ids: frozenset[str],
+) -> EntityPlan:
+    return split_by_key(items, existing_pos_ids, lambda item: item.pos_id)
+
+
+def limited_quantities(limited_list: Sequence[RKeeperLimitedListItem], shop_pos_id: str) -> dict[str, float | None]:
+    """external_id блюда -> остаток в магазине"""
+    return {
+        item.external_id: item.quantity
+        for item in limited_list
+        if item.restaurant_id == shop_pos_id and item.type_of_dish == RKeeperLimitedListItemTypeOfDish.PRODUCT
+    }
+
+
+def _apply_limited_list(
+    meals: Sequence[RKeeperMeal], limited_list: Sequence[RKeeperLimitedListItem], shop_pos_id: str
+) -> list[RKeeperMeal]:
+    limited_list_external_id_quantity_map = limited_quantities(limited_list, shop_pos_id)
+    if not limited_list_external_id_quantity_map:
+        return list(meals)
+
+    # меню не меняем: его же используют синхронизация блюд и другие магазины
+    return [
+        meal.copy(update={"quantity": limited_list_external_id_quantity_map[meal.external_id]})
+        if meal.external_id in limited_list_external_id_quantity_map
+        else meal
+        for meal in meals
+    ]
+
+
+def parse_modifiers_and_modifier_groups(
+    rkeeper_menu: RKeeperMenu, is_use_global_modifier_complex: bool, get_modifier_max_amount: bool
+) -> tuple[dict[str, DomainModifierSchema], dict[str, DomainModifierGroupSchema]]:
+    modifier_data_by_id: dict[str, RKeeperModifiers] = {
+        modifier.pos_id: modifier for modifier in rkeeper_menu.modifiers
+    }
+    modifier_group_by_id = {modifier_group.pos_id: modifier_group for modifier_group in rkeeper_menu.modifier_groups}
+    modifiers_for_update: dict[str, DomainModifierSchema] = {}
+    modifier_groups_for_update = {}
+    # одна и та же группа с теми же min/max встречается во многих схемах, собираем ее один раз
+    domain_modifier_group_by_specific_id: dict[str, DomainModifierGroupSchema] = {}
+    for modifier_schema in rkeeper_menu.modifier_schemas:
+        for modifier_group_in_schema in modifier_schema.modifier_groups:
+            specific_modifier_group_id = (
+                f"{modifier_group_in_schema.id}/{modifier_group_in_schema.min_amount}/"
+                f"{modifier_group_in_schema.max_amount}"
+            )
+            domain_modifier_group = domain_modifier_group_by_specific_id.get(specific_modifier_group_id)
+            if domain_modifier_group is None:
+                domain_modifier_group = _build_domain_modifier_group(
+                    modifier_group_in_schema,
+                    modifier_group_by_id[modifier_group_in_schema.id],
+                    modifier_data_by_id,
+                    modifiers_for_update,
+                    get_modifier_max_amount,
+                )
+                domain_modifier_group_by_specific_id[specific_modifier_group_id] = domain_modifier_group
+
+            # сохраняем группу
+            if is_use_global_modifier_complex:
+                modifier_groups_for_update[domain_modifier_group.hashed_id] = domain_modifier_group
+            else:
+                modifier_groups_for_update[domain_modifier_group.specific_id] = domain_modifier_group
+
+    return modifiers_for_update, modifier_groups_for_update
+
+
+def _build_domain_modifier_group(
+    modifier_group_in_schema: RKeeperCountOfUses,
+    modifier_group: RKeeperModifierGroups,
+    modifier_data_by_id: dict[str, RKeeperModifiers],
+    modifiers_for_update: dict[str, DomainModifierSchema],
+    get_modifier_max_amount: bool,
+) -> DomainModifierGroupSchema:
+    modifiers_of_this_group = []
+
+    # Нужно для формирования глобального id модификатора
+    for modifier_id in modifier_group.modifiers:
+        modifier_data = modifier_data_by_id[modifier_id]
+
+        modifier_min_amount = 0
+        modifier_max_amount = modifier_group_in_schema.max_amount
+        if get_modifier_max_amount and modifier_data.max_amount:
+            modifier_max_amount = modifier_data.max_amount
+
+        # модификатор с тем же specific_id уже собран для другой группы
+        specific_modifier_id = f"{modifier_id}/{modifier_min_amount}/{modifier_max_amount}"
+        modifier = modifiers_for_update.get(specific_modifier_id)
+        if modifier is None:
+            modifier = DomainModifierSchema(
+                pos_id=modifier_id,
+                name=modifier_data.name,
+                price=modifier_data.price,
+                min_amount=modifier_min_amount,
+                max_amount=modifier_max_amount,
+                images=modifier_data.images,
+                required=True if modifier_min_amount else False,
+                external_id=modifier_data.external_id,
+            )
+            modifiers_for_update[specific_modifier_id] = modifier
+        modifiers_of_this_group.append(modifier)
+
+    return DomainModifierGroupSchema(
+        pos_id=modifier_group_in_schema.id,
+        min_amount=modifier_group_in_schema.min_amount,
+        max_amount=modifier_group_in_schema.max_amount,
+        modifiers=tuple(modifiers_of_this_group),
+        name=modifier_group.name,
+        required=True if modifier_group_in_schema.min_amount else False,
+    )
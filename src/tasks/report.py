@@ -0,0 +1,92 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from src.clients.pos_client import GatewayRequest
+from src.tasks.planner import EntityPlan, SyncPlan
+
+PLAN_ENTITIES = ("categories", "modifiers", "modifier_offers", "modifier_groups", "meals", "meal_offers")
+
+
+class SyncReport:
+    """
+    Что синхронизация сделала или сделала бы (dry-run): сколько объектов каждого типа создается, обновляется и
+    отключается, сколько времени занял каждый этап и какие запросы ушли бы в gateway.
+    """
+
+    def __init__(self) -> None:
+        self.fingerprint: str | None = None
+        self.entities: dict[str, EntityPlan] = {}
+        self.stages: dict[str, float] = {}
+        # этапы, завершенные прошлой синхронизацией тех же данных, которая упала на следующем этапе, или уже
+        # выгруженные для другого магазина с тем же меню
+        self.skipped_stages: list[str] = []
+        self.requests: list[GatewayRequest] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started_at
+
+    def add_plan(self, sync_plan: SyncPlan) -> None:
+        self.fingerprint = sync_plan.fingerprint
+        self.entities.update({entity: getattr(sync_plan, entity) for entity in PLAN_ENTITIES})
+
+    def as_dict(self) -> dict[str, Any]:
+        requests: dict[str, dict[str, int]] = {}
+        for request in self.requests:
+            summary = requests.setdefault(
+                f"{request.method} {request.url}", {"requests": 0, "items": 0, "bytes": 0, "max_bytes": 0}
+            )
+            summary["requests"] += 1
+            summary["items"] += request.items
+            summary["bytes"] += request.size
+            summary["max_bytes"] = max(summary["max_bytes"], request.size)
+
+        return {
+            "fingerprint": self.fingerprint,
+            "entities": {
+                entity: {
+                    "creates": len(entity_plan.creates),
+                    "updates": len(entity_plan.updates),
+                    "deactivations": len(entity_plan.deactivations),
+                }
+                for entity, entity_plan in self.entities.items()
+            },
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            "skipped_stages": self.skipped_stages,
+            "requests": requests,
+        }
+
+    def format(self) -> str:
+        data = self.as_dict()
+        lines = []
+        if data["fingerprint"]:
+            lines.append(f"fingerprint: {data['fingerprint']}")
+
+        lines.append("entities:")
+        for entity, counts in data["entities"].items():
+            lines.append(
+                f"  {entity:<16} create {counts['creates']:>6}  update {counts['updates']:>6}"
+                f"  deactivate {counts['deactivations']:>6}"
+            )
+
+        lines.append("stages:")
+        for stage, milliseconds in data["stages_ms"].items():
+            lines.append(f"  {stage:<16} {milliseconds:>10.1f} ms")
+
+        if data["skipped_stages"]:
+            lines.append(f"skipped: {', '.join(data['skipped_stages'])}")
+
+        if data["requests"]:
+            lines.append("gateway requests:")
+            for request, summary in data["requests"].items():
+                lines.append(
+                    f"  {request:<32} {summary['requests']:>4} req  {summary['items']:>6} items"
+                    f"  {summary['bytes']:>10} bytes  max {summary['max_bytes']:>9} bytes"
+                )
+
+        return "\n".join(lines)
@@ -1,43 +1,85 @@
 import hashlib
+import sys
+from dataclasses import dataclass, field
+from typing import Any
 
-from pydantic import BaseModel
-from starter_dto import pos
 
-from src.schemas.rkeeper import RKeeperModifiers
+# Внутренние записи синхронизации модификаторов. Их тысячи на меню, поэтому это компактные dataclass со __slots__,
+# а не pydantic-модели: pydantic-объекты создаются только при сборке запросов в gateway.
 
 
-class DomainModifierSchema(RKeeperModifiers):
+@dataclass(frozen=True, slots=True)
+class DomainModifierSchema:
+    pos_id: str
+    external_id: str
+    name: str
+    price: str
+    images: list
+    max_amount: int | None
     min_amount: int | None
     required: bool
 
-    @property
-    def specific_id(self) -> str:
-        return f"{self.pos_id}/{self.min_amount}/{self.max_amount}"
+    specific_id: str = field(init=False, repr=False, compare=False)
+    specific_external_id: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "pos_id", sys.intern(self.pos_id))
+        object.__setattr__(self, "external_id", sys.intern(self.external_id))
+        object.__setattr__(self, "specific_id", sys.intern(f"{self.pos_id}/{self.min_amount}/{self.max_amount}"))
+        object.__setattr__(
+            self, "specific_external_id", sys.intern(f"{self.external_id}/{self.min_amount}/{self.max_amount}")
+        )
 
-    @property
-    def specific_external_id(self) -> str:
-        return f"{self.external_id}/{self.min_amount}/{self.max_amount}"
+    def dict(self, exclude: set[str] | None = None) -> dict[str, Any]:
+        # те же поля и порядок, что у прежней pydantic-модели
+        data = {
+            "pos_id": self.pos_id,
+            "external_id": self.external_id,
+            "name": self.name,
+            "price": self.price,
+            "images": self.images,
+            "max_amount": self.max_amount,
+            "min_amount": self.min_amount,
+            "required": self.required,
+        }
+        for key in exclude or ():
+            data.pop(key, None)
+        return data
 
 
-class DomainModifierGroupSchema(BaseModel):
+@dataclass(frozen=True, slots=True)
+class DomainModifierGroupSchema:
     pos_id: str
     min_amount: int
     max_amount: int
-    modifiers: list[DomainModifierSchema]
+    modifiers: tuple[DomainModifierSchema, ...]
     name: str | None
     required: bool
 
-    @property
-    def specific_id(self) -> str:
-        return f"{self.pos_id}/{self.min_amount}/{self.max_amount}"
+    specific_id: str = field(init=False, repr=False, compare=False)
+    modifier_external_ids: str = field(init=False, repr=False, compare=False)
+    hashed_id: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "pos_id", sys.intern(self.pos_id))
+        object.__setattr__(self, "specific_id", sys.intern(f"{self.pos_id}/{self.min_amount}/{self.max_amount}"))
 
-    @property
-    def modifier_external_ids(self) -> str:
         _modifiers_external_ids = sorted([modifier.external_id for modifier in self.modifiers])
-        return "/".join(_modifiers_external_ids)
+        object.__setattr__(self, "modifier_external_ids", "/".join(_modifiers_external_ids))
 
-    @property
-    def hashed_id(self) -> str:
         _modifier_data_to_hash = self.modifier_external_ids + f"{self.min_amount}/{self.max_amount}"
+        hashed_id = hashlib.md5(_modifier_data_to_hash.encode("utf-8")).hexdigest()
+        object.__setattr__(self, "hashed_id", sys.intern(hashed_id))
 
-        return hashlib.md5(_modifier_data_to_hash.encode("utf-8")).hexdigest()
+    def dict(self, exclude: set[str] | None = None) -> dict[str, Any]:
+        data = {
+            "pos_id": self.pos_id,
+            "min_amount": self.min_amount,
+            "max_amount": self.max_amount,
+            "modifiers": [modifier.dict() for modifier in self.modifiers],
+            "name": self.name,
+            "required": self.required,
+        }
+        for key in exclude or ():
+            data.pop(key, None)
+        return data
@@ -1,11 +1,12 @@
-from typing import Optional, Tuple, TypeVar, Any, Sequence
+from datetime import datetime, timedelta
+from typing import Optional, TypeVar, Any, Sequence, Mapping, Callable
 
-from httpx import HTTPError
 from opentelemetry import trace
+from redis.exceptions import LockError, RedisError
 from starter_dto import pos
 from starter_dto.pos.menu import ModifierInGroup, UpdateModifierOffer, CreateModifierOffer
 
-from src.clients.pos_client import PosGatewayClient
+from src.clients.pos_client import DryRunPosGatewayClient, PosGatewayClient
 from src.clients.rkeeper_client import RkeeperClient
 from src.config import settings
 from src.core.repositories.client import ClientRepository
@@ -16,35 +17,30 @@ from sqlalchemy.orm import Session
 
 from src.exceptions import ObjectDoesNotExist
 from src.logger import get_logger
-from src.models import Category, Shop, Meal, ModifierGroup, Client, Modifier, MealOffer, ModifierOffer
+from src.models import Category, Shop, Meal, ModifierGroup, Client, Modifier, MealOffer, ModifierOffer, Order
+from src.schemas.order import OrderStatusUpdater
+from src.services.gateway_outbox import OutboxPosGatewayClient
+from src.services.redis_client import Storage
 from src.schemas.rkeeper import (
     RKeeperCategory,
     RKeeperMeal,
     RKeeperMenu,
-    RKeeperModifierGroups,
     RKeeperModifiers,
     RKeeperModifiersSchemes,
+    RKeeperOrderStatus,
     RkeeperOrderStatusEnum,
     RkeeperPaymentStatusEnum,
     RkeeperPaymentTypeEnum,
     RKeeperShop,
     RKeeperLimitedListItem,
-    RKeeperLimitedListItemTypeOfDish,
 )
+from src.tasks import planner
+from src.tasks.planner import EntityPlan, MenuSnapshot, SyncPlan
+from src.tasks.report import SyncReport
 from src.tasks.schemas import DomainModifierSchema, DomainModifierGroupSchema
-from src.utils.batch import generate_batch
+from src.utils.cache import LruCache
 from src.utils.enums import Entity
 
-RkeeperTypes = TypeVar(
-    "RkeeperTypes",
-    list[RKeeperShop],
-    list[RKeeperCategory],
-    list[RKeeperModifierGroups],
-    list[RKeeperModifiers],
-    list[RKeeperMeal],
-    list[DomainModifierSchema],
-)
-
 CreatedDataTypes = TypeVar(
     "CreatedDataTypes",
     list[pos.CreateShop],
@@ -68,97 +64,314 @@ SyncRkeeperTypes = TypeVar(
 logger = get_logger("sync")
 tracer = trace.get_tracer("rkeeper")
 
+# этапы, которые зависят только от меню: магазину с тем же меню повторно выгружать нечего
+MENU_PHASES = frozenset({"categories", "modifiers", "modifier_groups", "meals"})
+
 
 class MenuNotFound(Exception):
     pass
 
 
+def get_status_poll_interval(latest_order_created_at: datetime | None, now: datetime) -> int:
+    # заказы без даты создания появились до планировщика, считаем их старыми
+    if latest_order_created_at is None:
+        return settings.ORDER_STATUS_POLL_MAX_INTERVAL
+
+    order_age = (now - latest_order_created_at).total_seconds()
+    for max_order_age, interval in sorted(settings.ORDER_STATUS_POLL_INTERVALS.items()):
+        if order_age < max_order_age:
+            return interval
+
+    return settings.ORDER_STATUS_POLL_MAX_INTERVAL
+
+
+def get_next_status_poll_at(latest_order_created_at: datetime | None, now: datetime) -> datetime:
+    interval = get_status_poll_interval(latest_order_created_at, now)
+    return now + timedelta(seconds=interval - settings.ORDER_STATUS_POLL_TICK_TOLERANCE)
+
+
 class Sync:
-    def __init__(self, db: Session, client: Client, log: Any = None):
+    def __init__(
+        self,
+        db: Session,
+        client: Client,
+        log: Any = None,
+        dry_run: bool = False,
+        rkeeper: RkeeperClient | None = None,
+        pos_gateway: PosGatewayClient | None = None,
+    ):
         self.db = db
         self.client = client
-        self.pos_gateway = PosGatewayClient(client.api_key)
-        self.rkeeper = RkeeperClient(client)
+        # в dry-run запросы в gateway только записываются, коммитить сессию после такой синхронизации нельзя
+        self.dry_run = dry_run
+        # обновления уходят в gateway через gateway_outbox после коммита синхронизации
+        self.storage = Storage()
+        # клиенты можно подменить: повтор снимков RKeeper (cli.py replay-snapshot), бенчмарки
+        self.pos_gateway = pos_gateway or (
+            DryRunPosGatewayClient(client.api_key)
+            if dry_run
+            else OutboxPosGatewayClient(client.api_key, db, client.id, self.storage)
+        )
+        self.rkeeper = rkeeper or RkeeperClient(client)
         self.client_repo = ClientRepository(db)
         self.menu_repo = MenuRepository(db)
         self.order_repo = OrderRepository(db)
         self.modifier_specific_external_id_map: dict[str, Modifier] = {}
-        self.modifier_group_hashed_id_map: dict[str, ModifierGroup] = {}
+        # hashed_id группы -> starter_id
+        self.modifier_group_hashed_id_map: dict[str, int] = {}
         self.rkeeper_modifier_group_specific_hash_id_map: dict[str, str] = {}
+        # sha256 ответа RKeeper (или отпечаток меню, если клиент его не знает) -> разобранное меню
+        self.parsed_menus: LruCache[str, planner.ParsedMenu] = LruCache(settings.RKEEPER_MENU_CACHE_SIZE)
+        # menu_fingerprint -> этапы, не зависящие от магазина, которые уже выгружены этим экземпляром
+        self.applied_menu_phases: dict[str, set[str]] = {}
         self.log = log or logger
 
-    def shops(self) -> None:
-        shops = self.client_repo.get_shops(self.client.id)
-        rkeeper_shops = self.rkeeper.get_shops()
+    def shops(self) -> SyncReport:
+        report = SyncReport()
+        with report.stage("fetch"):
+            shops = self.client_repo.get_shops(self.client.id)
+            rkeeper_shops = self.rkeeper.get_shops()
 
         self.log.debug("Sync shops", db=shops, rkeeper=rkeeper_shops)
 
-        self._sync_shops(shops, rkeeper_shops)
+        with report.stage("shops"):
+            report.entities["shops"] = self._sync_shops(shops, rkeeper_shops)
 
-    def menu(self, pos_shop_id: str) -> None:
-        rkeeper_menu = self.rkeeper.get_menu(pos_shop_id)
-        limited_list = self.rkeeper.get_limit_list()
-        shop = self.client_repo.get_shop_by_pos_id(self.client.id, pos_shop_id)
+        return self._finish_report(report)
 
-        self._sync_categories(self.menu_repo.get_categories_by_client_id(self.client.id), rkeeper_menu.categories)
-        self.db.flush()
+    def menu(self, pos_shop_id: str) -> SyncReport:
+        report = SyncReport()
+        with report.stage("fetch"):
+            rkeeper_menu = self.rkeeper.get_menu(pos_shop_id)
+            limited_list = self.rkeeper.get_limit_list()
 
-        modifiers, modifier_groups = self._parse_modifiers_and_modifier_groups(rkeeper_menu)
+        with report.stage("snapshot"):
+            shop = self.client_repo.get_shop_by_pos_id(self.client.id, pos_shop_id)
+            categories = self.menu_repo.get_categories_by_client_id(self.client.id)
+            modifiers = self.menu_repo.get_modifiers_by_project_id(self.client.project_id)
+            modifier_offers = self.menu_repo.get_modifier_offers_with_modifiers_by_shop_id(shop.id)
+            modifier_groups = self.menu_repo.get_modifier_groups_by_project_id(self.client.project_id)
+            meals = self.menu_repo.get_meals_by_client_id(self.client.id)
+            snapshot = MenuSnapshot.from_rows(categories, modifiers, modifier_offers, modifier_groups, meals, shop.id)
 
-        self.sync_modifiers(self.menu_repo.get_modifiers_by_project_id(self.client.project_id), modifiers)
-        self.db.flush()
+        with report.stage("plan"):
+            sync_plan = self.plan_menu(rkeeper_menu, snapshot, shop, limited_list)
+        report.add_plan(sync_plan)
 
-        self.sync_modifier_offers(
-            self.menu_repo.get_modifier_offers_with_modifiers_by_shop_id(shop.id), modifiers, shop
+        # этапы, пропущенные по чекпоинту, сами эти соответствия не заполнят
+        self.modifier_specific_external_id_map.update(
+            {modifier.specific_external_id: modifier for modifier in modifiers}
         )
-        self.db.flush()
-
-        self.sync_modifier_groups(
-            self.menu_repo.get_modifier_groups_by_project_id(self.client.project_id), modifier_groups
+        self.modifier_group_hashed_id_map.update(
+            {modifier_group.hashed_id: modifier_group.starter_id for modifier_group in modifier_groups}
         )
-        self.db.flush()
+        self.rkeeper_modifier_group_specific_hash_id_map.update(sync_plan.modifier_group_hashed_ids)
+
+        checkpoint_key = f"{self.client.client_id}:{pos_shop_id}"
+        completed = self._get_checkpoint(checkpoint_key, sync_plan.source_fingerprint)
+        if completed:
+            self.log.info("Resume menu sync", shop=pos_shop_id, completed=sorted(completed))
+        # в dry-run созданное откатывается после каждого магазина, следующий магазин выгружает все заново
+        applied_menu_phases = (
+            set() if self.dry_run else self.applied_menu_phases.setdefault(sync_plan.menu_fingerprint, set())
+        )
+
+        phases: list[tuple[str, Callable[[], None]]] = [
+            ("categories", lambda: self._apply_categories(sync_plan.categories, categories)),
+            ("modifiers", lambda: self._apply_modifiers(sync_plan.modifiers, modifiers)),
+            ("modifier_offers", lambda: self._apply_modifier_offers(sync_plan.modifier_offers, modifier_offers, shop)),
+            (
+                "modifier_groups",
+                lambda: self._apply_modifier_groups(
+                    sync_plan.modifier_groups, modifier_groups, sync_plan.modifier_group_hashed_ids
+                ),
+            ),
+            ("meals", lambda: self._apply_meals(sync_plan.meals, meals, rkeeper_menu)),
+            # в предложениях нужны starter_id блюд, созданных на предыдущем шаге
+            (
+                "meal_offers",
+                lambda: self._apply_meal_offers(
+                    sync_plan.meal_offers, self.menu_repo.get_meals_by_client_id(self.client.id), shop
+                ),
+            ),
+        ]
+        # объекты из снимка используются и после коммита этапа, без этого каждый перечитывался бы из БД отдельно
+        expire_on_commit, self.db.expire_on_commit = self.db.expire_on_commit, False
+        try:
+            for phase, apply in phases:
+                if phase in completed or phase in applied_menu_phases:
+                    report.skipped_stages.append(phase)
+                    continue
+
+                with report.stage(phase):
+                    apply()
+                    self.db.flush()
+                self._complete_phase(checkpoint_key, sync_plan.source_fingerprint, phase)
+                if phase in MENU_PHASES:
+                    applied_menu_phases.add(phase)
+        finally:
+            self.db.expire_on_commit = expire_on_commit
+
+        self._clear_checkpoint(checkpoint_key)
+        return self._finish_report(report)
+
+    def stock(self, pos_shop_id: str) -> SyncReport:
+        """
+        Остатки и стоп-лист между полными синхронизациями меню: в gateway уходят только предложения, у которых
+        изменился остаток. Категории, модификаторы и блюда не трогаем.
+        """
+        report = SyncReport()
+        # перекрывающиеся запуски отправили бы одни и те же изменения дважды
+        lock = self.storage.lock(f"sync_stock:{self.client.client_id}:{pos_shop_id}", settings.SYNC_STOCK_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            self.log.info("Stock sync is running by another worker", shop=pos_shop_id)
+            return report
+
+        try:
+            with report.stage("fetch"):
+                # без стоп-листа остатки не считаем: пустой список снял бы ограничения со всех предложений
+                limited_list = self.rkeeper.get_limit_list(raise_on_error=True)
+
+            with report.stage("snapshot"):
+                shop = self.client_repo.get_shop_by_pos_id(self.client.id, pos_shop_id)
+                meal_offers = self.menu_repo.get_meal_offers_in_menu_by_shop_id(shop.id)
+
+            with report.stage("meal_offers"):
+                quantities = planner.limited_quantities(limited_list, pos_shop_id)
+                meal_offer_update_data = []
+                updated_pos_ids = []
+                for meal_offer in meal_offers:
+                    # флаг стоп-листа приходит только с меню, его обновляет полная синхронизация
+                    quantity = 0 if meal_offer.in_stop_list else quantities.get(meal_offer.meal.external_id)
+                    if quantity == meal_offer.quantity:
+                        continue
+
+                    meal_offer_update_data.append(
+                        pos.menu.UpdateMealOffer(
+                            quantity=quantity,
+                            price=meal_offer.price,
+                            meal_id=meal_offer.meal.starter_id,
+                            id=meal_offer.starter_id,
+                        )
+                    )
+                    updated_pos_ids.append(meal_offer.pos_id)
+                    meal_offer.quantity = quantity
+
+                if meal_offer_update_data:
+                    self.pos_gateway.update_meal_offers(meal_offer_update_data, shop.starter_id)
+                report.entities["meal_offers"] = EntityPlan(updates=tuple(updated_pos_ids))
+
+            # до снятия блокировки: следующий запуск должен видеть выгруженные остатки
+            if not self.dry_run:
+                self.commit()
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                self.log.warn("Stock sync lock has expired", shop=pos_shop_id)
+
+        return self._finish_report(report)
+
+    def commit(self) -> None:
+        self.db.commit()
+        # созданные в gateway объекты сохранены, повторять их создание больше не нужно
+        try:
+            self.pos_gateway.clear_pending_creates()
+        except RedisError as e:
+            self.log.warn("Pending creates are not cleared", error=repr(e))
+
+    def _complete_phase(self, checkpoint_key: str, fingerprint: str, phase: str) -> None:
+        # в dry-run коммитить нельзя, и продолжать после ошибки нечего
+        if self.dry_run:
+            return
 
-        self._sync_meals(self.menu_repo.get_meals_by_client_id(self.client.id), rkeeper_menu)
-        self.db.flush()
+        # коммит после каждого этапа: ошибка следующего этапа не откатит то, что уже выгружено в gateway
+        self.commit()
+        try:
+            self.storage.add_sync_checkpoint(checkpoint_key, fingerprint, phase, settings.SYNC_CHECKPOINT_TTL)
+        except RedisError as e:
+            self.log.warn("Sync checkpoint is unavailable", error=repr(e))
+
+    def _get_checkpoint(self, checkpoint_key: str, fingerprint: str) -> set[str]:
+        if self.dry_run:
+            return set()
+
+        try:
+            return self.storage.get_sync_checkpoint(checkpoint_key, fingerprint)
+        except RedisError as e:
+            self.log.warn("Sync checkpoint is unavailable", error=repr(e))
+            return set()
+
+    def _clear_checkpoint(self, checkpoint_key: str) -> None:
+        # следующая синхронизация снова проходит все этапы, чекпоинт нужен только для повтора после ошибки
+        if self.dry_run:
+            return
 
-        self._sync_meal_offers(self.menu_repo.get_meals_by_client_id(self.client.id), rkeeper_menu, shop, limited_list)
-        self.db.flush()
+        try:
+            self.storage.clear_sync_checkpoint(checkpoint_key)
+        except RedisError as e:
+            self.log.warn("Sync checkpoint is unavailable", error=repr(e))
+
+    def _finish_report(self, report: SyncReport) -> SyncReport:
+        if isinstance(self.pos_gateway, DryRunPosGatewayClient):
+            report.requests.extend(self.pos_gateway.pop_requests())
 
-    def sync_modifiers(self, db_modifiers: Sequence[Modifier], modifiers: dict[str, DomainModifierSchema]) -> None:
-        new_modifiers, old_modifiers = self._split_modifiers_by_novelty(db_modifiers, list(modifiers.values()))
+        self.log.debug("Sync report", dry_run=self.dry_run, **report.as_dict())
+        return report
 
+    def plan_menu(
+        self,
+        rkeeper_menu: RKeeperMenu,
+        snapshot: MenuSnapshot,
+        shop: Shop,
+        limited_list: Sequence[RKeeperLimitedListItem] = (),
+    ) -> SyncPlan:
+        with tracer.start_as_current_span("plan menu sync") as span:
+            sync_plan = planner.plan_shop(self._parse_menu(rkeeper_menu), snapshot, shop.pos_id, limited_list)
+            span.set_attribute("sync.plan.fingerprint", sync_plan.fingerprint)
+
+        return sync_plan
+
+    def _parse_menu(self, rkeeper_menu: RKeeperMenu) -> planner.ParsedMenu:
+        # одинаковые ответы RKeeper разбираем один раз
+        flags = (self.client.is_use_global_modifier_complex, self.client.get_modifier_max_amount)
+        key = self.rkeeper.get_menu_digest(rkeeper_menu) or planner.menu_fingerprint(rkeeper_menu, *flags)
+        parsed_menu = self.parsed_menus.get(key)
+        if parsed_menu is None:
+            parsed_menu = self.parsed_menus[key] = planner.parse_menu(rkeeper_menu, *flags)
+        return parsed_menu
+
+    def _apply_modifiers(
+        self, modifiers_plan: EntityPlan[DomainModifierSchema], db_modifiers: Sequence[Modifier]
+    ) -> None:
         self.modifier_specific_external_id_map.update(
             {modifier.specific_external_id: modifier for modifier in db_modifiers}
         )
-        if old_modifiers:
+        if modifiers_plan.updates:
             try:
                 converted_data = [
                     pos.UpdateModifier(
                         id=self.modifier_specific_external_id_map[old_modifier.specific_external_id].starter_id,
                         **old_modifier.dict(),
                     )
-                    for old_modifier in old_modifiers
+                    for old_modifier in modifiers_plan.updates
                 ]
-                modifiers_to_update: list[Modifier] = []
-
-                self.db.add_all(modifiers_to_update)
-
             except KeyError as e:
                 self.log.error("Cannot find modifier to update", modifier_id=str(e))
                 raise ObjectDoesNotExist(Entity.MODIFIER, str(e))
 
             self.pos_gateway.update_modifiers(converted_data)
 
-        if new_modifiers:
+        if modifiers_plan.creates:
             new_modifier_specific_external_id_map: dict[str, DomainModifierSchema] = {
-                new_modifier.specific_external_id: new_modifier for new_modifier in new_modifiers
+                new_modifier.specific_external_id: new_modifier for new_modifier in modifiers_plan.creates
             }
             converted_data = [
                 pos.CreateModifier(
                     pos_id=new_modifier.specific_external_id,
                     **new_modifier.dict(exclude={"pos_id"}),
                 )
-                for new_modifier in new_modifiers
+                for new_modifier in modifiers_plan.creates
             ]
             if created_objects := self.pos_gateway.create_modifiers(converted_data).data:
                 domain_modifiers = []
@@ -180,16 +393,15 @@ class Sync:
                     {modifier.specific_external_id: modifier for modifier in domain_modifiers}
                 )
 
-    def sync_modifier_offers(
-        self, db_modifier_offers: Sequence[ModifierOffer], modifiers: dict[str, DomainModifierSchema], shop: Shop
+    def _apply_modifier_offers(
+        self,
+        modifier_offers_plan: EntityPlan[DomainModifierSchema],
+        db_modifier_offers: Sequence[ModifierOffer],
+        shop: Shop,
     ) -> None:
-        new_modifier_offers, old_modifier_offers = self._split_by_novelty_by_pos_id(
-            db_modifier_offers, list(modifiers.values())
-        )
-
         modifier_offer_pos_starter_id = {offer.pos_id: offer.starter_id for offer in db_modifier_offers}
 
-        if old_modifier_offers:
+        if modifier_offers_plan.updates:
             try:
                 converted_data = [
                     UpdateModifierOffer(
@@ -200,7 +412,7 @@ class Sync:
                         shop_id=shop.starter_id,
                         price=int(float(modifier_offer.price)),
                     )
-                    for modifier_offer in old_modifier_offers
+                    for modifier_offer in modifier_offers_plan.updates
                 ]
             except KeyError as e:
                 self.log.error(
@@ -214,9 +426,9 @@ class Sync:
 
             self.pos_gateway.update_modifier_offers(converted_data)
 
-        if new_modifier_offers:
+        if modifier_offers_plan.creates:
             modifier_offer_pos_id_map = {
-                modifier_offer.pos_id: modifier_offer for modifier_offer in new_modifier_offers
+                modifier_offer.pos_id: modifier_offer for modifier_offer in modifier_offers_plan.creates
             }
             try:
                 converted_data = [
@@ -228,7 +440,7 @@ class Sync:
                         shop_id=shop.starter_id,
                         price=int(float(modifier_offer.price)),
                     )
-                    for modifier_offer in new_modifier_offers
+                    for modifier_offer in modifier_offers_plan.creates
                 ]
             except KeyError as e:
                 self.log.error(
@@ -265,27 +477,24 @@ class Sync:
                 self.db.add_all(domain_modifier_offers)
                 self.db.flush()
 
-    def sync_modifier_groups(
-        self, db_modifier_groups: Sequence[ModifierGroup], modifier_groups: dict[str, DomainModifierGroupSchema]
+    def _apply_modifier_groups(
+        self,
+        modifier_groups_plan: EntityPlan[DomainModifierGroupSchema],
+        db_modifier_groups: Sequence[ModifierGroup],
+        modifier_group_hashed_ids: Mapping[str, str],
     ) -> None:
-        self.rkeeper_modifier_group_specific_hash_id_map.update(
-            {modifier_group.specific_id: modifier_group.hashed_id for modifier_group in modifier_groups.values()}
-        )
-        new_modifier_groups, old_modifier_groups = self._split_modifier_group_by_novelty(
-            db_modifier_groups, list(modifier_groups.values())
-        )
+        self.rkeeper_modifier_group_specific_hash_id_map.update(modifier_group_hashed_ids)
 
-        if old_modifier_groups:
+        if modifier_groups_plan.updates:
             self.modifier_group_hashed_id_map.update(
-                {modifier_group.hashed_id: modifier_group for modifier_group in db_modifier_groups}
+                {modifier_group.hashed_id: modifier_group.starter_id for modifier_group in db_modifier_groups}
             )
             try:
                 converted_data = []
-                for modifier_group in old_modifier_groups:
-                    db_modifier_group = self.modifier_group_hashed_id_map[modifier_group.hashed_id]
+                for modifier_group in modifier_groups_plan.updates:
                     converted_data.append(
                         pos.UpdateModifierGroup(
-                            id=db_modifier_group.starter_id,
+                            id=self.modifier_group_hashed_id_map[modifier_group.hashed_id],
                             modifiers=self._get_converted_modifiers(modifier_group.modifiers),
                             name=modifier_group.name,
                             max_amount=modifier_group.max_amount,
@@ -300,9 +509,9 @@ class Sync:
 
             self.pos_gateway.update_modifier_groups(converted_data)
 
-        if new_modifier_groups:
+        if modifier_groups_plan.creates:
             modifier_group_specific_id_map = {
-                modifier_group.hashed_id: modifier_group for modifier_group in modifier_groups.values()
+                modifier_group.hashed_id: modifier_group for modifier_group in modifier_groups_plan.creates
             }
             converted_data = [
                 pos.CreateModifierGroup(
@@ -313,7 +522,7 @@ class Sync:
                     max_amount=new_modifier_group.max_amount,
                     required=new_modifier_group.required,
                 )
-                for new_modifier_group in new_modifier_groups
+                for new_modifier_group in modifier_groups_plan.creates
             ]
             if created_objects := self.pos_gateway.create_modifier_groups(converted_data).data:
                 domain_modifier_groups = []
@@ -332,12 +541,27 @@ class Sync:
                 self.db.add_all(domain_modifier_groups)
                 self.db.flush()
                 self.modifier_group_hashed_id_map.update(
-                    {modifier_group.hashed_id: modifier_group for modifier_group in domain_modifier_groups}
+                    {modifier_group.hashed_id: modifier_group.starter_id for modifier_group in domain_modifier_groups}
                 )
 
-    def _sync_meals(self, meals_from_db: Sequence[Meal], rkeeper_menu: RKeeperMenu) -> None:
-        for meal in rkeeper_menu.meals:
-            meal.modifier_groups = self._find_modifier_groups(meal.scheme_id, rkeeper_menu.modifier_schemas)
+    def _apply_meals(
+        self, meals_plan: EntityPlan[RKeeperMeal], meals_from_db: Sequence[Meal], rkeeper_menu: RKeeperMenu
+    ) -> None:
+        if not meals_plan:
+            return
+
+        # у большинства блюд общие схемы, группы схемы ищутся один раз за меню
+        modifier_schema_by_id = {
+            modifier_schema.pos_id: modifier_schema for modifier_schema in rkeeper_menu.modifier_schemas
+        }
+        modifier_group_ids_by_scheme_id: dict[str, list[int]] = {}
+
+        def with_modifier_groups(meal: RKeeperMeal) -> RKeeperMeal:
+            # блюда в плане не меняем, starter_id групп известны только после их выгрузки
+            modifier_group_ids = self._find_modifier_groups(
+                meal.scheme_id, modifier_schema_by_id, modifier_group_ids_by_scheme_id
+            )
+            return meal.copy(update={"modifier_groups": modifier_group_ids})
 
         rkeeper_category_pos_ids = {category.pos_id for category in rkeeper_menu.categories}
         domain_categories = self.client_repo.get_category_by_client_id_and_pos_ids(
@@ -347,16 +571,14 @@ class Sync:
             category.pos_id: category.starter_id for category in domain_categories
         }
 
-        new_meals, old_meals = self._split_by_novelty_by_pos_id(meals_from_db, rkeeper_menu.meals)
-
-        if old_meals:
+        if meals_plan.updates:
             meal_pos_starter_id_map: dict[str, int] = {meal.pos_id: meal.starter_id for meal in meals_from_db}
             try:
                 converted_data = [
-                    meal.convert_to_pos_updater(
+                    with_modifier_groups(meal).convert_to_pos_updater(
                         meal_pos_starter_id_map[meal.pos_id], category_pos_starter_id_map[meal.category_id]
                     )
-                    for meal in old_meals
+                    for meal in meals_plan.updates
                 ]
             except KeyError as e:
                 self.log.error(
@@ -369,19 +591,19 @@ class Sync:
 
             self.pos_gateway.update_meals(converted_data)
 
-        if not new_meals:
+        if not meals_plan.creates:
             return
 
         try:
-            new_meal_pos_id_map = {meal.pos_id: meal for meal in new_meals}
+            new_meal_pos_id_map = {meal.pos_id: meal for meal in meals_plan.creates}
             converted_data = [
                 pos.CreateMeal(
                     pos_id=meal.pos_id,
                     category_ids=[category_pos_starter_id_map[meal.category_id]] or [],
                     delivery_restrictions=[],
-                    **meal.dict(exclude={"external_id", "pos_id"}),
+                    **with_modifier_groups(meal).dict(exclude={"external_id", "pos_id"}),
                 )
-                for meal in new_meals
+                for meal in meals_plan.creates
             ]
         except KeyError as e:
             self.log.error(
@@ -402,110 +624,86 @@ class Sync:
             ]
             self.menu_repo.create_meals(self.client.id, starter_created_meals)
 
-    def _sync_meal_offers(
-        self,
-        meals_from_db: Sequence[Meal],
-        rkeeper_menu: RKeeperMenu,
-        shop: Shop,
-        limited_list: list[RKeeperLimitedListItem],
+    def _apply_meal_offers(
+        self, meal_offers_plan: EntityPlan[RKeeperMeal], meals_from_db: Sequence[Meal], shop: Shop
     ) -> None:
-        missing_meals: list[pos.menu.UpdateMealOffer] = self._get_local_meals_missing_on_rkeeper(
-            meals_from_db, rkeeper_menu.meals, shop.id
-        )
-
-        if limited_list:
-            limited_list_external_id_meal_map = {
-                item.external_id: item
-                for item in limited_list
-                if item.restaurant_id == shop.pos_id and item.type_of_dish == RKeeperLimitedListItemTypeOfDish.PRODUCT
-            }
-            for meal in rkeeper_menu.meals:
-                if limited_meal := limited_list_external_id_meal_map.get(meal.external_id):
-                    meal.quantity = limited_meal.quantity
-
-        db_meal_offers: list[MealOffer] = [
-            offer for meal in meals_from_db for offer in meal.offers if offer.shop_id == shop.id
-        ]
-
-        new_meals, old_meals = self._split_by_novelty_by_pos_id(db_meal_offers, rkeeper_menu.meals)
-
         meal_pos_id_map: dict[str, Meal] = {meal.pos_id: meal for meal in meals_from_db}
-        meal_offer_pos_starter_id = {
-            offer.pos_id: offer.starter_id
-            for meal in meals_from_db
-            for offer in meal.offers
-            if offer.shop_id == shop.id
+        meal_offer_pos_map: dict[str, MealOffer] = {
+            offer.pos_id: offer for meal in meals_from_db for offer in meal.offers if offer.shop_id == shop.id
         }
         meal_offer_update_data: list[pos.menu.UpdateMealOffer] = []
-        if old_meals:
+        if meal_offers_plan.updates:
             try:
-                meal_offer_update_data.extend(
-                    meal.convert_to_meal_offer_updater(
-                        meal_offer_pos_starter_id[meal.pos_id],
-                        meal_pos_id_map[meal.pos_id].starter_id,
-                        shop.pos_id,
+                for meal in meal_offers_plan.updates:
+                    meal_offer = meal_offer_pos_map[meal.pos_id]
+                    meal_offer_update_data.append(
+                        meal.convert_to_meal_offer_updater(
+                            meal_offer.starter_id, meal_pos_id_map[meal.pos_id].starter_id, shop.pos_id
+                        )
                     )
-                    for meal in old_meals
-                )
+                    # от этих значений синхронизация остатков считает, что изменилось
+                    meal_offer.price = meal.price
+                    meal_offer.quantity = meal.get_offer_quantity(shop.pos_id)
+                    meal_offer.in_stop_list = meal.is_in_stop_list(shop.pos_id)
             except KeyError as e:
                 self.log.error(
                     "Object does not exist.",
                     entity=Entity.MEAL,
                     pos_id=str(e),
                     meal_pos_id_starter_id=meal_pos_id_map,
-                    meal_offer_pos_starter_id=meal_offer_pos_starter_id,
+                    meal_offer_pos_starter_id={
+                        pos_id: offer.starter_id for pos_id, offer in meal_offer_pos_map.items()
+                    },
                 )
                 raise ObjectDoesNotExist(Entity.MEAL, str(e))
 
-        if missing_meals:
-            meal_offer_update_data.extend(missing_meals)
+        meal_offer_update_data.extend(
+            self._convert_meal_offer_deactivations(meal_offers_plan.deactivations, meals_from_db, shop.id)
+        )
+        for meal_pos_id in meal_offers_plan.deactivations:
+            if meal_offer := meal_offer_pos_map.get(meal_pos_id):
+                meal_offer.price, meal_offer.quantity, meal_offer.in_stop_list = planner.DEACTIVATED_MEAL_OFFER_STATE
 
         if meal_offer_update_data:
-            for meal_offers_batch in generate_batch(meal_offer_update_data):
-                self.pos_gateway.update_meal_offers(meal_offers_batch, shop.starter_id)
+            self.pos_gateway.update_meal_offers(meal_offer_update_data, shop.starter_id)
 
-        if not new_meals:
+        if not meal_offers_plan.creates:
             return
 
-        try:
-            meal_offer_create_data = [
-                meal.convert_to_meal_offer_creator(
-                    meal.pos_id,
-                    meal_pos_id_map[meal.pos_id].starter_id,
-                    shop.pos_id,
+        # блюдо, которое gateway отклонил, не создано: предложение для него выгрузится, когда блюдо исправят
+        not_created_meal_pos_ids = [
+            meal.pos_id for meal in meal_offers_plan.creates if meal.pos_id not in meal_pos_id_map
+        ]
+        if not_created_meal_pos_ids:
+            self.log.warn("Skip offers of meals not created in gateway", pos_ids=not_created_meal_pos_ids)
+
+        meal_offer_create_data = [
+            meal.convert_to_meal_offer_creator(
+                meal.pos_id,
+                meal_pos_id_map[meal.pos_id].starter_id,
+                shop.pos_id,
+            )
+            for meal in meal_offers_plan.creates
+            if meal.pos_id in meal_pos_id_map
+        ]
+        if not meal_offer_create_data:
+            return
+
+        if created_meal_offers := self.pos_gateway.create_meal_offers(meal_offer_create_data, shop.starter_id).data:
+            new_meal_pos_id_map = {meal.pos_id: meal for meal in meal_offers_plan.creates}
+            domain_meal_offer_data = [
+                MealOfferStarterCreated(
+                    meal_id=meal_pos_id_map[starter_meal_offer.pos_id].id,
+                    price=new_meal_pos_id_map[starter_meal_offer.pos_id].price,
+                    quantity=new_meal_pos_id_map[starter_meal_offer.pos_id].get_offer_quantity(shop.pos_id),
+                    in_stop_list=new_meal_pos_id_map[starter_meal_offer.pos_id].is_in_stop_list(shop.pos_id),
+                    **starter_meal_offer.dict(),
                 )
-                for meal in new_meals
+                for starter_meal_offer in created_meal_offers
             ]
-        except KeyError as e:
-            self.log.error("Object does not exist.", entity=Entity.MEAL, pos_id=e, map=meal_pos_id_map)
-            raise ObjectDoesNotExist(Entity.MEAL, str(e))
-
-        for meal_offer_batch in generate_batch(meal_offer_create_data):
-            if created_meal_offers := self.pos_gateway.create_meal_offers(meal_offer_batch, shop.starter_id).data:
-                domain_meal_offer_data = [
-                    MealOfferStarterCreated(
-                        meal_id=meal_pos_id_map[starter_meal_offer.pos_id].id, **starter_meal_offer.dict()
-                    )
-                    for starter_meal_offer in created_meal_offers
-                ]
-                self.menu_repo.create_meal_offers(domain_meal_offer_data, shop.id)
-
-    @staticmethod
-    def _split_modifiers_by_novelty(
-        db_modifiers: Sequence[Modifier], modifiers: list[DomainModifierSchema]
-    ) -> tuple[list[DomainModifierSchema], list[DomainModifierSchema]]:
-        new_objects, old_objects = [], []
-        if not modifiers:
-            return [], []
-
-        db_modifiers_ids = {db_object.specific_external_id: 1 for db_object in db_modifiers}
-        for rkeeper_object in modifiers:
-            object_exists = db_modifiers_ids.get(rkeeper_object.specific_external_id)
-            old_objects.append(rkeeper_object) if object_exists else new_objects.append(rkeeper_object)
+            self.menu_repo.create_meal_offers(domain_meal_offer_data, shop.id)
 
-        return new_objects, old_objects
-
-    def _get_converted_modifiers(self, modifiers: list[DomainModifierSchema]) -> list[ModifierInGroup]:
+    def _get_converted_modifiers(self, modifiers: Sequence[DomainModifierSchema]) -> list[ModifierInGroup]:
         converted_modifiers = []
         for modifier in sorted(modifiers, key=lambda el: el.specific_id):
             try:
@@ -545,88 +743,82 @@ class Sync:
             domain_order_pos_id_map=domain_order_pos_id_map,
         )
         for status_order in rkeeper_orders:
-            domain_orders = domain_order_pos_id_map[status_order.order_id]
-            is_order_already_done = domain_orders.done
-            with tracer.start_as_current_span("update order status") as span:
-                span.set_attribute("rkeeper.order.id", str(status_order.order_id))
-                span.set_attribute("order.id", str(status_order.order_external_id))
-                span.set_attribute("rkeeper.order.status", str(status_order.order_status_id.name))
-                span.set_attribute("client.id", self.client.client_id)
-
-                logger.info("Order status", is_order_already_done=is_order_already_done, pos_id=status_order.order_id)
-                if status_order.order_status_id in (RkeeperOrderStatusEnum.CANCELLED, RkeeperOrderStatusEnum.DELIVERED):
-                    self.order_repo.set_order_to_done(self.client.id, status_order.order_id)
-                    logger.info(
-                        "Order status", is_order_already_done=is_order_already_done, pos_id=status_order.order_id
-                    )
+            converted_data = self._process_order_status(
+                status_order, domain_order_pos_id_map[status_order.order_id], paid_orders
+            )
+            if converted_data:
+                status_of_orders.append(converted_data)
 
-                span.set_attribute("rkeeper.order.payment_status", status_order.payment_status)
-                can_pay = (
-                    not self.client.is_skip_update_order_payment_status
-                    and status_order.payment_type_id == RkeeperPaymentTypeEnum.ONLINE
-                    and status_order.order_id in paid_orders
-                    and status_order.order_external_id
-                    and status_order.order_status_id in RkeeperOrderStatusEnum.ready_to_pay()
-                    and status_order.payment_status == RkeeperPaymentStatusEnum.NOT_PAID
-                )
-                logger.info(
-                    "Can we pay",
-                    is_skip_update_order_payment_status=self.client.is_skip_update_order_payment_status,
-                    pos_order_id=status_order.order_id,
-                    paument_type=status_order.payment_type_id,
-                    order_external_id=status_order.order_external_id,
-                    status=status_order.order_status_id,
-                    payment_status=status_order.payment_status,
-                    paid_orders=paid_orders,
-                    can_pay=can_pay,
-                    client_id=self.client.client_id,
-                )
-                if can_pay:
-                    discount_price = self.order_repo.get_discount_price(self.client.id, status_order.order_id)
-                    logger.info(
-                        "Data for pay api",
-                        order_id=status_order.order_id,
-                        full_amount=status_order.full_amount,
-                        discount_price=discount_price,
-                    )
-                    try:
-                        json = self.rkeeper.order_payment(status_order.order_id)
-                    except HTTPError as e:
-                        logger.error(
-                            f"Payment error",
-                            order_id=status_order.order_id,
-                            client_id=self.client.client_id,
-                            exc_info=str(e),
-                        )
-                        span.set_attribute("response.error", str(e))
-                        continue
+        if status_of_orders:
+            self.pos_gateway.update_status_of_orders(status_of_orders)
 
-                    span.set_attribute("response", str(json))
-                    if "errors" in json:
-                        logger.warn(
-                            f"Payment error for {status_order.order_id}, json={json}, client_id={self.client.client_id}"
-                        )
-                        span.set_attribute("response.error", str(json))
-                else:
-                    logger.info("Cant pay")
+    def order_status(self, status_order: RKeeperOrderStatus) -> None:
+        domain_order = self.order_repo.get_order_by_client_and_pos_id(self.client.id, status_order.order_id)
+        if not domain_order:
+            self.log.info("Order not found", pos_id=status_order.order_id, client_id=self.client.client_id)
+            return
 
-            if not is_order_already_done:
-                starter_order_id = domain_orders.starter_id
-                converted_data = status_order.convert_to_pos_updater(starter_order_id)
+        # как и опрос статусов, завершенные заказы не трогаем: статус уже отправлен, оплата не нужна
+        if domain_order.done:
+            self.log.info("Order is already done", pos_id=status_order.order_id, client_id=self.client.client_id)
+            return
 
-                if not converted_data:
-                    continue
+        paid_orders = [domain_order.pos_id] if domain_order.is_paid else []
+        if converted_data := self._process_order_status(status_order, domain_order, paid_orders):
+            self.pos_gateway.update_status_of_orders([converted_data])
+
+    def _process_order_status(
+        self, status_order: RKeeperOrderStatus, domain_order: Order, paid_orders: Sequence[str]
+    ) -> Optional[OrderStatusUpdater]:
+        is_order_already_done = domain_order.done
+        with tracer.start_as_current_span("update order status") as span:
+            span.set_attribute("rkeeper.order.id", str(status_order.order_id))
+            span.set_attribute("order.id", str(status_order.order_external_id))
+            span.set_attribute("rkeeper.order.status", str(status_order.order_status_id.name))
+            span.set_attribute("client.id", self.client.client_id)
+
+            logger.info("Order status", is_order_already_done=is_order_already_done, pos_id=status_order.order_id)
+            if status_order.order_status_id in (RkeeperOrderStatusEnum.CANCELLED, RkeeperOrderStatusEnum.DELIVERED):
+                self.order_repo.set_order_to_done(self.client.id, status_order.order_id)
+                logger.info("Order status", is_order_already_done=is_order_already_done, pos_id=status_order.order_id)
 
-                status_of_orders.append(converted_data)
+            span.set_attribute("rkeeper.order.payment_status", status_order.payment_status)
+            can_pay = (
+                not self.client.is_skip_update_order_payment_status
+                and status_order.payment_type_id == RkeeperPaymentTypeEnum.ONLINE
+                and status_order.order_id in paid_orders
+                and status_order.order_external_id
+                and status_order.order_status_id in RkeeperOrderStatusEnum.ready_to_pay()
+                and status_order.payment_status == RkeeperPaymentStatusEnum.NOT_PAID
+            )
+            logger.info(
+                "Can we pay",
+                is_skip_update_order_payment_status=self.client.is_skip_update_order_payment_status,
+                pos_order_id=status_order.order_id,
+                paument_type=status_order.payment_type_id,
+                order_external_id=status_order.order_external_id,
+                status=status_order.order_status_id,
+                payment_status=status_order.payment_status,
+                paid_orders=paid_orders,
+                can_pay=can_pay,
+                client_id=self.client.client_id,
+            )
+            if can_pay:
+                # оплату проводит settle_order_payments, здесь заказ только ставится в очередь
+                self.order_repo.mark_order_payment_pending(domain_order.id, datetime.utcnow())
+            elif status_order.payment_status == RkeeperPaymentStatusEnum.PAID:
+                self.order_repo.confirm_order_payment(domain_order.id)
 
-        if status_of_orders:
-            self.pos_gateway.update_status_of_orders(status_of_orders)
+            if is_order_already_done:
+                return None
 
-    def _get_local_meals_missing_on_rkeeper(
-        self, meals_from_db: Sequence[Meal], rkeeper_meals: list[RKeeperMeal], shop_id: int
-    ) -> list:
-        rkeeper_meal_ids = {meal.pos_id for meal in rkeeper_meals}
+            return status_order.convert_to_pos_updater(domain_order.starter_id)
 
+    @staticmethod
+    def _convert_meal_offer_deactivations(
+        meal_pos_ids: Sequence[str], meals_from_db: Sequence[Meal], shop_id: int
+    ) -> list[pos.menu.UpdateMealOffer]:
+        meal_pos_id_map: dict[str, Meal] = {meal.pos_id: meal for meal in meals_from_db}
         meal_offer_pos_starter_id = {
             offer.pos_id: offer.starter_id
             for meal in meals_from_db
@@ -634,30 +826,29 @@ class Sync:
             if offer.shop_id == shop_id
         }
         meal_offer_not_on_menu = []
-        for domain_meal in meals_from_db:
-            if domain_meal.pos_id not in rkeeper_meal_ids:
-                try:
-                    meal_offer_not_on_menu.append(
-                        pos.menu.UpdateMealOffer(
-                            quantity=0,
-                            price=0,
-                            meal_id=domain_meal.starter_id,
-                            id=meal_offer_pos_starter_id[domain_meal.pos_id],
-                        )
-                    )
-                except KeyError:
-                    continue
+        for meal_pos_id in meal_pos_ids:
+            if meal_pos_id not in meal_offer_pos_starter_id:
+                continue
+
+            meal_offer_not_on_menu.append(
+                pos.menu.UpdateMealOffer(
+                    quantity=0,
+                    price=0,
+                    meal_id=meal_pos_id_map[meal_pos_id].starter_id,
+                    id=meal_offer_pos_starter_id[meal_pos_id],
+                )
+            )
 
         return meal_offer_not_on_menu
 
-    def _sync_shops(self, shops_from_db: Sequence[Shop], rkeeper_shops: list[RKeeperShop]) -> None:
-        new_objects, old_objects = self._split_by_novelty_by_pos_id(shops_from_db, rkeeper_shops)
+    def _sync_shops(self, shops_from_db: Sequence[Shop], rkeeper_shops: list[RKeeperShop]) -> EntityPlan[RKeeperShop]:
+        shops_plan = planner.split_by_pos_id(rkeeper_shops, frozenset(shop.pos_id for shop in shops_from_db))
 
         object_pos_starter_id_map: dict[str, int] = {obj.pos_id: obj.starter_id for obj in shops_from_db}
-        if old_objects:
+        if shops_plan.updates:
             try:
                 converted_update_data = [
-                    i.convert_to_pos_updater(object_pos_starter_id_map[i.pos_id]) for i in old_objects
+                    i.convert_to_pos_updater(object_pos_starter_id_map[i.pos_id]) for i in shops_plan.updates
                 ]
             except KeyError as e:
                 self.log.error("Cannot find object to update", object_id=str(e), enitity=Entity.SHOP)
@@ -665,22 +856,23 @@ class Sync:
 
             self.pos_gateway.update_shops(converted_update_data)
 
-        if not new_objects:
-            return
+        if not shops_plan.creates:
+            return shops_plan
 
-        converted_create_data = [i.convert_to_pos_creator() for i in new_objects]
+        converted_create_data = [i.convert_to_pos_creator() for i in shops_plan.creates]
         if created_objects := self.pos_gateway.create_shops(converted_create_data).data:
             self.client_repo.create_shops(self.client.id, created_objects)
 
-    def _sync_categories(
-        self, categories_from_db: Sequence[Category], rkeeper_categories: list[RKeeperCategory]
+        return shops_plan
+
+    def _apply_categories(
+        self, categories_plan: EntityPlan[RKeeperCategory], categories_from_db: Sequence[Category]
     ) -> None:
-        new_objects, old_objects = self._split_by_novelty_by_pos_id(categories_from_db, rkeeper_categories)
         object_pos_starter_id_map: dict[str, int] = {obj.pos_id: obj.starter_id for obj in categories_from_db}
-        if old_objects:
+        if categories_plan.updates:
             try:
                 converted_update_data = [
-                    i.convert_to_pos_updater(object_pos_starter_id_map[i.pos_id]) for i in old_objects
+                    i.convert_to_pos_updater(object_pos_starter_id_map[i.pos_id]) for i in categories_plan.updates
                 ]
             except KeyError as e:
                 self.log.error("Cannot find object to update", object_id=str(e), enitity=Entity.CATEGORY)
@@ -688,134 +880,51 @@ class Sync:
 
             self.pos_gateway.update_categories(converted_update_data)
 
-        if not new_objects:
+        if not categories_plan.creates:
             return
 
-        converted_create_data = [i.convert_to_pos_creator() for i in new_objects]
+        converted_create_data = [i.convert_to_pos_creator() for i in categories_plan.creates]
         if created_objects := self.pos_gateway.create_categories(converted_create_data).data:
             self.menu_repo.create_categories(self.client.id, created_objects)
 
     def _find_modifier_groups(
         self,
         meal_scheme_id: Optional[str],
-        modifier_schemas: list[RKeeperModifiersSchemes],
+        modifier_schema_by_id: dict[str, RKeeperModifiersSchemes],
+        modifier_group_ids_by_scheme_id: dict[str, list[int]],
     ) -> list[int]:
-        modifier_group_ids = []
-        if meal_scheme_id:
-            for modifier_schema in modifier_schemas:
-                if modifier_schema.pos_id == meal_scheme_id:
-                    for modifier_group in modifier_schema.modifier_groups:
-                        try:
-                            specific_modifier_group_id = (
-                                f"{modifier_group.id}/{modifier_group.min_amount}/{modifier_group.max_amount}"
-                            )
-                            hashed_modifier_group_id = self.rkeeper_modifier_group_specific_hash_id_map[
-                                specific_modifier_group_id
-                            ]
-                            modifier_group_starter_id = self.modifier_group_hashed_id_map[
-                                hashed_modifier_group_id
-                            ].starter_id
-
-                            modifier_group_ids.append(modifier_group_starter_id)
-
-                        except KeyError:
-                            self.log.error(
-                                "Cannot find modifier group to update",
-                                modifier_group_id=modifier_group.id,
-                                min_amount=modifier_group.min_amount,
-                                max_amount=modifier_group.max_amount,
-                                is_use_global_modifier_complex=self.client.is_use_global_modifier_complex,
-                                rkeeper_modifier_group_specific_hash_id_map=self.rkeeper_modifier_group_specific_hash_id_map,
-                                modifier_group_hashed_id_map=self.modifier_group_hashed_id_map,
-                            )
-                            raise ObjectDoesNotExist(Entity.MODIFIER_GROUP, modifier_group.id)
-
-        return modifier_group_ids
-
-    def _parse_modifiers_and_modifier_groups(
-        self,
-        rkeeper_menu: RKeeperMenu,
-    ) -> Tuple[dict[str, DomainModifierSchema], dict[str, DomainModifierGroupSchema]]:
-        modifier_data_by_id: dict[str, RKeeperModifiers] = {
-            modifier.pos_id: modifier for modifier in rkeeper_menu.modifiers
-        }
-        modifier_group_by_id = {
-            modifier_group.pos_id: modifier_group for modifier_group in rkeeper_menu.modifier_groups
-        }
-        modifiers_for_update = {}
-        modifier_groups_for_update = {}
-        for modifier_schema in rkeeper_menu.modifier_schemas:
-            for modifier_group_in_schema in modifier_schema.modifier_groups:
-                modifier_group = modifier_group_by_id[modifier_group_in_schema.id]
-                modifiers_of_this_group = []
-
-                # Нужно для формирования глобального id модификатора
-                for modifier_id in modifier_group.modifiers:
-                    modifier_data = modifier_data_by_id[modifier_id]
-
-                    modifier_min_amount = 0
-                    modifier_max_amount = modifier_group_in_schema.max_amount
-                    if self.client.get_modifier_max_amount and modifier_data.max_amount:
-                        modifier_max_amount = modifier_data.max_amount
-
-                    modifier = DomainModifierSchema(
-                        pos_id=modifier_id,
-                        name=modifier_data.name,
-                        price=modifier_data.price,
-                        min_amount=modifier_min_amount,
-                        max_amount=modifier_max_amount,
-                        images=modifier_data.images,
-                        required=True if modifier_min_amount else False,
-                        external_id=modifier_data.external_id,
-                    )
-                    modifiers_for_update[modifier.specific_id] = modifier
-                    modifiers_of_this_group.append(modifier)
-
-                domain_modifier_group = DomainModifierGroupSchema(
-                    pos_id=modifier_group_in_schema.id,
-                    min_amount=modifier_group_in_schema.min_amount,
-                    max_amount=modifier_group_in_schema.max_amount,
-                    modifiers=modifiers_of_this_group,
-                    name=modifier_group.name,
-                    required=True if modifier_group_in_schema.min_amount else False,
-                )
+        if not meal_scheme_id or meal_scheme_id not in modifier_schema_by_id:
+            return []
 
-                # сохраняем группу
-                if self.client.is_use_global_modifier_complex:
-                    modifier_groups_for_update[domain_modifier_group.hashed_id] = domain_modifier_group
-                else:
-                    modifier_groups_for_update[domain_modifier_group.specific_id] = domain_modifier_group
+        if meal_scheme_id not in modifier_group_ids_by_scheme_id:
+            modifier_group_ids_by_scheme_id[meal_scheme_id] = self._resolve_modifier_group_ids(
+                modifier_schema_by_id[meal_scheme_id]
+            )
 
-        return modifiers_for_update, modifier_groups_for_update
+        return list(modifier_group_ids_by_scheme_id[meal_scheme_id])
 
-    @staticmethod
-    def _split_by_novelty_by_pos_id(
-        data_from_db: Sequence[Category | Shop | Meal | MealOffer | ModifierGroup | Modifier | ModifierOffer],
-        rkeeper_objects: RkeeperTypes,
-    ) -> Tuple[RkeeperTypes, RkeeperTypes]:
-        new_objects, old_objects = [], []
-        if not rkeeper_objects:
-            return [], []
+    def _resolve_modifier_group_ids(self, modifier_schema: RKeeperModifiersSchemes) -> list[int]:
+        modifier_group_ids = []
+        for modifier_group in modifier_schema.modifier_groups:
+            try:
+                specific_modifier_group_id = (
+                    f"{modifier_group.id}/{modifier_group.min_amount}/{modifier_group.max_amount}"
+                )
+                hashed_modifier_group_id = self.rkeeper_modifier_group_specific_hash_id_map[specific_modifier_group_id]
+                modifier_group_starter_id = self.modifier_group_hashed_id_map[hashed_modifier_group_id]
 
-        db_modifiers_ids = {db_object.pos_id: 1 for db_object in data_from_db}
-        for rkeeper_object in rkeeper_objects:
-            object_exists = db_modifiers_ids.get(rkeeper_object.pos_id)
-            old_objects.append(rkeeper_object) if object_exists else new_objects.append(rkeeper_object)
+                modifier_group_ids.append(modifier_group_starter_id)
 
-        return new_objects, old_objects
+            except KeyError:
+                self.log.error(
+                    "Cannot find modifier group to update",
+                    modifier_group_id=modifier_group.id,
+                    min_amount=modifier_group.min_amount,
+                    max_amount=modifier_group.max_amount,
+                    is_use_global_modifier_complex=self.client.is_use_global_modifier_complex,
+                    rkeeper_modifier_group_specific_hash_id_map=self.rkeeper_modifier_group_specific_hash_id_map,
+                    modifier_group_hashed_id_map=self.modifier_group_hashed_id_map,
+                )
+                raise ObjectDoesNotExist(Entity.MODIFIER_GROUP, modifier_group.id)
 
-    @staticmethod
-    def _split_modifier_group_by_novelty(
-        db_modifier_groups: Sequence[ModifierGroup],
-        rkeeper_modifier_groups: list[DomainModifierGroupSchema],
-    ) -> Tuple[list[DomainModifierGroupSchema], list[DomainModifierGroupSchema]]:
-        new_groups, old_groups = [], []
-        if not rkeeper_modifier_groups:
-            return [], []
-
-        db_modifier_groups_ids = {modifier_group.hashed_id: 1 for modifier_group in db_modifier_groups}
-        for rkeeper_group in rkeeper_modifier_groups:
-            object_exists = db_modifier_groups_ids.get(rkeeper_group.hashed_id)
-            old_groups.append(rkeeper_group) if object_exists else new_groups.append(rkeeper_group)
-
-        return new_groups, old_groups
+        return modifier_group_ids
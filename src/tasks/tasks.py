@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta
 from typing import Any
 
 from celery import (
@@ -9,6 +10,8 @@ from celery.signals import worker_process_init
 from httpx import HTTPStatusError
 from opentelemetry.instrumentation.celery import CeleryInstrumentor  # type: ignore
 
+from src.clients.circuit_breaker import CircuitOpenError
+from src.clients.rate_limiter import RateLimitExceededError
 from src.clients.pos_client import (
     PosGatewayClientError,
     PosGatewayClientInvalidError,
@@ -20,13 +23,19 @@ from src.clients.rkeeper_client import (
 )
 from src.config import settings
 from src.core.repositories.client import ClientRepository
+from src.core.repositories.order import OrderRepository
 from sqlalchemy.orm import Session
 
 from src.db import SessionLocal
 from src.logger import get_logger
+from src.services.gateway_outbox import GatewayOutboxDispatcher
+from src.services.order_payment import OrderPaymentSettlement
+from src.services import rkeeper_snapshots
+from src.services.order_retention import OrderRetention
 from src.services.transfer_menu_from_client_to_project import MenuTransfer
 from src.tasks.sync import (
     Sync,
+    get_next_status_poll_at,
 )
 from src.tracer import init_tracer
 
@@ -66,17 +75,41 @@ def setup_periodic_tasks(sender, **kwargs) -> None:  # type: ignore
         sync_shops.s(),
     )
     sender.add_periodic_task(
-        crontab(minute="*/5"),
+        crontab(minute=settings.TIME_SYNC_MENU),
         sync_menu.s(),
     )
+    # остатки и стоп-лист меняются чаще меню, их выгружаем отдельно, не дожидаясь полной синхронизации
     sender.add_periodic_task(
-        crontab(minute="*"),
+        settings.SYNC_STOCK_INTERVAL,
+        sync_stock.s(),
+    )
+    # статусы приходят вебхуком, опрос нужен для сверки. Клиентов без открытых заказов не опрашиваем,
+    # интервал для остальных зависит от возраста заказов, см. get_status_poll_interval
+    sender.add_periodic_task(
+        crontab(minute=settings.TIME_SYNC_STATUS),
         sync_status_of_orders.s(),
     )
+    sender.add_periodic_task(
+        crontab(minute="*"),
+        settle_order_payments.s(),
+    )
+    # синхронизация запускает отправку сама, по расписанию повторяются неудачные записи
+    sender.add_periodic_task(
+        crontab(minute="*"),
+        dispatch_gateway_outbox.s(),
+    )
+    sender.add_periodic_task(
+        crontab(minute="30"),
+        expire_and_archive_orders.s(),
+    )
+    sender.add_periodic_task(
+        crontab(minute="40"),
+        expire_rkeeper_snapshots.s(),
+    )
 
 
 @app.task(bind=True, base=DBTask)
-def sync_shops(self: DBTask, client_id: str | None = None) -> None:
+def sync_shops(self: DBTask, client_id: str | None = None, dry_run: bool = False) -> None:
     logger.info("Sync of shops has begun")
 
     client_repo = ClientRepository(self.db)
@@ -84,8 +117,17 @@ def sync_shops(self: DBTask, client_id: str | None = None) -> None:
     for client in clients:  # type: ignore
         logger.info(f"Sync of shops for client_id: {client.client_id}")
         try:
-            Sync(self.db, client).shops()
-            self.db.commit()
+            sync = Sync(self.db, client, dry_run=dry_run)
+            report = sync.shops()
+            if dry_run:
+                logger.info("Dry run of shops sync", client_id=client.client_id, **report.as_dict())
+            else:
+                sync.commit()
+                dispatch_gateway_outbox.delay(client.client_id)
+        except (CircuitOpenError, RateLimitExceededError) as e:
+            # повтор через 5 секунд только добавит нагрузки сервису, который и так недоступен или перегружен
+            logger.warn("Skip shops sync, upstream is unavailable", client_id=client.client_id, e=str(e))
+            continue
         except (PosGatewayClientError, RkeeperClientError) as e:
             logger.error(str(e))
             raise self.retry(countdown=5, max_retries=3)
@@ -96,11 +138,15 @@ def sync_shops(self: DBTask, client_id: str | None = None) -> None:
         ) as e:
             logger.error(str(e))
             continue
+        finally:
+            if dry_run:
+                # созданное в dry-run существует только в этой сессии
+                self.db.rollback()
     logger.info("Sync of shops is finished")
 
 
 @app.task(bind=True, base=DBTask)
-def sync_menu(self: DBTask, client_id: str | None = None) -> None:
+def sync_menu(self: DBTask, client_id: str | None = None, dry_run: bool = False) -> None:
     logger.info("Sync of menu has begun")
     client_repo = ClientRepository(self.db)
     clients = [client_repo.get_client_by_client_id(client_id)] if client_id else client_repo.get_active_clients()
@@ -111,16 +157,27 @@ def sync_menu(self: DBTask, client_id: str | None = None) -> None:
 
         logger.info(f"Sync of menu for client_id: {client.client_id}")
         log = logger.bind(client_id=client.client_id, stream="sync_menu")
-        sync = Sync(self.db, client, log)
+        sync = Sync(self.db, client, log, dry_run=dry_run)
         try:
             for shop in client.shops:
                 try:
                     log.info("Start sync shop menu", shop=shop.pos_id)
-                    sync.menu(shop.pos_id)
-                    self.db.commit()
+                    report = sync.menu(shop.pos_id)
+                    if dry_run:
+                        log.info("Dry run of menu sync", shop=shop.pos_id, **report.as_dict())
+                    else:
+                        sync.commit()
+                        dispatch_gateway_outbox.delay(client.client_id)
                 except HTTPStatusError:
                     logger.exception("Error while parsing menu", client_id=client.client_id)
                     continue
+                finally:
+                    if dry_run:
+                        # созданное в dry-run существует только в этой сессии
+                        self.db.rollback()
+        except (CircuitOpenError, RateLimitExceededError) as e:
+            log.warn("Skip menu sync, upstream is unavailable", e=str(e))
+            continue
         except (
             RkeeperClientInvalidError,
             PosGatewayClientError,
@@ -133,14 +190,46 @@ def sync_menu(self: DBTask, client_id: str | None = None) -> None:
     logger.info("Sync of menu is finished")
 
 
+@app.task(bind=True, base=DBTask)
+def sync_stock(self: DBTask, client_id: str | None = None, dry_run: bool = False) -> None:
+    client_repo = ClientRepository(self.db)
+    clients = [client_repo.get_client_by_client_id(client_id)] if client_id else client_repo.get_active_clients()
+    for client in clients:
+        if not client.project_id:
+            continue
+
+        log = logger.bind(client_id=client.client_id, stream="sync_stock")
+        sync = Sync(self.db, client, log, dry_run=dry_run)
+        try:
+            for shop in client.shops:
+                report = sync.stock(shop.pos_id)
+                if dry_run:
+                    log.info("Dry run of stock sync", shop=shop.pos_id, **report.as_dict())
+                    # созданное в dry-run существует только в этой сессии
+                    self.db.rollback()
+                elif report.entities.get("meal_offers"):
+                    dispatch_gateway_outbox.delay(client.client_id)
+        except (CircuitOpenError, RateLimitExceededError) as e:
+            log.warn("Skip stock sync, upstream is unavailable", e=str(e))
+            continue
+        except Exception as e:
+            self.db.rollback()
+            log.exception("Error while sync stock", e=str(e))
+            continue
+
+
 @app.task(bind=True, base=DBTask)
 def sync_status_of_orders(self: DBTask) -> None:
     logger.info("Sync status orders has started")
     client_repo = ClientRepository(self.db)
-    for client in client_repo.get_active_clients():
+    order_repo = OrderRepository(self.db)
+    now = datetime.utcnow()
+    for client in client_repo.get_clients_for_status_poll(now):
         logger.info(f"Sync status orders for client_id: {client.client_id}")
         try:
             Sync(self.db, client).status_orders()
+            latest_order_created_at = order_repo.get_latest_not_done_order_created_at(client.id)
+            client_repo.set_next_status_poll_at(client.id, get_next_status_poll_at(latest_order_created_at, now))
             self.db.commit()
         except (
             RkeeperClientInvalidError,
@@ -155,6 +244,62 @@ def sync_status_of_orders(self: DBTask) -> None:
     logger.info("Sync status orders is finished")
 
 
+@app.task(bind=True, base=DBTask)
+def settle_order_payments(self: DBTask, client_id: str | None = None) -> None:
+    logger.info("Settlement of order payments has started")
+    client_repo = ClientRepository(self.db)
+    now = datetime.utcnow()
+    sent_before = now - timedelta(seconds=settings.ORDER_PAYMENT_SENT_TIMEOUT)
+    clients = (
+        [client_repo.get_client_by_client_id(client_id)]
+        if client_id
+        else client_repo.get_clients_with_due_payments(now, sent_before)
+    )
+    for client in clients:
+        log = logger.bind(client_id=client.client_id, stream="order_payment")
+        try:
+            settlement = OrderPaymentSettlement(self.db, client, log)
+            settlement.recover(now)
+            settlement.settle(now)
+        except Exception as e:
+            self.db.rollback()
+            log.exception("Error while settle order payments", e=str(e))
+            continue
+
+    logger.info("Settlement of order payments is finished")
+
+
+@app.task(bind=True, base=DBTask)
+def dispatch_gateway_outbox(self: DBTask, client_id: str | None = None) -> None:
+    client_repo = ClientRepository(self.db)
+    now = datetime.utcnow()
+    clients = (
+        [client_repo.get_client_by_client_id(client_id)] if client_id else client_repo.get_clients_with_due_outbox(now)
+    )
+    for client in clients:
+        log = logger.bind(client_id=client.client_id, stream="gateway_outbox")
+        try:
+            GatewayOutboxDispatcher(self.db, client, log).dispatch()
+        except Exception as e:
+            self.db.rollback()
+            log.exception("Error while dispatch gateway outbox", e=str(e))
+            continue
+
+
+@app.task(bind=True, base=DBTask)
+def expire_and_archive_orders(self: DBTask) -> None:
+    log = logger.bind(stream="order_retention")
+    retention = OrderRetention(self.db, log)
+    retention.expire()
+    retention.archive()
+
+
+@app.task(bind=True, base=DBTask)
+def expire_rkeeper_snapshots(self: DBTask) -> None:
+    deleted_count = rkeeper_snapshots.expire_rkeeper_snapshots(self.db)
+    logger.info("Rkeeper snapshots expired", count=deleted_count)
+
+
 @app.task(bind=True, base=DBTask)
 def transfer_client_menu_to_project(self: DBTask, client_id: str | None = None) -> None:
     log = logger.bind(client_id=client_id, stream="transfer_menu")
@@ -0,0 +1,36 @@
+import time
+from dataclasses import dataclass
+
+from src.config import settings
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class Deadline:
+    """
+    Момент, к которому запрос должен быть обработан. Каждый следующий вызов внешнего сервиса получает таймаут не
+    больше оставшегося времени, а если времени почти не осталось, не отправляется вовсе.
+    """
+
+    # по time.monotonic()
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, budget: float) -> float:
+        remaining = self.remaining()
+        if remaining < settings.DEADLINE_MIN_TIMEOUT:
+            raise DeadlineExceededError(f"Deadline is exceeded, {remaining:.2f}s left")
+        return min(budget, remaining)
+
+
+def get_timeout(budget: float, deadline: Deadline | None = None) -> float:
+    return deadline.timeout(budget) if deadline else budget
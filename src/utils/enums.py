@@ -10,3 +10,23 @@ class Entity(str, Enum):
     MEAL = "Meal"
     MEAL_OFFER = "MealOffer"
     ORDER = "Order"
+
+
+class PaymentState(str, Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    # RKeeper принял оплату, ждем подтверждения статусом заказа. Повторно такая оплата не отправляется
+    ACCEPTED = "accepted"
+    CONFIRMED = "confirmed"
+    FAILED = "failed"
+
+
+class OutboxState(str, Enum):
+    PENDING = "pending"
+    FAILED = "failed"
+
+
+class SnapshotKind(str, Enum):
+    MENU = "menu"
+    LIMITED_LIST = "limited_list"
+    ORDER_STATUSES = "order_statuses"
@@ -0,0 +1,56 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    # pydantic-модели сериализуются по алиасам, как .json(by_alias=True)
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class Payload:
+    """
+    Тело запроса, сериализованное один раз: одни и те же байты уходят в http-запрос, логи и спаны.
+    Данные после создания Payload менять нельзя.
+    """
+
+    __slots__ = ("data", "_content", "_text")
+
+    def __init__(self, data: Any) -> None:
+        self.data = data
+        self._content: bytes | None = None
+        self._text: str | None = None
+
+    @classmethod
+    def from_encoded(cls, data: Any, content: bytes) -> "Payload":
+        """content - уже сериализованные data"""
+        payload = cls(data)
+        payload._content = content
+        return payload
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = dumps(self.data)
+        return self._content
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.content.decode()
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.content)
@@ -260,3 +260,125 @@ def test_order_with_loyalty(
         )
     )
     mock_preliminary_calculation.assert_called_once()
+
+
+@patch("src.clients.pos_client.PosGatewayClient.update_status_of_orders")
+@patch("src.clients.rkeeper_client.RkeeperClient.order_payment")
+def test_update_order_status(
+    mock_order_payment,
+    mock_update_status_of_orders,
+    db_session,
+    create_client,
+    client,
+    redis_client,
+):
+    domain_client = create_client()
+    db_session.add(
+        Order(
+            client_id=domain_client.id,
+            pos_id="test_pos_order_id",
+            starter_id="111",
+            bonuses=0,
+            is_paid=False,
+        )
+    )
+    db_session.commit()
+
+    url = "api/order/status"
+    resp = client.post(
+        url,
+        json={
+            "orderId": "test_pos_order_id",
+            "orderStatusId": 13,
+            "paymentTypeId": "cash",
+            "paymentStatus": "notPaid",
+            "fullAmount": 100,
+            "amount": 100,
+        },
+        headers={"Authorization": domain_client.webhook_secret},
+    )
+
+    assert resp.status_code == 204
+    db_order = db_session.query(Order).first()
+    assert db_order.done is True
+    mock_order_payment.assert_not_called()
+    status_updaters = mock_update_status_of_orders.call_args.args[0]
+    assert len(status_updaters) == 1
+    assert status_updaters[0].id == "111"
+    assert status_updaters[0].status == GatewayOrderStatus.DONE
+
+
+@patch("src.clients.pos_client.PosGatewayClient.update_status_of_orders")
+def test_update_status_of_unknown_order(mock_update_status_of_orders, create_client, client, redis_client):
+    domain_client = create_client()
+
+    resp = client.post(
+        "api/order/status",
+        json={
+            "orderId": "unknown_pos_order_id",
+            "orderStatusId": 4,
+            "paymentTypeId": "cash",
+            "paymentStatus": "notPaid",
+            "fullAmount": 100,
+            "amount": 100,
+        },
+        headers={"Authorization": domain_client.webhook_secret},
+    )
+
+    assert resp.status_code == 204
+    mock_update_status_of_orders.assert_not_called()
+
+
+def test_update_order_status_with_api_key(create_client, client, redis_client):
+    domain_client = create_client()
+
+    resp = client.post(
+        "api/order/status",
+        json={
+            "orderId": "test_pos_order_id",
+            "orderStatusId": 13,
+            "paymentTypeId": "cash",
+            "paymentStatus": "notPaid",
+            "fullAmount": 100,
+            "amount": 100,
+        },
+        headers={"Authorization": domain_client.api_key},
+    )
+
+    assert resp.status_code == 403
+
+
+@patch("src.clients.pos_client.PosGatewayClient.update_status_of_orders")
+@patch("src.clients.rkeeper_client.RkeeperClient.order_payment")
+def test_update_status_of_done_order(
+    mock_order_payment, mock_update_status_of_orders, db_session, create_client, client, redis_client
+):
+    domain_client = create_client()
+    db_session.add(
+        Order(
+            client_id=domain_client.id,
+            pos_id="test_pos_order_id",
+            starter_id="111",
+            bonuses=0,
+            is_paid=True,
+            done=True,
+        )
+    )
+    db_session.commit()
+
+    resp = client.post(
+        "api/order/status",
+        json={
+            "orderId": "test_pos_order_id",
+            "orderStatusId": 13,
+            "paymentTypeId": "online",
+            "paymentStatus": "paid",
+            "fullAmount": 100,
+            "amount": 100,
+        },
+        headers={"Authorization": domain_client.webhook_secret},
+    )
+
+    assert resp.status_code == 204
+    mock_order_payment.assert_not_called()
+    mock_update_status_of_orders.assert_not_called()
@@ -0,0 +1,108 @@
+import threading
+
+import orjson
+import pytest
+
+from src.clients.batching import (
+    AdaptiveBatcher,
+    BatchRejectedError,
+    BatchTooLargeError,
+    BatchUnavailableError,
+    item_digest,
+)
+from src.utils.serialization import dumps
+
+
+def test_batches_are_limited_by_items_and_bytes():
+    items = [{"id": i, "name": "x" * (200 if i == 3 else 10)} for i in range(10)]
+    batcher = AdaptiveBatcher(batch_size=4, min_items=1, max_items=4, max_bytes=120, concurrency=2)
+    lock = threading.Lock()
+    sent = []
+
+    def send(payload):
+        assert orjson.loads(payload.content) == payload.data
+        with lock:
+            sent.append(payload.data)
+        return [item["id"] for item in payload.data]
+
+    results = batcher.send(items, send)
+
+    assert [item_id for batch in results for item_id in batch] == list(range(10))
+    assert all(len(batch) <= 4 for batch in sent)
+    # объект больше max_bytes уходит отдельным батчем
+    assert [items[3]] in sent
+
+
+def test_rejected_batch_is_split_and_batch_size_shrinks():
+    batcher = AdaptiveBatcher(batch_size=8, min_items=1, max_items=8, concurrency=1)
+
+    def send(payload):
+        if len(payload.data) > 2:
+            raise BatchTooLargeError
+        return payload.data
+
+    results = batcher.send(list(range(8)), send)
+
+    assert [item for batch in results for item in batch] == list(range(8))
+    # после отказов размер уменьшился, удачные батчи по 2 объекта могли его немного нарастить
+    assert batcher.batch_size <= 4
+
+
+def test_rejected_single_item_is_reraised():
+    batcher = AdaptiveBatcher(batch_size=4, min_items=1, max_items=4, concurrency=1)
+
+    def send(payload):
+        raise BatchTooLargeError
+
+    with pytest.raises(BatchTooLargeError):
+        batcher.send([1], send)
+
+
+def test_batch_size_follows_latency():
+    batcher = AdaptiveBatcher(batch_size=4, min_items=2, max_items=6, target_latency=60, concurrency=1)
+    batcher.send(list(range(4)), lambda payload: None)
+    assert batcher.batch_size == 5
+
+    batcher.target_latency = 1e-9
+    batcher.send(list(range(4)), lambda payload: None)
+    assert batcher.batch_size == 2
+
+
+def test_bad_item_is_isolated_and_rest_is_sent():
+    batcher = AdaptiveBatcher(batch_size=8, min_items=1, max_items=8, concurrency=1, retry_delay=0)
+    rejected = []
+
+    def send(payload):
+        if 5 in payload.data:
+            raise BatchRejectedError
+        return payload.data
+
+    results = batcher.send(list(range(8)), send, lambda item, digest, error: rejected.append((item, digest)))
+
+    assert sorted(item for batch in results for item in batch) == [0, 1, 2, 3, 4, 6, 7]
+    assert rejected == [(5, item_digest(dumps(5)))]
+
+    # в следующий раз отклоненный объект не отправляется
+    sent = []
+    batcher.send(list(range(8)), lambda payload: sent.extend(payload.data), skip={item_digest(dumps(5))})
+    assert sent == [0, 1, 2, 3, 4, 6, 7]
+
+
+def test_unavailable_gateway_is_retried_then_raised():
+    batcher = AdaptiveBatcher(batch_size=8, concurrency=1, retry_attempts=3, retry_delay=0)
+    attempts = []
+
+    def send(payload):
+        attempts.append(payload.data)
+        if len(attempts) < 3:
+            raise BatchUnavailableError
+        return payload.data
+
+    assert batcher.send([1, 2], send) == [[1, 2]]
+    assert len(attempts) == 3
+
+    def unavailable(payload):
+        raise BatchUnavailableError
+
+    with pytest.raises(BatchUnavailableError):
+        batcher.send([1, 2], unavailable, lambda item, digest, error: None)
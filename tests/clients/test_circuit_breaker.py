@@ -0,0 +1,28 @@
+import httpx
+import pytest
+
+from src.clients.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.config import settings
+from src.services.redis_client import Storage
+
+URL = "https://delivery.ucs.ru/orders/api/v1/"
+request = httpx.Request("GET", URL)
+
+
+def test_breaker_opens_and_recovers_after_probe(redis_client, monkeypatch):
+    breaker = CircuitBreaker(URL, "client", storage=Storage())
+    other_client_breaker = CircuitBreaker(URL, "other_client", storage=Storage())
+
+    for _ in range(settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD):
+        breaker.send(lambda: httpx.Response(503, request=request))
+
+    with pytest.raises(CircuitOpenError):
+        breaker.send(lambda: httpx.Response(200, request=request))
+    # ключ хоста еще не открыт, остальные клиенты работают
+    assert other_client_breaker.send(lambda: httpx.Response(200, request=request)).status_code == 200
+
+    # время открытия прошло: пробный запрос закрывает breaker
+    monkeypatch.setattr(settings, "CIRCUIT_BREAKER_OPEN_SECONDS", -1)
+    breaker._open("breaker:delivery.ucs.ru:client")
+    assert breaker.send(lambda: httpx.Response(200, request=request)).status_code == 200
+    assert breaker.send(lambda: httpx.Response(200, request=request)).status_code == 200
@@ -0,0 +1,14 @@
+import pytest
+
+from src.clients.rkeeper_client import RkeeperClient
+from src.utils.deadline import Deadline, DeadlineExceededError
+
+
+def test_timeout_is_limited_by_deadline():
+    assert RkeeperClient._timeout("order", Deadline.after(100)) == 15
+    assert RkeeperClient._timeout("order", Deadline.after(3)) <= 3
+    assert RkeeperClient._timeout("order") == 15
+
+    # времени на запрос уже не осталось, он не отправляется
+    with pytest.raises(DeadlineExceededError):
+        RkeeperClient._timeout("order", Deadline.after(0.5))
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from src.clients.decoders import decode, decode_list, loads
+from src.schemas.rkeeper import RKeeperLimitedListItem, RKeeperMenu, RKeeperOrderStatus, RkeeperOrderStatusEnum
+
+MENU = {
+    "categories": [{"id": "category", "name": "Пицца"}],
+    "products": [
+        {
+            "id": "meal",
+            "name": "Маргарита",
+            "description": None,
+            "externalId": "meal_external_id",
+            "price": 500,
+            "schemeId": "scheme",
+            "categoryId": "category",
+            "proteins": 10,
+            "fats": 10.0,
+            "carbohydrates": "10",
+            "calories": 250,
+            "imageUrls": [],
+            "modifierGroups": None,
+            "isContainInStopList": ["shop"],
+        },
+        {
+            "id": "meal",
+            "name": "Маргарита (дубль)",
+            "externalId": "meal_external_id",
+            "price": 450.5,
+            "categoryId": "category",
+            "imageUrls": [],
+        },
+    ],
+    "ingredients": [
+        {"id": "modifier", "externalId": "modifier_external_id", "name": "Сыр", "price": 49, "imageUrls": []}
+    ],
+    "ingredientsGroups": [{"id": "group", "name": "Добавки", "ingredients": ["modifier"]}],
+    "ingredientsSchemes": [{"id": "scheme", "ingredientsGroups": [{"id": "group", "minCount": 0, "maxCount": 2}]}],
+    "isPossibleDelete": False,
+}
+
+
+def test_decode_menu_matches_strict_validation():
+    menu = decode(RKeeperMenu, loads(orjson.dumps({"result": MENU}))["result"])
+
+    assert menu == RKeeperMenu(**MENU)
+    assert len(menu.meals) == 1
+    assert menu.meals[0].price == 450.5
+    assert menu.modifiers[0].price == "49"
+
+
+def test_decode_invalid_payload_raises_validation_error():
+    with pytest.raises(ValidationError):
+        decode(RKeeperMenu, {**MENU, "products": [{"id": "meal", "price": "free"}]})
+
+
+def test_decode_list_of_order_statuses_and_limited_list():
+    statuses = [
+        {
+            "orderId": "pos_order_id",
+            "orderStatusId": 13,
+            "paymentTypeId": "online",
+            "paymentStatus": "paid",
+            "fullAmount": 100,
+            "amount": 100,
+        }
+    ]
+    limited_list = [{"restaurantId": "shop", "typeOfDish": "product", "externalId": "meal", "name": "Маргарита"}]
+
+    assert decode_list(RKeeperOrderStatus, statuses) == [RKeeperOrderStatus(**status) for status in statuses]
+    assert decode_list(RKeeperOrderStatus, statuses)[0].order_status_id == RkeeperOrderStatusEnum.DELIVERED
+    assert decode_list(RKeeperLimitedListItem, limited_list) == [RKeeperLimitedListItem(**limited_list[0])]
+
+
+@patch("src.clients.decoders.settings.RKEEPER_STRICT_VALIDATION", True)
+def test_decode_strict_validation():
+    assert decode(RKeeperMenu, MENU) == RKeeperMenu(**MENU)
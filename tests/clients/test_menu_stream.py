@@ -0,0 +1,32 @@
+import io
+
+import ijson
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from src.clients.menu_stream import read_menu
+from src.schemas.rkeeper import RKeeperMenu
+from tests.clients.test_decoders import MENU
+
+
+def test_read_menu_matches_full_parsing():
+    menu = read_menu(io.BytesIO(orjson.dumps({"result": MENU})))
+
+    assert menu == RKeeperMenu(**MENU)
+    assert [meal.name for meal in menu.meals] == ["Маргарита (дубль)"]
+    assert menu.is_possible_delete is False
+
+
+def test_read_menu_without_section():
+    partial_menu = {key: value for key, value in MENU.items() if key != "ingredientsSchemes"}
+
+    with pytest.raises(ValidationError):
+        read_menu(io.BytesIO(orjson.dumps({"result": partial_menu})))
+
+
+def test_read_truncated_menu():
+    content = orjson.dumps({"result": MENU})
+
+    with pytest.raises(ijson.JSONError):
+        read_menu(io.BytesIO(content[: len(content) // 2]))
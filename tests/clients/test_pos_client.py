@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from src.clients import pos_client
+from src.clients.pos_client import PosGatewayClient, PosGatewayClientUnavailableError
+from src.config import settings
+from src.schemas.rkeeper import RKeeperCategory
+from src.services.redis_client import Storage
+
+
+@patch("src.clients.pos_client.httpx.post")
+def test_lost_create_is_replayed_with_same_idempotency_key(mock_post, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "POS_GATEWAY_RETRY_DELAY", 0)
+    monkeypatch.setattr(settings, "POS_GATEWAY_IDEMPOTENT_CREATES", True)
+    categories = [RKeeperCategory(**{"id": "55555", "name": "test"}).convert_to_pos_creator()]
+    request = httpx.Request("POST", settings.POS_GATEWAY_URL)
+
+    # gateway создал категорию, но ответ до нас не дошел
+    mock_post.side_effect = httpx.ReadTimeout("timeout", request=request)
+    with pytest.raises(PosGatewayClientUnavailableError):
+        PosGatewayClient("api_key", Storage()).create_categories(categories)
+    assert mock_post.call_count == settings.POS_GATEWAY_RETRY_ATTEMPTS
+
+    mock_post.reset_mock(side_effect=True)
+    mock_post.return_value = httpx.Response(200, json={"data": [{"posId": "55555", "id": 11}]}, request=request)
+    created = PosGatewayClient("api_key", Storage()).create_categories(categories)
+
+    assert [(item.pos_id, item.id) for item in created.data] == [("55555", 11)]
+    idempotency_keys = {call.kwargs["headers"]["Idempotency-Key"] for call in mock_post.call_args_list}
+    assert mock_post.call_count == 1
+    assert len(idempotency_keys) == 1
+
+
+@patch("src.clients.pos_client.httpx.post")
+def test_pending_creates_are_cleared_after_commit(mock_post, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "POS_GATEWAY_IDEMPOTENT_CREATES", True)
+    categories = [RKeeperCategory(**{"id": "55555", "name": "test"}).convert_to_pos_creator()]
+    request = httpx.Request("POST", settings.POS_GATEWAY_URL)
+    mock_post.return_value = httpx.Response(200, json={"data": [{"posId": "55555", "id": 11}]}, request=request)
+
+    pos_gateway = PosGatewayClient("api_key", Storage())
+    pos_gateway.create_categories(categories)
+    # до коммита батч помнится, у каждой записи свой срок
+    assert redis_client.keys("pending_create:*")
+    assert all(
+        0 < redis_client.ttl(name) <= settings.POS_GATEWAY_PENDING_CREATE_TTL
+        for name in redis_client.keys("pending_create:*")
+    )
+
+    pos_gateway.clear_pending_creates()
+
+    assert redis_client.keys("pending_create:*") == []
+
+
+@patch("src.clients.pos_client.httpx.post")
+def test_create_is_not_replayed_without_idempotency_support(mock_post, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "POS_GATEWAY_RETRY_DELAY", 0)
+    categories = [RKeeperCategory(**{"id": "55555", "name": "test"}).convert_to_pos_creator()]
+    mock_post.side_effect = httpx.ReadTimeout("timeout", request=httpx.Request("POST", settings.POS_GATEWAY_URL))
+
+    with pytest.raises(PosGatewayClientUnavailableError):
+        PosGatewayClient("api_key", Storage()).create_categories(categories)
+
+    assert redis_client.keys("pending_create:*") == []
+
+
+@patch("src.clients.pos_client.httpx.post")
+def test_create_is_not_split_on_server_error(mock_post, monkeypatch):
+    monkeypatch.setattr(settings, "POS_GATEWAY_RETRY_DELAY", 0)
+    categories = [
+        RKeeperCategory(**{"id": pos_id, "name": "test"}).convert_to_pos_creator() for pos_id in ("55555", "66666")
+    ]
+    mock_post.return_value = httpx.Response(500, request=httpx.Request("POST", settings.POS_GATEWAY_URL))
+
+    with pytest.raises(PosGatewayClientUnavailableError):
+        PosGatewayClient("api_key").create_categories(categories)
+
+    # батч только повторяется целиком, без деления
+    assert mock_post.call_count == settings.POS_GATEWAY_RETRY_ATTEMPTS
+
+
+@patch("src.clients.pos_client.httpx.put")
+def test_batch_size_is_kept_between_clients(mock_put, monkeypatch):
+    monkeypatch.setattr(pos_client, "_batch_sizes", {})
+    monkeypatch.setattr(settings, "POS_GATEWAY_BATCH_MIN_ITEMS", 1)
+    categories = [
+        RKeeperCategory(**{"id": pos_id, "name": "test"}).convert_to_pos_updater(index)
+        for index, pos_id in enumerate(("55555", "66666", "77777", "88888"))
+    ]
+    request = httpx.Request("PUT", settings.POS_GATEWAY_URL)
+    mock_put.side_effect = [httpx.Response(413, request=request)] + [httpx.Response(200, request=request)] * 2
+
+    PosGatewayClient("api_key").update_categories(categories)
+    mock_put.reset_mock(side_effect=True)
+    mock_put.return_value = httpx.Response(200, request=request)
+
+    # следующая синхронизация сразу отправляет батчи подобранного размера
+    PosGatewayClient("api_key").update_categories(categories)
+    assert mock_put.call_count == 2
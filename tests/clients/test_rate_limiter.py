@@ -0,0 +1,24 @@
+import pytest
+
+from src.clients.rate_limiter import Priority, RateLimiter, RateLimitExceededError
+from src.config import settings
+from src.services.redis_client import Storage
+
+
+def test_sync_requests_leave_reserve_for_orders(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "RKEEPER_RATE_LIMIT", 0.01)
+    monkeypatch.setattr(settings, "RKEEPER_RATE_LIMIT_BURST", 3)
+    monkeypatch.setattr(settings, "RKEEPER_RATE_LIMIT_ORDER_RESERVE", 1)
+    monkeypatch.setattr(settings, "RKEEPER_RATE_LIMIT_SYNC_MAX_WAIT", 0)
+    monkeypatch.setattr(settings, "RKEEPER_RATE_LIMIT_ORDER_MAX_WAIT", 0)
+    limiter = RateLimiter("client", storage=Storage())
+
+    limiter.acquire(Priority.SYNC)
+    limiter.acquire(Priority.SYNC)
+    with pytest.raises(RateLimitExceededError):
+        limiter.acquire(Priority.SYNC)
+
+    # последний токен достается заказу
+    limiter.acquire(Priority.ORDER)
+    with pytest.raises(RateLimitExceededError):
+        limiter.acquire(Priority.ORDER)
@@ -0,0 +1,57 @@
+from dataclasses import replace
+
+from src.schemas.rkeeper import RKeeperLimitedListItem, RKeeperMenu
+from src.tasks.planner import MenuSnapshot, plan
+
+
+def test_plan_menu(rkeeper_menu):
+    menu = RKeeperMenu(**rkeeper_menu)
+    snapshot = MenuSnapshot(
+        category_pos_ids=frozenset({"55555"}),
+        modifier_specific_external_ids=frozenset(),
+        modifier_offer_pos_ids=frozenset(),
+        modifier_group_hashed_ids=frozenset(),
+        meal_pos_ids=("prodictId", "removedMealId"),
+        meal_offer_pos_ids=frozenset({"removedMealId"}),
+    )
+    limited_list = [
+        RKeeperLimitedListItem(
+            restaurant_id="123", type_of_dish="product", external_id="1111", name="ProductName", quantity=3.0
+        )
+    ]
+
+    sync_plan = plan(menu, snapshot, "123", limited_list)
+
+    assert [category.pos_id for category in sync_plan.categories.updates] == ["55555"]
+    assert not sync_plan.categories.creates
+    assert [modifier.specific_external_id for modifier in sync_plan.modifiers.creates] == ["2222/0/1"]
+    assert [group.hashed_id for group in sync_plan.modifier_groups.creates] == ["cdeacd338b1768160db8a733e7ebb1dd"]
+    assert [meal.pos_id for meal in sync_plan.meals.updates] == ["prodictId"]
+    assert [meal.quantity for meal in sync_plan.meal_offers.creates] == [3.0]
+    assert sync_plan.meal_offers.deactivations == ("removedMealId",)
+    # план не меняет исходное меню и воспроизводим по fingerprint
+    assert menu.meals[0].quantity is None
+    assert plan(menu, snapshot, "123", limited_list).fingerprint == sync_plan.fingerprint
+    assert plan(menu, snapshot, "124", limited_list).fingerprint != sync_plan.fingerprint
+
+
+def test_plan_menu_skips_unchanged_meal_offers(rkeeper_menu):
+    menu = RKeeperMenu(**rkeeper_menu)
+    meal = menu.meals[0]
+    snapshot = MenuSnapshot(
+        category_pos_ids=frozenset(),
+        modifier_specific_external_ids=frozenset(),
+        modifier_offer_pos_ids=frozenset(),
+        modifier_group_hashed_ids=frozenset(),
+        meal_pos_ids=(meal.pos_id, "removedMealId"),
+        meal_offer_pos_ids=frozenset({meal.pos_id, "removedMealId"}),
+        meal_offer_states={meal.pos_id: (meal.price, None, False), "removedMealId": (None, 0, False)},
+    )
+
+    sync_plan = plan(menu, snapshot, "123")
+    assert not sync_plan.meal_offers
+
+    # без сохраненного состояния предложения выгружаются заново
+    sync_plan = plan(menu, replace(snapshot, meal_offer_states={}), "123")
+    assert [meal.pos_id for meal in sync_plan.meal_offers.updates] == [meal.pos_id]
+    assert sync_plan.meal_offers.deactivations == ("removedMealId",)
@@ -1,24 +1,40 @@
+from datetime import datetime, timedelta
 from unittest.mock import patch
 
+import httpx
+import orjson
+import pytest
 from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 from starter_dto.pos import ObjectOutList
 from starter_dto.pos.base import ObjectOut
 from starter_dto.pos.menu import CreateMealOffer
 
-from src.clients.pos_client import PosGatewayClient
+from src.clients.pos_client import PosGatewayClient, PosGatewayClientUnavailableError
+from src.clients.rkeeper_client import RkeeperClient, RkeeperClientError
+from src.clients.rkeeper_replay import SnapshotRkeeperClient
 from src.config import settings
 from src.core.repositories.client import ClientRepository
 from src.core.repositories.menu import MenuRepository
+from src.core.repositories.outbox import OutboxRepository
 from src.core.repositories.schemas.client import MealStarterCreated, MealOfferStarterCreated
-from src.models import Shop, Modifier, ModifierOffer
+from src.core.repositories.snapshot import SnapshotRepository
+from src.models import Shop, Modifier, ModifierOffer, Order, OrderArchive, GatewayOutbox
+from src.services.gateway_outbox import GatewayOutboxDispatcher
+from src.services.order_payment import OrderPaymentSettlement
+from src.services.order_retention import OrderRetention
+from src.services.rkeeper_snapshots import RkeeperSnapshots
 from src.schemas.rkeeper import (
     RKeeperShop,
     RKeeperMenu,
     RKeeperCategory,
     RKeeperLimitedListItem,
+    RKeeperOrderStatus,
 )
-from src.tasks.sync import Sync
+from src.tasks import planner
+from src.tasks.sync import Sync, get_next_status_poll_at, get_status_poll_interval
+from src.utils.enums import PaymentState, SnapshotKind
+from tests.fixtures.db import TestingSessionLocal
 
 
 @patch("src.clients.rkeeper_client.RkeeperClient.get_shops")
@@ -91,16 +107,12 @@ def test_split_by_novelty(db_session, create_client, create_shop, redis_client):
             }
         ),
     ]
-    sync = Sync(db_session, domain_client)
-    new_shops, old_shops = sync._split_by_novelty_by_pos_id(
-        ClientRepository(db_session).get_shops(domain_client.id), new_data
+    shops_plan = planner.split_by_pos_id(
+        new_data, frozenset(shop.pos_id for shop in ClientRepository(db_session).get_shops(domain_client.id))
     )
 
-    for new_shop in new_shops:
-        assert new_shop.pos_id == "66666"
-
-    for old_shop in old_shops:
-        assert old_shop.pos_id == "11111"
+    assert [shop.pos_id for shop in shops_plan.creates] == ["66666"]
+    assert [shop.pos_id for shop in shops_plan.updates] == ["11111"]
 
 
 @patch("src.clients.rkeeper_client.RkeeperClient.get_menu")
@@ -231,6 +243,160 @@ def test_sync_menu(
     assert meal_offers[0].starter_id == 1
 
 
+@patch("src.clients.rkeeper_client.RkeeperClient.get_menu")
+@patch("src.clients.rkeeper_client.RkeeperClient.get_limit_list")
+@patch("src.clients.pos_client.httpx")
+def test_sync_menu_dry_run(mock_httpx, get_limit_list, mock_menu, db_session, create_client, create_shop, rkeeper_menu):
+    domain_client = create_client()
+    pos_shop_id = "123"
+    create_shop(domain_client.id, 1, pos_shop_id)
+    mock_menu.return_value = RKeeperMenu(**rkeeper_menu)
+    get_limit_list.return_value = []
+
+    report = Sync(db_session, domain_client, dry_run=True).menu(pos_shop_id)
+
+    assert not mock_httpx.post.called
+    assert not mock_httpx.put.called
+    # до отката сессии в БД только временные id, выданные вместо gateway
+    meals = MenuRepository(db_session).get_meals_by_client_id(domain_client.id)
+    assert [meal.starter_id < 0 for meal in meals] == [True]
+
+    summary = report.as_dict()
+    assert summary["entities"]["meals"] == {"creates": 1, "updates": 0, "deactivations": 0}
+    assert summary["entities"]["modifiers"]["creates"] == 1
+    assert summary["requests"]["POST shop/1/meals"]["items"] == 1
+    assert summary["requests"]["POST meals"]["bytes"] > 0
+    assert set(summary["stages_ms"]) >= {"fetch", "plan", "meals", "meal_offers"}
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient.get_menu")
+@patch("src.clients.rkeeper_client.RkeeperClient.get_limit_list")
+@patch("src.clients.pos_client.PosGatewayClient.create_categories")
+@patch("src.clients.pos_client.PosGatewayClient.create_meal_offers")
+@patch("src.clients.pos_client.PosGatewayClient.create_meals")
+@patch("src.clients.pos_client.PosGatewayClient.create_modifiers")
+@patch("src.clients.pos_client.PosGatewayClient.create_modifier_offers")
+@patch("src.clients.pos_client.PosGatewayClient.create_modifier_groups")
+def test_sync_menu_resumes_from_failed_phase(
+    mock_modifier_groups,
+    mock_modifier_offers,
+    mock_modifiers,
+    mock_meals,
+    mock_meal_offers,
+    mock_categories,
+    get_limit_list,
+    mock_menu,
+    db_session,
+    create_client,
+    create_shop,
+    redis_client,
+    rkeeper_menu,
+):
+    domain_client = create_client()
+    create_shop(domain_client.id, 1, "123")
+    mock_menu.return_value = RKeeperMenu(**rkeeper_menu)
+    get_limit_list.return_value = []
+    mock_categories.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "55555", "id": 11})], count=0)
+    mock_modifiers.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "2222/0/1", "id": 11111})], count=0)
+    mock_modifier_offers.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "2222", "id": 1001})], count=0)
+    mock_modifier_groups.return_value = ObjectOutList(
+        data=[ObjectOut(**{"posId": "cdeacd338b1768160db8a733e7ebb1dd", "id": 1111})], count=0
+    )
+    mock_meals.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "prodictId", "id": 111})], count=0)
+    mock_meal_offers.side_effect = PosGatewayClientUnavailableError(503)
+
+    with pytest.raises(PosGatewayClientUnavailableError):
+        Sync(db_session, domain_client).menu("123")
+    db_session.rollback()
+
+    # повтор с тем же меню начинает с упавшего этапа, выгруженное раньше уже в БД
+    mock_meal_offers.side_effect = None
+    mock_meal_offers.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "prodictId", "id": 1})], count=0)
+    report = Sync(db_session, domain_client).menu("123")
+
+    assert report.skipped_stages == ["categories", "modifiers", "modifier_offers", "modifier_groups", "meals"]
+    assert mock_meals.call_count == 1
+    assert mock_meal_offers.call_count == 2
+    assert [meal.starter_id for meal in MenuRepository(db_session).get_meals_by_client_id(domain_client.id)] == [111]
+
+    # после успешной синхронизации чекпоинта нет, следующая проходит все этапы
+    assert not Sync(db_session, domain_client).menu("123").skipped_stages
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient.get_menu")
+@patch("src.clients.rkeeper_client.RkeeperClient.get_limit_list")
+@patch("src.clients.pos_client.PosGatewayClient.create_categories")
+@patch("src.clients.pos_client.PosGatewayClient.create_meal_offers")
+@patch("src.clients.pos_client.PosGatewayClient.create_meals")
+@patch("src.clients.pos_client.PosGatewayClient.create_modifiers")
+@patch("src.clients.pos_client.PosGatewayClient.create_modifier_offers")
+@patch("src.clients.pos_client.PosGatewayClient.create_modifier_groups")
+def test_sync_menu_reuses_menu_of_other_shop(
+    mock_modifier_groups,
+    mock_modifier_offers,
+    mock_modifiers,
+    mock_meals,
+    mock_meal_offers,
+    mock_categories,
+    get_limit_list,
+    mock_menu,
+    db_session,
+    create_client,
+    create_shop,
+    redis_client,
+    rkeeper_menu,
+):
+    domain_client = create_client()
+    create_shop(domain_client.id, 1, "123")
+    create_shop(domain_client.id, 2, "124")
+    # одинаковые ответы RkeeperClient отдает одним объектом
+    mock_menu.return_value = RKeeperMenu(**rkeeper_menu)
+    get_limit_list.return_value = []
+    mock_categories.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "55555", "id": 11})], count=0)
+    mock_modifiers.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "2222/0/1", "id": 11111})], count=0)
+    mock_modifier_offers.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "2222", "id": 1001})], count=0)
+    mock_modifier_groups.return_value = ObjectOutList(
+        data=[ObjectOut(**{"posId": "cdeacd338b1768160db8a733e7ebb1dd", "id": 1111})], count=0
+    )
+    mock_meals.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "prodictId", "id": 111})], count=0)
+    mock_meal_offers.return_value = ObjectOutList(data=[ObjectOut(**{"posId": "prodictId", "id": 1})], count=0)
+
+    sync = Sync(db_session, domain_client)
+    with patch("src.tasks.sync.planner.parse_menu", wraps=planner.parse_menu) as parse_menu:
+        assert not sync.menu("123").skipped_stages
+        report = sync.menu("124")
+
+    # второму магазину выгружаются только его предложения
+    assert report.skipped_stages == ["categories", "modifiers", "modifier_groups", "meals"]
+    assert parse_menu.call_count == 1
+    assert mock_meals.call_count == 1
+    assert mock_modifier_offers.call_count == 2
+    assert mock_meal_offers.call_count == 2
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient._fetch")
+def test_parsed_menus_are_bounded(mock_fetch, db_session, create_client, rkeeper_menu, monkeypatch):
+    monkeypatch.setattr(settings, "RKEEPER_MENU_STREAMING", False)
+    monkeypatch.setattr(settings, "RKEEPER_SNAPSHOTS_ENABLED", False)
+    domain_client = create_client()
+    request = httpx.Request("GET", "https://delivery.ucs.ru/orders/api/v1/menu/view")
+    contents = [
+        orjson.dumps({"result": {**rkeeper_menu, "categories": [{"id": "55555", "name": f"category{index}"}]}})
+        for index in range(settings.RKEEPER_MENU_CACHE_SIZE + 1)
+    ]
+    mock_fetch.side_effect = [
+        httpx.Response(200, content=content, request=request) for content in [*contents, contents[-1], contents[0]]
+    ]
+    sync = Sync(db_session, domain_client, rkeeper=RkeeperClient(domain_client))
+
+    parsed_menus = [sync._parse_menu(sync.rkeeper.get_menu("123")) for _ in contents]
+
+    assert len(sync.parsed_menus) == settings.RKEEPER_MENU_CACHE_SIZE
+    # тот же ответ разбирается один раз, самое старое меню уже вытеснено
+    assert sync._parse_menu(sync.rkeeper.get_menu("123")) is parsed_menus[-1]
+    assert sync._parse_menu(sync.rkeeper.get_menu("123")) is not parsed_menus[0]
+
+
 @patch("src.clients.pos_client.PosGatewayClient.create_categories")
 def test_sync_categories(mock_create_categories, db_session, create_client, redis_client):
     menu_repo = MenuRepository(db_session)
@@ -252,9 +418,9 @@ def test_sync_categories(mock_create_categories, db_session, create_client, redi
 
     sync = Sync(db_session, domain_client)
 
-    sync._sync_categories(
+    sync._apply_categories(
+        planner.split_by_pos_id(rkeeper_categories, frozenset(category.pos_id for category in categories)),
         categories,
-        rkeeper_categories,
     )
     db_session.commit()
 
@@ -297,7 +463,314 @@ def test_get_local_meals_missing_on_rkeeper(db_session, create_client, create_sh
     sync = Sync(db_session, domain_client)
 
     db_meals = menu_repo.get_meals_by_client_id(domain_client.id)
-    missing_meals = sync._get_local_meals_missing_on_rkeeper(db_meals, rkeeper_menu.meals, shop.id)
+    snapshot = planner.MenuSnapshot.from_rows((), (), (), (), db_meals, shop.id)
+    sync_plan = planner.plan(rkeeper_menu, snapshot, shop.pos_id)
+    missing_meals = sync._convert_meal_offer_deactivations(sync_plan.meal_offers.deactivations, db_meals, shop.id)
 
     missing_meals_ids = [meal.id for meal in missing_meals]
     assert missing_meals_ids == [1, 2]
+
+
+def test_get_status_poll_interval():
+    now = datetime(2026, 1, 1, 12, 0)
+
+    assert get_status_poll_interval(now - timedelta(seconds=10), now) == 60
+    assert get_status_poll_interval(now - timedelta(minutes=20), now) == 180
+    assert get_status_poll_interval(now - timedelta(minutes=40), now) == settings.ORDER_STATUS_POLL_MAX_INTERVAL
+    assert get_status_poll_interval(None, now) == settings.ORDER_STATUS_POLL_MAX_INTERVAL
+
+
+def test_next_status_poll_is_due_on_next_tick():
+    now = datetime(2026, 1, 1, 12, 0, 5)
+    next_status_poll_at = get_next_status_poll_at(now - timedelta(seconds=10), now)
+
+    # следующий запуск стартовал раньше относительно своего тика, но заказ все равно опрашивается
+    assert next_status_poll_at <= datetime(2026, 1, 1, 12, 1, 1)
+
+
+def test_get_clients_for_status_poll(db_session, create_client):
+    now = datetime(2026, 1, 1, 12, 0)
+    client_with_orders = create_client()
+    client_without_orders = create_client(client_id="client_without_orders", api_key="client_without_orders")
+    client_polled_recently = create_client(client_id="client_polled_recently", api_key="client_polled_recently")
+    client_polled_recently.next_status_poll_at = now + timedelta(minutes=1)
+
+    for domain_client in (client_with_orders, client_polled_recently):
+        db_session.add(Order(client_id=domain_client.id, pos_id="pos", starter_id="starter", bonuses=0, created_at=now))
+    db_session.add(Order(client_id=client_without_orders.id, pos_id="pos", starter_id="starter", bonuses=0, done=True))
+    db_session.commit()
+
+    clients = ClientRepository(db_session).get_clients_for_status_poll(now)
+
+    assert [client.client_id for client in clients] == [client_with_orders.client_id]
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient.token", "token")
+@patch("src.clients.rkeeper_client.RkeeperClient.order_payment")
+def test_settle_order_payments(mock_order_payment, db_session, create_client):
+    now = datetime(2026, 1, 1, 12, 0)
+    domain_client = create_client()
+    for pos_id in ("paid_pos_id", "error_pos_id"):
+        db_session.add(
+            Order(
+                client_id=domain_client.id,
+                pos_id=pos_id,
+                starter_id=pos_id,
+                bonuses=0,
+                is_paid=True,
+                payment_state=PaymentState.PENDING,
+                payment_next_attempt_at=now,
+            )
+        )
+    db_session.commit()
+    mock_order_payment.side_effect = lambda pos_id: {"errors": []} if pos_id == "error_pos_id" else {"result": {}}
+
+    assert OrderPaymentSettlement(db_session, domain_client).settle(now) == 1
+    # повторный запуск не отправляет оплату, пока не подошло время повтора
+    assert OrderPaymentSettlement(db_session, domain_client).settle(now) == 0
+
+    orders = {order.pos_id: order for order in db_session.scalars(select(Order))}
+    assert orders["paid_pos_id"].payment_state == PaymentState.ACCEPTED
+    assert orders["paid_pos_id"].payment_sent_at == now
+    assert orders["error_pos_id"].payment_state == PaymentState.PENDING
+    assert orders["error_pos_id"].payment_attempts == 1
+    assert orders["error_pos_id"].payment_next_attempt_at == now + timedelta(seconds=settings.ORDER_PAYMENT_RETRY_DELAY)
+    assert mock_order_payment.call_count == 2
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient.token", "token")
+@patch("src.clients.rkeeper_client.RkeeperClient.order_payment")
+@patch("src.clients.rkeeper_client.RkeeperClient.get_status_of_orders")
+def test_recover_stale_sent_payments(mock_get_status_of_orders, mock_order_payment, db_session, create_client):
+    now = datetime(2026, 1, 1, 12, 0)
+    stale_sent_at = now - timedelta(seconds=settings.ORDER_PAYMENT_SENT_TIMEOUT + 1)
+    domain_client = create_client()
+    for pos_id, payment_state, sent_at in (
+        ("paid_pos_id", PaymentState.SENT, stale_sent_at),
+        ("not_paid_pos_id", PaymentState.SENT, stale_sent_at),
+        ("unknown_pos_id", PaymentState.SENT, stale_sent_at),
+        ("accepted_pos_id", PaymentState.ACCEPTED, stale_sent_at),
+        ("fresh_pos_id", PaymentState.SENT, now),
+    ):
+        db_session.add(
+            Order(
+                client_id=domain_client.id,
+                pos_id=pos_id,
+                starter_id=pos_id,
+                bonuses=0,
+                is_paid=True,
+                payment_state=payment_state,
+                payment_attempts=1,
+                payment_sent_at=sent_at,
+            )
+        )
+    db_session.commit()
+    mock_get_status_of_orders.return_value = [
+        RKeeperOrderStatus(
+            **{
+                "orderId": pos_id,
+                "orderStatusId": 13,
+                "paymentTypeId": "online",
+                "paymentStatus": payment_status,
+                "fullAmount": 100,
+                "amount": 100,
+            }
+        )
+        for pos_id, payment_status in (("paid_pos_id", "paid"), ("not_paid_pos_id", "notPaid"))
+    ]
+
+    assert OrderPaymentSettlement(db_session, domain_client).recover(now) == 3
+
+    orders = {order.pos_id: order for order in db_session.scalars(select(Order))}
+    assert orders["paid_pos_id"].payment_state == PaymentState.CONFIRMED
+    assert orders["not_paid_pos_id"].payment_state == PaymentState.PENDING
+    # оплачен ли заказ, неизвестно: повторная оплата могла бы списать деньги дважды
+    assert orders["unknown_pos_id"].payment_state == PaymentState.FAILED
+    assert orders["accepted_pos_id"].payment_state == PaymentState.ACCEPTED
+    assert orders["fresh_pos_id"].payment_state == PaymentState.SENT
+    mock_order_payment.assert_not_called()
+
+
+def test_order_retention(db_session, create_client):
+    now = datetime(2026, 1, 1, 12, 0)
+    domain_client = create_client()
+    stale = now - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS + 1)
+    for pos_id, done, created_at in (
+        ("fresh_pos_id", False, now - timedelta(hours=settings.ORDER_EXPIRE_AFTER_HOURS - 1)),
+        ("stale_pos_id", False, now - timedelta(hours=settings.ORDER_EXPIRE_AFTER_HOURS + 1)),
+        ("other_stale_pos_id", False, now - timedelta(hours=settings.ORDER_EXPIRE_AFTER_HOURS + 2)),
+        ("done_pos_id", True, stale),
+        ("fresh_done_pos_id", True, now),
+    ):
+        db_session.add(
+            Order(
+                client_id=domain_client.id,
+                pos_id=pos_id,
+                starter_id=pos_id,
+                bonuses=0,
+                done=done,
+                created_at=created_at,
+            )
+        )
+    # без created_at заказ получает текущее время и не считается старым
+    db_session.add(Order(client_id=domain_client.id, pos_id="no_created_at_pos_id", starter_id="0", bonuses=0))
+    db_session.commit()
+
+    retention = OrderRetention(db_session)
+    # заказы закрываются батчами, каждый батч в своей транзакции
+    assert retention.expire(now, batch_size=1) == 2
+    assert retention.archive(now) == 1
+
+    orders = {order.pos_id: order for order in db_session.scalars(select(Order))}
+    assert set(orders) == {
+        "fresh_pos_id",
+        "stale_pos_id",
+        "other_stale_pos_id",
+        "fresh_done_pos_id",
+        "no_created_at_pos_id",
+    }
+    assert orders["stale_pos_id"].is_expired is True
+    assert orders["other_stale_pos_id"].is_expired is True
+    assert orders["fresh_pos_id"].done is False
+    assert orders["no_created_at_pos_id"].done is False
+    assert [order.pos_id for order in db_session.scalars(select(OrderArchive))] == ["done_pos_id"]
+
+
+def test_archive_done_orders_is_atomic(db_session, create_client):
+    now = datetime(2026, 1, 1, 12, 0)
+    domain_client = create_client()
+    db_session.add(
+        Order(
+            client_id=domain_client.id,
+            pos_id="done_pos_id",
+            starter_id="1",
+            bonuses=0,
+            done=True,
+            created_at=now - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS + 1),
+        )
+    )
+    db_session.commit()
+
+    execute = db_session.execute
+
+    def fail_on_delete(statement, *args, **kwargs):
+        if statement.is_delete:
+            raise RuntimeError("delete failed")
+        return execute(statement, *args, **kwargs)
+
+    with patch.object(db_session, "execute", side_effect=fail_on_delete), pytest.raises(RuntimeError):
+        OrderRetention(db_session).archive(now)
+    # копирование и удаление в одной транзакции: откат упавшего батча убирает и копию в order_archive
+    db_session.rollback()
+
+    assert db_session.scalars(select(OrderArchive)).all() == []
+    assert [order.pos_id for order in db_session.scalars(select(Order))] == ["done_pos_id"]
+
+
+@patch("src.clients.pos_client.PosGatewayClient.put_items")
+def test_dispatch_gateway_outbox(mock_put_items, db_session, create_client, redis_client):
+    domain_client = create_client()
+    outbox_repo = OutboxRepository(db_session)
+    for url, payload in (("shop/1/meals", b'[{"id":1}]'), ("shop/1/meals", b'[{"id":2}]'), ("categories", b"[]")):
+        outbox_repo.add(domain_client.id, url, payload, 1)
+    db_session.commit()
+
+    def put_items(url, items):
+        if items == [{"id": 1}]:
+            raise PosGatewayClientUnavailableError(503)
+
+    mock_put_items.side_effect = put_items
+    assert GatewayOutboxDispatcher(db_session, domain_client).dispatch() == 1
+
+    # более новая запись того же адреса ждет повтора старой
+    entries = db_session.scalars(select(GatewayOutbox).order_by(GatewayOutbox.id)).all()
+    assert [(entry.url, entry.attempts) for entry in entries] == [("shop/1/meals", 1), ("shop/1/meals", 0)]
+    assert GatewayOutboxDispatcher(db_session, domain_client).dispatch() == 0
+
+    mock_put_items.reset_mock(side_effect=True)
+    entries[0].next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    assert GatewayOutboxDispatcher(db_session, domain_client).dispatch() == 2
+    assert [call.args for call in mock_put_items.call_args_list] == [
+        ("shop/1/meals", [{"id": 1}]),
+        ("shop/1/meals", [{"id": 2}]),
+    ]
+    assert not db_session.scalars(select(GatewayOutbox)).all()
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient.get_limit_list")
+def test_sync_stock_sends_only_changed_offers(
+    get_limit_list, db_session, create_client, create_shop, create_meal, redis_client
+):
+    domain_client = create_client()
+    shop = create_shop(domain_client.id, 1, "123")
+    limited_meal = create_meal(client_id=domain_client.id, starter_id=1, pos_id="meal-1", external_id="1111")
+    stop_list_meal = create_meal(client_id=domain_client.id, starter_id=2, pos_id="meal-2", external_id="2222")
+    not_in_menu_meal = create_meal(client_id=domain_client.id, starter_id=3, pos_id="meal-3", external_id="3333")
+    MenuRepository(db_session).create_meal_offers(
+        [
+            MealOfferStarterCreated(id=11, posId="meal-1", meal_id=limited_meal.id, price=100),
+            MealOfferStarterCreated(id=12, posId="meal-2", meal_id=stop_list_meal.id, price=200, in_stop_list=True),
+            MealOfferStarterCreated(id=13, posId="meal-3", meal_id=not_in_menu_meal.id),
+        ],
+        shop.id,
+    )
+    db_session.commit()
+    get_limit_list.return_value = [
+        RKeeperLimitedListItem(
+            restaurant_id="123", type_of_dish="product", external_id=external_id, name="name", quantity=3.0
+        )
+        for external_id in ("1111", "2222", "3333")
+    ]
+
+    report = Sync(db_session, domain_client).stock("123")
+
+    assert report.entities["meal_offers"].updates == ("meal-1", "meal-2")
+    entries = db_session.scalars(select(GatewayOutbox)).all()
+    assert [(entry.url, entry.items) for entry in entries] == [(f"shop/{shop.starter_id}/meals", 2)]
+
+    # остатки не изменились, в gateway ничего не уходит
+    report = Sync(db_session, domain_client).stock("123")
+    assert not report.entities["meal_offers"]
+    assert len(db_session.scalars(select(GatewayOutbox)).all()) == 1
+
+
+@patch("src.clients.rkeeper_client.RkeeperClient._fetch")
+def test_sync_stock_skips_push_when_limit_list_fails(
+    mock_fetch, db_session, create_client, create_shop, create_meal, redis_client
+):
+    domain_client = create_client()
+    shop = create_shop(domain_client.id, 1, "123")
+    limited_meal = create_meal(client_id=domain_client.id, starter_id=1, pos_id="meal-1", external_id="1111")
+    MenuRepository(db_session).create_meal_offers(
+        [MealOfferStarterCreated(id=11, posId="meal-1", meal_id=limited_meal.id, price=100, quantity=3.0)], shop.id
+    )
+    db_session.commit()
+    mock_fetch.side_effect = httpx.ConnectError("connection refused")
+
+    with pytest.raises(RkeeperClientError):
+        Sync(db_session, domain_client).stock("123")
+
+    assert not db_session.scalars(select(GatewayOutbox)).all()
+
+
+def test_replay_menu_snapshot(db_session, create_client, create_shop, redis_client, rkeeper_menu):
+    domain_client = create_client()
+    create_shop(domain_client.id, 1, "123")
+    snapshots = RkeeperSnapshots(domain_client.id, lambda: TestingSessionLocal(bind=db_session.connection()))
+    content = orjson.dumps({"result": rkeeper_menu})
+
+    # одинаковый с предыдущим ответ второй раз не сохраняется
+    snapshots.record(SnapshotKind.MENU, "123", content)
+    snapshots.record(SnapshotKind.MENU, "123", content)
+    stored = SnapshotRepository(db_session).get_list(domain_client.id)
+    assert [(snapshot.kind, snapshot.shop_pos_id, snapshot.size) for snapshot in stored] == [
+        (SnapshotKind.MENU, "123", len(content))
+    ]
+
+    rkeeper = SnapshotRkeeperClient(domain_client, {"123": stored[0]})
+    report = Sync(db_session, domain_client, dry_run=True, rkeeper=rkeeper).menu("123")
+
+    summary = report.as_dict()
+    assert summary["entities"]["meals"]["creates"] == 1
+    assert summary["requests"]["POST meals"]["items"] == 1